@@ -0,0 +1,181 @@
+"""Проверка ТТ всех чертежей в папке (архиве), без открытия их пользователем.
+
+Папка обходится рекурсивно через os.scandir. Каждый чертеж открывается в
+отдельном невидимом экземпляре KOMPAS только для чтения, его ТТ читаются
+одним проходом, и документ сразу закрывается. Прочитанные строки через
+ограниченную очередь уходят в поток проверки, поэтому в памяти одновременно
+находится лишь несколько чертежей, а в отчет попадает только итог по файлу.
+
+С индексом ТТ (kompas_index) чертежи, не менявшиеся с прошлой проверки, не
+открываются: строки и замечания берутся из индекса, а KOMPAS запускается,
+только если есть что читать.
+"""
+
+import logging
+import os
+import queue
+import threading
+from collections import namedtuple
+
+from kompas_batch import BATCH_FAILED, BATCH_ISSUES, BATCH_OK
+from kompas_checks import check_tt_text
+from kompas_session import DRAWING_TYPE, KompasSession
+from kompas_tt import format_tt_lines, read_tt_lines
+from kompas_worker import JobCancelled
+
+logger = logging.getLogger("kompas")
+
+DRAWING_EXTENSIONS = (".cdw",)
+# Сколько прочитанных чертежей может ждать проверки
+AUDIT_QUEUE_SIZE = 16
+
+AUDIT_OK = "ok"
+AUDIT_ISSUES = "issues"
+AUDIT_NO_TT = "no_tt"
+AUDIT_ERROR = "error"
+
+AUDIT_STATUS_NAMES = {
+    AUDIT_OK: "Корректно",
+    AUDIT_ISSUES: "Есть замечания",
+    AUDIT_NO_TT: "Нет ТТ",
+    AUDIT_ERROR: "Ошибка открытия",
+}
+# Статус строки отчета -> статус результата пакетной операции
+AUDIT_BATCH_STATUS = {
+    AUDIT_OK: BATCH_OK,
+    AUDIT_ISSUES: BATCH_ISSUES,
+    AUDIT_NO_TT: BATCH_ISSUES,
+    AUDIT_ERROR: BATCH_FAILED,
+}
+
+AuditRow = namedtuple("AuditRow", ["path", "status", "issues"])
+AuditResult = namedtuple(
+    "AuditResult", ["folder", "rows", "cancelled", "cached"], defaults=(0,)
+)
+
+
+def iter_drawing_files(folder, extensions=DRAWING_EXTENSIONS):
+    """Пути чертежей в папке и подпапках (недоступные папки пропускаются)"""
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                subfolders = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+                        elif entry.name.lower().endswith(extensions):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.debug("Папка пропущена: %s (%s)", current, e)
+            continue
+        stack.extend(reversed(sorted(subfolders)))
+
+
+def read_drawing_tt(session, path):
+    """Строки ТТ чертежа, открытого невидимо и только для чтения"""
+    doc = session.open_document(path, visible=False, read_only=True)
+    if not doc:
+        raise RuntimeError("KOMPAS не открыл документ")
+    try:
+        tech_demand = session.technical_demand(doc)
+        if not tech_demand.IsCreated:
+            return []
+        return read_tt_lines(tech_demand.Text)[0]
+    finally:
+        doc.Close(0)
+
+
+def audit_row(path, lines, error, classifier, issues=None):
+    """Итог проверки одного файла; issues - готовые замечания из индекса"""
+    if error is not None:
+        return AuditRow(path, AUDIT_ERROR, [error])
+    formatted_text = format_tt_lines(lines)
+    if not formatted_text:
+        return AuditRow(path, AUDIT_NO_TT, ["Технические требования отсутствуют"])
+    if issues is None:
+        issues = check_tt_text(formatted_text, classifier)
+    return AuditRow(path, AUDIT_ISSUES if issues else AUDIT_OK, issues)
+
+
+def audit_folder_job(ctx, folder, classifier, index=None):
+    """Задание ComWorker: проверка ТТ всех чертежей папки; AuditResult.
+
+    index - TTIndex: неизменившиеся чертежи берутся из него, прочитанные
+    заново и их замечания в него записываются.
+    """
+    backend = ctx.session.backend.for_process()
+    session = KompasSession(backend, ctx.session.counter)
+    pipeline = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+    rows = []
+
+    def check_worker():
+        while True:
+            item = pipeline.get()
+            if item is None:
+                if index is not None:
+                    index.close()
+                return
+            path, lines, error, entry = item
+            try:
+                if entry is not None:
+                    row = audit_row(
+                        path,
+                        lines,
+                        None,
+                        None,
+                        index.issues(entry, classifier),
+                    )
+                else:
+                    row = audit_row(path, lines, error, classifier)
+                    if index is not None and error is None:
+                        index.store_issues(path, row.issues, classifier)
+            except Exception as e:
+                row = AuditRow(path, AUDIT_ERROR, [str(e)])
+            rows.append(row)
+            ctx.report(path, AUDIT_BATCH_STATUS[row.status], "; ".join(row.issues))
+
+    checker = threading.Thread(target=check_worker, name="tt-audit", daemon=True)
+    checker.start()
+    cancelled = False
+    launched = False
+    cached = 0
+    try:
+        for i, path in enumerate(iter_drawing_files(folder)):
+            ctx.checkpoint()
+            ctx.progress(0, 0, f"Проверка ТТ ({i + 1}): {os.path.basename(path)}")
+            entry = index.lookup(path) if index is not None else None
+            if entry is not None:
+                cached += 1
+                pipeline.put((path, entry.lines, None, entry))
+                continue
+            if not launched:
+                ctx.progress(0, 0, "Запуск KOMPAS для проверки папки...")
+                session.launch_instance()
+                launched = True
+            try:
+                signature = index.signature(path) if index is not None else None
+                lines, error = read_drawing_tt(session, path), None
+                if signature is not None:
+                    index.store(path, signature, DRAWING_TYPE, lines)
+            except Exception as e:
+                lines, error = None, str(e)
+            # Очередь ограничена: чтение ждет, если проверка отстает
+            pipeline.put((path, lines, error, None))
+    except JobCancelled:
+        cancelled = True
+    finally:
+        pipeline.put(None)
+        checker.join()
+        if launched:
+            try:
+                session.quit_instance()
+            except Exception as e:
+                logger.debug("Не удалось закрыть экземпляр KOMPAS: %s", e)
+        if index is not None:
+            index.close()
+    return AuditResult(folder, rows, cancelled, cached)
@@ -0,0 +1,326 @@
+"""Общая рамка пакетных операций: ход, отмена и результаты.
+
+Пакетная команда окна запускается как задание ComWorker с BatchRun. Задание
+сообщает прогресс (ctx.progress) и результат по каждому документу
+(ctx.report); отмена срабатывает между документами (ctx.checkpoint).
+
+BatchRun копит результаты и сразу дописывает каждый в журнал (CSV в папке
+приложения), поэтому собранное сохраняется при отмене, при ошибке задания и
+даже при падении приложения. Панель BatchDock показывает ход операции:
+сделано/всего, текущий документ, оставшееся время и скорость, таблицу
+результатов; результаты можно выгрузить в CSV.
+"""
+
+import csv
+import os
+import threading
+import time
+from collections import namedtuple
+
+from PyQt6.QtCore import QTimer, pyqtSignal
+from PyQt6.QtWidgets import (
+    QDockWidget,
+    QFileDialog,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QMessageBox,
+    QProgressBar,
+    QPushButton,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+BATCH_OK = "ok"
+BATCH_ISSUES = "issues"
+BATCH_SKIPPED = "skipped"
+BATCH_FAILED = "failed"
+
+BATCH_STATUS_NAMES = {
+    BATCH_OK: "Готово",
+    BATCH_ISSUES: "Замечания",
+    BATCH_SKIPPED: "Пропущен",
+    BATCH_FAILED: "Ошибка",
+}
+
+# Обновление панели во время операции, мс
+DOCK_REFRESH_INTERVAL = 500
+# CSV с ";" и BOM открывается в Excel с русскими настройками без мастера
+CSV_DELIMITER = ";"
+CSV_ENCODING = "utf-8-sig"
+CSV_HEADER = ["Документ", "Статус", "Подробности", "Время, с"]
+
+BatchItem = namedtuple("BatchItem", ["name", "status", "detail", "elapsed"])
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} с"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} мин {seconds:02d} с"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes:02d} мин"
+
+
+def csv_row(item):
+    return [
+        item.name,
+        BATCH_STATUS_NAMES.get(item.status, item.status),
+        item.detail,
+        f"{item.elapsed:.1f}",
+    ]
+
+
+class BatchRun:
+    """Ход и результаты одной пакетной операции.
+
+    record() вызывается из потока задания, остальное - из потока окна.
+    journal_path - журнал результатов, переписывается в начале операции.
+    """
+
+    def __init__(self, title, journal_path=None):
+        self.title = title
+        self.journal_path = journal_path
+        self.items = []
+        self.done = 0
+        self.total = 0
+        self.current = ""
+        self.started = time.monotonic()
+        self.finished = None
+        self.cancelled = False
+        self.error = None
+        self._lock = threading.Lock()
+        if journal_path:
+            self._write_rows(journal_path, [], "w")
+
+    def _write_rows(self, path, items, mode):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, mode, encoding=CSV_ENCODING, newline="") as f:
+            writer = csv.writer(f, delimiter=CSV_DELIMITER)
+            if mode == "w":
+                writer.writerow(CSV_HEADER)
+            writer.writerows(csv_row(item) for item in items)
+
+    def record(self, name, status, detail=""):
+        """Результат по документу (из потока задания)"""
+        item = BatchItem(name, status, detail, time.monotonic() - self.started)
+        with self._lock:
+            self.items.append(item)
+            if self.journal_path:
+                try:
+                    # Журнал открывается на каждую запись: при падении
+                    # приложения в нем остается все, что успели собрать
+                    with open(
+                        self.journal_path, "a", encoding="utf-8", newline=""
+                    ) as f:
+                        csv.writer(f, delimiter=CSV_DELIMITER).writerow(csv_row(item))
+                except OSError:
+                    self.journal_path = None
+
+    def progress(self, done, total, current=""):
+        self.done = done
+        self.total = total
+        if current:
+            self.current = current
+
+    def finish(self, cancelled=False, error=None):
+        self.finished = time.monotonic()
+        self.cancelled = self.cancelled or cancelled
+        self.error = error
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def snapshot(self, start=0):
+        """Результаты, начиная с start (копия - поток задания дописывает)"""
+        with self._lock:
+            return self.items[start:]
+
+    def counts(self):
+        """{статус: число документов}"""
+        counts = {}
+        for item in self.snapshot():
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return counts
+
+    def rate(self):
+        """Документов в минуту"""
+        processed = max(self.done, len(self.items))
+        elapsed = self.elapsed
+        return processed * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Оставшееся время в секундах; None - оценить нельзя"""
+        if not self.running or not self.total or not self.done:
+            return None
+        return self.elapsed / self.done * max(0, self.total - self.done)
+
+    def export(self, path):
+        """Выгрузка собранных результатов в CSV"""
+        self._write_rows(path, self.snapshot(), "w")
+
+    def summary(self):
+        counts = self.counts()
+        parts = [f"документов: {sum(counts.values())}"]
+        parts += [
+            f"{BATCH_STATUS_NAMES[status].lower()}: {counts[status]}"
+            for status in (BATCH_ISSUES, BATCH_SKIPPED, BATCH_FAILED)
+            if counts.get(status)
+        ]
+        if self.error is not None:
+            state = f"Ошибка: {self.error}"
+        elif self.cancelled:
+            state = "Прервано"
+        elif self.running:
+            state = "Выполняется"
+        else:
+            state = "Завершено"
+        return f"{state} за {format_duration(self.elapsed)}; " + ", ".join(parts)
+
+
+class BatchDock(QDockWidget):
+    """Панель пакетной операции: ход, отмена и таблица результатов"""
+
+    cancel_requested = pyqtSignal()
+
+    COLUMNS = ["Документ", "Статус", "Подробности"]
+
+    def __init__(self, parent=None):
+        super().__init__("Пакетная операция", parent)
+        self.setObjectName("batch_dock")
+        self.run = None
+        self.shown_items = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(DOCK_REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        self.title_label = QLabel()
+        self.title_label.setStyleSheet("font-weight: bold;")
+        layout.addWidget(self.title_label)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v / %m")
+        layout.addWidget(self.progress_bar)
+
+        self.current_label = QLabel()
+        layout.addWidget(self.current_label)
+        self.stats_label = QLabel()
+        layout.addWidget(self.stats_label)
+
+        self.results_tree = QTreeWidget()
+        self.results_tree.setHeaderLabels(self.COLUMNS)
+        self.results_tree.setRootIsDecorated(False)
+        self.results_tree.setUniformRowHeights(True)
+        header = self.results_tree.header()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
+        header.setStretchLastSection(True)
+        layout.addWidget(self.results_tree)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        self.export_button = QPushButton("Экспорт результатов...")
+        self.export_button.clicked.connect(self.export_results)
+        buttons.addWidget(self.export_button)
+        self.cancel_button = QPushButton("Отменить")
+        self.cancel_button.clicked.connect(self.request_cancel)
+        buttons.addWidget(self.cancel_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(widget)
+
+    def start(self, run):
+        self.run = run
+        self.shown_items = 0
+        self.results_tree.clear()
+        self.title_label.setText(run.title)
+        self.progress_bar.setRange(0, 0)
+        self.current_label.clear()
+        self.cancel_button.setEnabled(True)
+        self.cancel_button.setVisible(True)
+        self.export_button.setEnabled(False)
+        self.refresh()
+        self.timer.start()
+        self.show()
+        self.raise_()
+
+    def request_cancel(self):
+        self.cancel_button.setEnabled(False)
+        self.cancel_requested.emit()
+
+    def refresh(self):
+        run = self.run
+        if run is None:
+            return
+        if run.total:
+            self.progress_bar.setRange(0, run.total)
+            self.progress_bar.setValue(min(run.done, run.total))
+        if run.running:
+            self.current_label.setText(run.current)
+            stats = [f"Прошло {format_duration(run.elapsed)}"]
+            eta = run.eta()
+            if eta is not None:
+                stats.append(f"осталось ~{format_duration(eta)}")
+            stats.append(f"{run.rate():.0f} документов/мин")
+            self.stats_label.setText(", ".join(stats))
+        else:
+            self.stats_label.setText(run.summary())
+
+        new_items = run.snapshot(self.shown_items)
+        self.shown_items += len(new_items)
+        rows = []
+        for item in new_items:
+            row = QTreeWidgetItem(
+                [
+                    item.name,
+                    BATCH_STATUS_NAMES.get(item.status, item.status),
+                    item.detail,
+                ]
+            )
+            row.setToolTip(2, item.detail)
+            rows.append(row)
+        if rows:
+            self.results_tree.addTopLevelItems(rows)
+            self.export_button.setEnabled(True)
+
+    def finish(self):
+        """Операция закончилась (в том числе отменой или ошибкой)"""
+        self.timer.stop()
+        if self.run is None:
+            return
+        if not self.run.cancelled and self.run.error is None and self.run.total:
+            self.progress_bar.setValue(self.run.total)
+        elif not self.run.total:
+            self.progress_bar.setRange(0, 1)
+            self.progress_bar.setValue(1)
+        self.current_label.clear()
+        self.cancel_button.setVisible(False)
+        self.refresh()
+
+    def export_results(self):
+        if self.run is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт результатов", "Результаты.csv", "CSV (*.csv)"
+        )
+        if not path:
+            return
+        try:
+            self.run.export(path)
+        except OSError as e:
+            QMessageBox.critical(
+                self, "Ошибка", f"Не удалось сохранить результаты: {str(e)}"
+            )
@@ -0,0 +1,278 @@
+"""Буферы ТТ открытых чертежей.
+
+Для каждого чертежа (ключ - путь файла, у несохраненного - имя) хранятся
+прочитанные ТТ, несохраненный текст редактора, позиция курсора и признак
+правки. Переключение на чертеж со свежим буфером не обращается к KOMPAS за
+ТТ; правки, не примененные к чертежу, переживают переключение.
+
+Буфер привязан к отметке документа: признаку изменения в KOMPAS (Changed) и
+времени сохранения файла. Если отметка другая, прочитанные ТТ устарели и
+читаются заново, а несохраненный текст редактора остается. Отметка
+подтверждает ТТ только у документа без несохраненных изменений: у измененного
+документа правка ТТ в KOMPAS отметку не меняет, поэтому его ТТ читаются при
+каждом показе.
+"""
+
+import os
+from collections import namedtuple
+
+from kompas_session import DRAWING_TYPE
+from kompas_tt import (
+    format_tt_lines,
+    formatted_tt_hash,
+    read_tt_lines,
+    tt_hash,
+    write_tt_lines,
+)
+
+TT_NO_DOCUMENT = "no_document"
+TT_CREATED = "created"
+TT_MISSING = "missing"
+TT_EMPTY = "empty"
+TT_LOADED = "loaded"
+
+# ТТ документа: name - имя, key - ключ буфера, stamp - document_stamp(),
+# state - TT_*, text - ТТ в виде текста редактора
+DocumentTT = namedtuple("DocumentTT", ["name", "key", "stamp", "state", "text"])
+# Итог write_document_tt: edits - правок строк (0 - запись не понадобилась),
+# conflict - ТТ в чертеже изменены после загрузки (ничего не записано)
+TTWrite = namedtuple("TTWrite", ["edits", "conflict"])
+
+
+def buffer_key(name, path_name):
+    """Ключ буфера: нормализованный путь файла, у несохраненного - имя"""
+    if path_name:
+        return os.path.normcase(os.path.abspath(path_name))
+    return name
+
+
+def document_stamp(doc):
+    """(изменен ли документ в KOMPAS, время изменения файла) - для сверки"""
+    path_name = doc.PathName
+    try:
+        mtime_ns = os.stat(path_name).st_mtime_ns if path_name else None
+    except OSError:
+        mtime_ns = None
+    return bool(doc.Changed), mtime_ns
+
+
+def stamp_verifies(stamp, current):
+    """Отметка буфера stamp подтверждает, что ТТ документа не менялись.
+
+    Changed сбрасывается только сохранением, поэтому любая правка в KOMPAS
+    меняет отметку несохраненного документа (Changed=False). У документа с
+    Changed=True правка ТТ отметку не меняет - такой отметке верить нельзя.
+    """
+    return stamp is not None and stamp == current and not current[0]
+
+
+def read_document_tt(session, doc, create=False):
+    """DocumentTT документа; create - создать пустые ТТ, если их нет"""
+    name = doc.Name
+    key = buffer_key(name, doc.PathName)
+    stamp = document_stamp(doc)
+    tech_demand = session.technical_demand(doc)
+    if not tech_demand.IsCreated:
+        if not create:
+            return DocumentTT(name, key, stamp, TT_MISSING, "")
+        # Создание новых пустых технических требований
+        stroka = tech_demand.Text.Add().Add()
+        stroka.Str = "  "
+        return DocumentTT(name, key, stamp, TT_CREATED, "")
+    lines = read_tt_lines(tech_demand.Text)[0]
+    if not lines:
+        return DocumentTT(name, key, stamp, TT_EMPTY, "")
+    return DocumentTT(name, key, stamp, TT_LOADED, format_tt_lines(lines))
+
+
+def update_technical_demand(tech_demand, drawing_document, document):
+    """Обновление ТТ и чертежа после записи строк"""
+    if hasattr(tech_demand, "Update"):
+        tech_demand.Update()
+    if hasattr(drawing_document, "Update"):
+        drawing_document.Update()
+    elif hasattr(document, "Update"):
+        document.Update()
+
+
+def write_document_tt(session, doc, lines, loaded_hash=None, force=False):
+    """Запись строк ТТ в чертеж, только если содержание другое; TTWrite.
+
+    ТТ чертежа читаются один раз: по ним сверяется хеш и строится разница
+    для записи. Если содержание совпадает (tt_hash), ни запись, ни
+    обновление чертежа не выполняются. loaded_hash - хеш ТТ, которые правил
+    пользователь: если в чертеже с тех пор другие ТТ, без force ничего не
+    записывается.
+    """
+    drawing_document = session.drawing_document(doc)
+    tech_demand = drawing_document.TechnicalDemand
+    created = tech_demand.IsCreated
+    current = read_tt_lines(tech_demand.Text) if created else ([], [])
+    current_hash = tt_hash(current[0])
+    new_hash = tt_hash(lines)
+    if current_hash == new_hash:
+        return TTWrite(0, False)
+    if loaded_hash is not None and current_hash != loaded_hash and not force:
+        return TTWrite(0, True)
+    if not created:
+        if not lines:
+            return TTWrite(0, False)
+        # Создание новых пустых технических требований
+        stroka = tech_demand.Text.Add().Add()
+        stroka.Str = "  "
+        current = None
+    edits = write_tt_lines(tech_demand.Text, lines, current)
+    if edits:
+        update_technical_demand(tech_demand, drawing_document, doc)
+    return TTWrite(edits, False)
+
+
+def prefetch_tt_job(ctx, stamps, index=None):
+    """Задание ComWorker: ТТ открытых чертежей для буферов; [DocumentTT].
+
+    stamps - {ключ: отметка} уже прочитанных буферов: такие чертежи
+    пропускаются. index - TTIndex: у сохраненных и не измененных в KOMPAS
+    чертежей ТТ берутся из него, если файл не менялся. Между чертежами
+    выполняются более срочные задания.
+    """
+    results = []
+    try:
+        for doc in ctx.session.documents():
+            ctx.checkpoint()
+            try:
+                if doc.DocumentType != DRAWING_TYPE:
+                    continue
+                name = doc.Name
+                key = buffer_key(name, doc.PathName)
+                stamp = document_stamp(doc)
+                changed, mtime_ns = stamp
+                # Буфер измененного документа не подтверждается отметкой -
+                # его ТТ все равно читаются при показе
+                if changed or stamp_verifies(stamps.get(key), stamp):
+                    continue
+                entry = (
+                    index.lookup(key)
+                    if index is not None and mtime_ns is not None
+                    else None
+                )
+                if entry is not None:
+                    text = format_tt_lines(entry.lines)
+                    state = TT_LOADED if text else TT_EMPTY
+                    results.append(DocumentTT(name, key, stamp, state, text))
+                else:
+                    results.append(read_document_tt(ctx.session, doc))
+            except Exception:
+                # Документ закрыли во время чтения - буфер прочитается позже
+                continue
+    finally:
+        if index is not None:
+            index.close()
+    return results
+
+
+class TTBuffer:
+    __slots__ = ("key", "stamp", "state", "text", "tt_hash", "edited_text", "cursor")
+
+    def __init__(self, key):
+        self.key = key
+        self.stamp = None  # None - ТТ не прочитаны или устарели
+        self.state = None
+        self.text = ""
+        # tt_hash() ТТ, прочитанных из чертежа или записанных в него; при
+        # несохраненных правках - тех ТТ, которые правил пользователь
+        self.tt_hash = None
+        self.edited_text = None  # текст редактора, не примененный к чертежу
+        self.cursor = 0
+
+    @property
+    def dirty(self):
+        return self.edited_text is not None
+
+    @property
+    def display_text(self):
+        return self.edited_text if self.dirty else self.text
+
+
+class TTBufferCache:
+    """Буферы ТТ по ключу документа"""
+
+    def __init__(self):
+        self.buffers = {}
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def get(self, key):
+        return self.buffers.get(key)
+
+    def lookup(self, key, stamp):
+        """Буфер, который можно показать без чтения ТТ, иначе None.
+
+        Устаревший буфер с несохраненными правками возвращается: правки
+        важнее, а ТТ в нем нужно перечитать (stamp у буфера - None).
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return None
+        if not stamp_verifies(buffer.stamp, stamp):
+            buffer.stamp = None
+            if not buffer.dirty:
+                return None
+        return buffer
+
+    def stamps(self):
+        """{ключ: отметка} прочитанных буферов (для prefetch_tt_job)"""
+        return {
+            key: buffer.stamp
+            for key, buffer in self.buffers.items()
+            if buffer.stamp is not None
+        }
+
+    def store(self, document_tt, keep_edits=True):
+        """Прочитанные ТТ; keep_edits=False - правки редактора отбрасываются.
+
+        Пока правки остаются, хеш буфера - хеш ТТ, на которых они сделаны:
+        иначе применение правок не заметит изменения ТТ в KOMPAS.
+        """
+        buffer = self.buffers.get(document_tt.key)
+        if buffer is None:
+            buffer = self.buffers[document_tt.key] = TTBuffer(document_tt.key)
+        buffer.stamp = document_tt.stamp
+        buffer.state = document_tt.state
+        buffer.text = document_tt.text
+        if not keep_edits or buffer.edited_text == buffer.text:
+            buffer.edited_text = None
+        if buffer.edited_text is None:
+            buffer.tt_hash = formatted_tt_hash(document_tt.text)
+        return buffer
+
+    def restamp(self, key, stamp):
+        """Новая отметка буфера, ТТ которого совпадают с чертежом (после записи)"""
+        buffer = self.buffers.get(key)
+        if buffer is not None:
+            buffer.stamp = stamp
+        return buffer
+
+    def remember_edit(self, key, text, cursor):
+        """Текст редактора при уходе с чертежа; правка - если он отличается"""
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return None
+        buffer.cursor = cursor
+        if text != buffer.text:
+            buffer.edited_text = text
+        elif buffer.edited_text is not None:
+            # Правки отменены: дальше сверка идет с ТТ буфера
+            buffer.edited_text = None
+            buffer.tt_hash = formatted_tt_hash(buffer.text)
+        return buffer
+
+    def retain(self, keys):
+        """Удаление буферов закрытых документов; число удаленных"""
+        closed = [key for key in self.buffers if key not in keys]
+        for key in closed:
+            del self.buffers[key]
+        return len(closed)
+
+    def clear(self):
+        self.buffers.clear()
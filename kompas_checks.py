@@ -0,0 +1,301 @@
+"""Проверка технических требований без обращений к KOMPAS и к виджетам.
+
+Каждая строка ТТ относится к одной из категорий ГОСТ 2.316 по ключевым словам
+из classification_rules (settings.json). Проверяется порядок категорий и
+точка в конце самостоятельных пунктов.
+
+Правила собираются один раз в автомат Ахо-Корасик (TTClassifier): строка
+просматривается за один проход независимо от числа ключевых слов, а найденные
+слова сохраняют позиции, чтобы показать, почему строка попала в категорию.
+
+Проверки - подключаемые правила TTRule: функция получает [(строка, категория)]
+и возвращает замечания TTIssue (правило, номер строки, категории, текст,
+исправленная строка). Окно и пакетные проверки показывают одни и те же
+замечания; большие пакеты можно проверять в пуле процессов.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+TT_CATEGORIES = [
+    "Требования к материалу, заготовке, термической обработке и свойствам",
+    "Требования к соединениям изделия",
+    "Размеры, предельные отклонения, геометрические допуски",
+    "Зазоры, расположение элементов конструкции",
+    "Требования к настройке и регулированию",
+    "Другие требования к качеству изделий",
+    "Условия и методы испытаний",
+    "Требования к качеству поверхностей, отделке, покрытию",
+    "Указания о маркировании и клеймении",
+    "Правила транспортирования и хранения",
+    "Особые условия эксплуатации",
+    "Принятые сокращения с расшифровкой",
+    "Ссылки на другие КД",
+    "Ссылки на другие документы с ТТ",
+]
+
+
+def split_tt_text(text_content):
+    """Непустые строки текста ТТ без крайних пробелов"""
+    return [line.strip() for line in text_content.split("\n") if line.strip()]
+
+
+# start, end - позиции слова в строке, category - номер категории
+KeywordMatch = namedtuple("KeywordMatch", ["start", "end", "category", "keyword"])
+
+
+class TTClassifier:
+    """Правила классификации, собранные в автомат Ахо-Корасик.
+
+    Объект не меняется после сборки, поэтому его можно передавать в фоновые
+    задания. key - отпечаток правил (результаты проверок зависят от него).
+    """
+
+    __slots__ = ("rules", "key", "_goto", "_fail", "_output")
+
+    def __init__(self, classification_rules):
+        self.rules = {cat: list(words) for cat, words in classification_rules.items()}
+        data = json.dumps(self.rules, ensure_ascii=False, sort_keys=True)
+        self.key = hashlib.sha1(data.encode("utf-8")).hexdigest()
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for idx, category in enumerate(TT_CATEGORIES):
+            for keyword in self.rules.get(category, []):
+                keyword = keyword.lower()
+                if keyword:
+                    self._add(keyword, idx)
+        self._link()
+
+    def _add(self, keyword, category):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += ((keyword, category),)
+
+    def _link(self):
+        """Ссылки неудач и слияние выходов в обходе в ширину"""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._output[next_state] += self._output[fail]
+
+    def __bool__(self):
+        return len(self._goto) > 1
+
+    def matches(self, line):
+        """Все вхождения ключевых слов в строку [KeywordMatch] по порядку конца"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found = []
+        state = 0
+        for pos, char in enumerate(line.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, category in output[state]:
+                found.append(
+                    KeywordMatch(pos + 1 - len(keyword), pos + 1, category, keyword)
+                )
+        return found
+
+    def classify(self, line):
+        """Номер категории строки; без совпадений - первая категория"""
+        categories = [match.category for match in self.matches(line)]
+        return min(categories) if categories else 0
+
+    def explain(self, line):
+        """(категория, вхождения слов, определивших ее)"""
+        found = self.matches(line)
+        if not found:
+            return 0, []
+        category = min(match.category for match in found)
+        return category, [match for match in found if match.category == category]
+
+
+def classify_tt_line(line, classifier):
+    """Номер категории строки; без совпадений - первая категория"""
+    return classifier.classify(line)
+
+
+def classify_tt_lines(lines, classifier):
+    """[(строка, номер категории)]"""
+    return [(line, classifier.classify(line)) for line in lines]
+
+
+RULE_NO_TT = "no_tt"
+RULE_CATEGORY_ORDER = "category_order"
+RULE_TRAILING_PERIOD = "trailing_period"
+
+# rule_id - код правила, check(categorized_lines) -> [TTIssue]
+TTRule = namedtuple("TTRule", ["rule_id", "title", "check"])
+# line - номер строки (с 0) или None, categories - номера затронутых
+# категорий, fix - исправленная строка или None
+TTIssue = namedtuple("TTIssue", ["rule", "line", "categories", "message", "fix"])
+
+# Меньше текстов проверяется в текущем потоке: запуск процессов (около
+# секунды) дороже самой проверки
+POOL_MIN_TEXTS = 20000
+
+
+def is_tt_subitem(line, position):
+    """Подчиненная строка (отступ, тире или продолжение со строчной буквы)"""
+    clean_line = re.sub(r"^\d+\.\s*", "", line).strip()
+    return bool(
+        clean_line.startswith("-")
+        or clean_line.startswith("–")
+        or (position > 0 and len(clean_line) > 0 and clean_line[0].islower())
+        or re.match(r"^\s+", line)
+    )
+
+
+def check_category_order(categorized_lines):
+    """Категории должны идти в порядке ГОСТ 2.316"""
+    last_category_idx = -1
+    issues = []
+    for i, (line, category_idx) in enumerate(categorized_lines):
+        if category_idx < last_category_idx:
+            issues.append(
+                TTIssue(
+                    RULE_CATEGORY_ORDER,
+                    i,
+                    (category_idx, last_category_idx),
+                    f"Строка {i+1}: '{line}' (категория '{TT_CATEGORIES[category_idx]}') "
+                    f"должна идти перед категорией '{TT_CATEGORIES[last_category_idx]}'",
+                    None,
+                )
+            )
+        last_category_idx = category_idx
+    return issues
+
+
+def check_trailing_period(categorized_lines):
+    """Самостоятельный пункт заканчивается точкой"""
+    issues = []
+    for i, (line, category_idx) in enumerate(categorized_lines):
+        clean_line = re.sub(r"^\d+\.\s*", "", line).strip()
+        if not is_tt_subitem(line, i) and not clean_line.endswith("."):
+            issues.append(
+                TTIssue(
+                    RULE_TRAILING_PERIOD,
+                    i,
+                    (category_idx,),
+                    f"Строка {i+1}: '{line}' должна заканчиваться точкой",
+                    f"{line}.",
+                )
+            )
+    return issues
+
+
+# Правила по умолчанию; дополнительные можно добавить в список или передать
+# в validate_tt_lines (для пула процессов функция должна быть в модуле)
+TT_RULES = [
+    TTRule(RULE_CATEGORY_ORDER, "Порядок категорий", check_category_order),
+    TTRule(RULE_TRAILING_PERIOD, "Точка в конце пункта", check_trailing_period),
+]
+
+
+def validate_categorized_lines(categorized_lines, rules=None):
+    """Замечания всех правил [TTIssue] по порядку строк"""
+    issues = []
+    for rule in TT_RULES if rules is None else rules:
+        issues.extend(rule.check(categorized_lines))
+    # Сортировка устойчивая: замечания одной строки идут в порядке правил
+    issues.sort(key=lambda issue: -1 if issue.line is None else issue.line)
+    return issues
+
+
+def validate_tt_lines(lines, classifier, rules=None):
+    """Проверка строк ТТ; пустые ТТ - одно замечание RULE_NO_TT"""
+    if not lines:
+        return [
+            TTIssue(
+                RULE_NO_TT,
+                None,
+                (),
+                "Технические требования отсутствуют или пусты",
+                None,
+            )
+        ]
+    return validate_categorized_lines(classify_tt_lines(lines, classifier), rules)
+
+
+def validate_tt_text(text_content, classifier, rules=None):
+    """Проверка текста ТТ (как в редакторе): [TTIssue]"""
+    return validate_tt_lines(split_tt_text(text_content), classifier, rules)
+
+
+def _validate_chunk(items, classifier, rules):
+    return [
+        (name, validate_tt_text(text or "", classifier, rules)) for name, text in items
+    ]
+
+
+def validate_tt_texts(texts, classifier, rules=None, processes=None):
+    """Проверка ТТ многих чертежей: {имя: [TTIssue]}.
+
+    texts - {имя: текст или None}. processes - число процессов; по умолчанию
+    пул запускается только для POOL_MIN_TEXTS текстов и больше.
+    """
+    items = list(texts.items())
+    if processes is None:
+        processes = (os.cpu_count() or 1) if len(items) >= POOL_MIN_TEXTS else 1
+    processes = max(1, min(processes, len(items)))
+    if processes == 1:
+        return dict(_validate_chunk(items, classifier, rules))
+    chunks = [items[i::processes] for i in range(processes)]
+    results = {}
+    with ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for chunk_result in executor.map(
+            _validate_chunk, chunks, repeat(classifier), repeat(rules)
+        ):
+            results.update(chunk_result)
+    # Порядок чертежей - как во входном словаре
+    return {name: results[name] for name, _ in items}
+
+
+def suggest_tt_lines(categorized_lines):
+    """Исправленные ТТ: строки по порядку категорий, с точками в конце пунктов"""
+    suggested = []
+    for line, _ in sorted(categorized_lines, key=lambda x: x[1]):
+        clean_line = re.sub(r"^\d+\.\s*", "", line).strip()
+        if not is_tt_subitem(line, len(suggested)) and not clean_line.endswith("."):
+            suggested.append(f"{line}.")
+        else:
+            suggested.append(line)
+    return suggested
+
+
+def issue_messages(issues):
+    return [issue.message for issue in issues]
+
+
+def check_tt_text(text_content, classifier):
+    """Проверка текста ТТ: список сообщений о нарушениях (пустой текст - без них)"""
+    lines = split_tt_text(text_content)
+    if not lines:
+        return []
+    return issue_messages(validate_tt_lines(lines, classifier))
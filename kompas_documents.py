@@ -0,0 +1,170 @@
+"""Реестр открытых документов KOMPAS-3D.
+
+Реестр строится за один проход по Documents: для каждого документа читаются
+только Name, Path и DocumentType, активный документ запрашивается один раз на
+весь проход. Между обновлениями реестр сравнивает новый снимок со старым и
+возвращает только добавленные, удаленные и измененные записи, чтобы дерево
+документов можно было править точечно, а не перестраивать.
+"""
+
+import os
+from collections import namedtuple
+
+from kompas_session import DRAWING_TYPE, UNSAVED_PATH
+
+STATUS_UNCHECKED = "⚪"
+STATUS_OK = "🟢"
+STATUS_ISSUES = "🟡"
+
+RegistryChanges = namedtuple(
+    "RegistryChanges", ["added", "removed", "changed", "active_changed"]
+)
+
+
+class DocumentRecord:
+    """Компактная запись об открытом документе"""
+
+    __slots__ = (
+        "key",
+        "name",
+        "path",
+        "doc_type",
+        "type_name",
+        "document",
+        "active",
+        "status",
+        "status_tip",
+    )
+
+    def __init__(self, name, path, doc_type, type_name, document=None):
+        self.key = (name, path)
+        self.name = name
+        self.path = path
+        self.doc_type = doc_type
+        self.type_name = type_name
+        self.document = document
+        self.active = False
+        self.status = STATUS_UNCHECKED
+        self.status_tip = ""
+
+    @property
+    def is_drawing(self):
+        return self.doc_type == DRAWING_TYPE
+
+    @property
+    def is_saved(self):
+        return self.path != UNSAVED_PATH
+
+    @property
+    def path_name(self):
+        """Полный путь файла документа ("" у несохраненного)"""
+        return os.path.join(self.path, self.name) if self.is_saved else ""
+
+    def set_status(self, issues, source=""):
+        """Статус проверки ТТ по списку замечаний; source - откуда результат"""
+        if issues:
+            self.status = STATUS_ISSUES
+            self.status_tip = "\n".join(issues)
+        else:
+            self.status = STATUS_OK
+            self.status_tip = "Технические требования корректны"
+        if source:
+            self.status_tip += f"\n({source})"
+
+    def __repr__(self):
+        return f"<DocumentRecord {self.name!r} {self.type_name}>"
+
+
+class DocumentRegistry:
+    """Снимок открытых документов с диффом между обновлениями"""
+
+    def __init__(self):
+        self.records = []
+        self._by_key = {}
+        self.active_key = None
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def find_by_name(self, name):
+        for record in self.records:
+            if record.name == name:
+                return record
+        return None
+
+    @property
+    def active_record(self):
+        return self._by_key.get(self.active_key)
+
+    def clear(self):
+        self.records = []
+        self._by_key = {}
+        self.active_key = None
+
+    def refresh(self, session):
+        """Перечитывание документов одним проходом; возвращает RegistryChanges"""
+        active = session.active_document()
+        active_name = active.Name if active else None
+
+        records = []
+        by_key = {}
+        added = []
+        changed = []
+        active_key = None
+        for doc in session.documents():
+            try:
+                name = doc.Name
+                if not name:
+                    continue
+                path = doc.Path or UNSAVED_PATH
+                doc_type = doc.DocumentType
+            except Exception:
+                continue
+            key = (name, path)
+            if key in by_key:
+                continue
+
+            record = self._by_key.get(key)
+            if record is None:
+                record = DocumentRecord(
+                    name, path, doc_type, session.document_type(doc, doc_type), doc
+                )
+                added.append(record)
+            else:
+                record.document = doc
+                if record.doc_type != doc_type:
+                    record.doc_type = doc_type
+                    record.type_name = session.document_type(doc, doc_type)
+                    changed.append(record)
+
+            record.active = name == active_name
+            if record.active:
+                active_key = key
+            records.append(record)
+            by_key[key] = record
+
+        removed = [record for key, record in self._by_key.items() if key not in by_key]
+        active_changed = active_key != self.active_key
+        self.records = records
+        self._by_key = by_key
+        self.active_key = active_key
+        return RegistryChanges(added, removed, changed, active_changed)
+
+    def set_statuses(self, issues_by_name, checked=None):
+        """Статусы проверки ТТ: проблемы для имен из словаря, остальные чертежи - OK.
+
+        checked - имена проверенных чертежей (None - проверены все); статус
+        непроверенных, например при прерванной проверке, не меняется.
+        """
+        for record in self.records:
+            if not record.is_drawing:
+                record.status = STATUS_UNCHECKED
+                record.status_tip = ""
+            elif checked is None or record.name in checked:
+                record.set_status(issues_by_name.get(record.name))
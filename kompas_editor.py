@@ -0,0 +1,272 @@
+"""Редактор ТТ с проверкой на лету.
+
+Изменения текста приходят из QTextDocument.contentsChange: заново
+классифицируются только затронутые блоки, результаты классификации
+кешируются по тексту блока. Через небольшую паузу после ввода правила
+kompas_checks прогоняются по уже известным категориям всех строк (это
+дешево), а замечания сохраняются в данных блока. Перекрашиваются только
+блоки, у которых замечания изменились.
+
+Подсветка (QSyntaxHighlighter): ключевые слова - цветом категории, нарушение
+порядка категорий - красным подчеркиванием, пропущенная точка - оранжевым.
+Слева от текста - полоса с маркерами замечаний и подсказками.
+"""
+
+from collections import namedtuple
+
+from PyQt6.QtCore import QEvent, QObject, QRect, QSize, Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import (
+    QColor,
+    QPainter,
+    QSyntaxHighlighter,
+    QTextBlockUserData,
+    QTextCharFormat,
+)
+from PyQt6.QtWidgets import QTextEdit, QToolTip, QWidget
+
+from kompas_checks import (
+    RULE_CATEGORY_ORDER,
+    RULE_TRAILING_PERIOD,
+    TT_CATEGORIES,
+    validate_categorized_lines,
+)
+
+# Пауза после ввода перед проверкой, мс
+VALIDATION_DELAY = 150
+# Кеш классификации блоков очищается, когда в нем больше записей
+BLOCK_CACHE_SIZE = 4096
+
+GUTTER_WIDTH = 14
+
+ORDER_COLOR = QColor(220, 40, 40)
+PERIOD_COLOR = QColor(240, 150, 0)
+ISSUE_COLOR = QColor(120, 120, 220)
+
+# category - номер категории строки, matches - слова, определившие ее
+BlockAnalysis = namedtuple("BlockAnalysis", ["category", "matches"])
+
+
+def category_color(category):
+    """Полупрозрачный цвет категории (различим в светлой и темной теме)"""
+    return QColor.fromHsv(int(category * 360 / len(TT_CATEGORIES)), 160, 230, 90)
+
+
+def issue_color(issue):
+    if issue.rule == RULE_CATEGORY_ORDER:
+        return ORDER_COLOR
+    if issue.rule == RULE_TRAILING_PERIOD:
+        return PERIOD_COLOR
+    return ISSUE_COLOR
+
+
+class BlockIssues(QTextBlockUserData):
+    """Замечания строки; хранятся в блоке и сдвигаются вместе с ним"""
+
+    def __init__(self, issues):
+        super().__init__()
+        self.issues = issues
+
+
+def block_issues(block):
+    data = block.userData()
+    return data.issues if isinstance(data, BlockIssues) else ()
+
+
+class TTHighlighter(QSyntaxHighlighter):
+    def __init__(self, validator, document):
+        super().__init__(document)
+        self.validator = validator
+
+    def highlightBlock(self, text):
+        analysis = self.validator.analyze(text)
+        for match in analysis.matches:
+            keyword_format = QTextCharFormat()
+            keyword_format.setBackground(category_color(analysis.category))
+            keyword_format.setToolTip(TT_CATEGORIES[analysis.category])
+            self.setFormat(match.start, match.end - match.start, keyword_format)
+
+        for issue in block_issues(self.currentBlock()):
+            issue_format = QTextCharFormat()
+            issue_format.setUnderlineStyle(
+                QTextCharFormat.UnderlineStyle.SpellCheckUnderline
+            )
+            issue_format.setUnderlineColor(issue_color(issue))
+            issue_format.setToolTip(issue.message)
+            if issue.rule == RULE_TRAILING_PERIOD:
+                # Подчеркивается конец строки, где не хватает точки
+                end = len(text.rstrip())
+                self.setFormat(max(0, end - 1), 1, issue_format)
+            else:
+                start = len(text) - len(text.lstrip())
+                self.setFormat(start, len(text.rstrip()) - start, issue_format)
+
+
+class TTLiveValidator(QObject):
+    """Проверка ТТ в редакторе по мере ввода"""
+
+    # Число замечаний после очередной проверки
+    issues_changed = pyqtSignal(int)
+
+    def __init__(self, editor, classifier, rules=None, delay=VALIDATION_DELAY):
+        super().__init__(editor)
+        self.editor = editor
+        self.classifier = classifier
+        self.rules = rules
+        self.issues = []
+        self._cache = {}
+        self._validating = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.validate)
+        document = editor.document()
+        self.highlighter = TTHighlighter(self, document)
+        document.contentsChange.connect(self.on_contents_change)
+
+    def set_classifier(self, classifier):
+        """Новые правила классификации: кеш сбрасывается, текст перепроверяется"""
+        self.classifier = classifier
+        self._cache.clear()
+        self.validate(force=True)
+
+    def analyze(self, text):
+        """Категория строки и определившие ее слова (кеш по тексту блока)"""
+        analysis = self._cache.get(text)
+        if analysis is None:
+            if len(self._cache) >= BLOCK_CACHE_SIZE:
+                self._cache.clear()
+            analysis = BlockAnalysis(*self.classifier.explain(text))
+            self._cache[text] = analysis
+        return analysis
+
+    def on_contents_change(self, position, removed, added):
+        if self._validating:
+            return
+        # Классифицируются только затронутые блоки; проверка - после паузы
+        document = self.editor.document()
+        block = document.findBlock(position)
+        end = document.findBlock(position + added)
+        while block.isValid():
+            self.analyze(block.text())
+            if block == end:
+                break
+            block = block.next()
+        self.timer.start()
+
+    def validate(self, force=False):
+        """Проверка всех строк по известным категориям; перекраска изменившихся"""
+        self.timer.stop()
+        blocks = []
+        categorized_lines = []
+        block = self.editor.document().begin()
+        while block.isValid():
+            text = block.text()
+            if text.strip():
+                blocks.append(block)
+                categorized_lines.append((text.strip(), self.analyze(text).category))
+            block = block.next()
+
+        self.issues = validate_categorized_lines(categorized_lines, self.rules)
+        by_line = {}
+        for issue in self.issues:
+            if issue.line is not None:
+                by_line.setdefault(issue.line, []).append(issue)
+
+        self._validating = True
+        try:
+            line_blocks = {block.blockNumber(): i for i, block in enumerate(blocks)}
+            block = self.editor.document().begin()
+            while block.isValid():
+                line = line_blocks.get(block.blockNumber())
+                issues = tuple(by_line.get(line, ())) if line is not None else ()
+                if force or issues != tuple(block_issues(block)):
+                    block.setUserData(BlockIssues(issues))
+                    self.highlighter.rehighlightBlock(block)
+                block = block.next()
+        finally:
+            self._validating = False
+        self.editor.gutter.update()
+        self.issues_changed.emit(len(self.issues))
+
+
+class TTIssueGutter(QWidget):
+    """Полоса маркеров замечаний слева от текста"""
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+
+    def sizeHint(self):
+        return QSize(GUTTER_WIDTH, 0)
+
+    def block_top(self, block):
+        layout = self.editor.document().documentLayout()
+        offset = self.editor.verticalScrollBar().value()
+        return int(layout.blockBoundingRect(block).top()) - offset
+
+    def visible_blocks(self):
+        """(блок, верх, высота) блоков в видимой части редактора"""
+        layout = self.editor.document().documentLayout()
+        height = self.editor.viewport().height()
+        cursor = self.editor.cursorForPosition(self.editor.viewport().rect().topLeft())
+        block = cursor.block()
+        while block.isValid():
+            top = self.block_top(block)
+            if top > height:
+                break
+            yield block, top, int(layout.blockBoundingRect(block).height())
+            block = block.next()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.palette().window())
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        offset = self.editor.viewport().y() - self.y()
+        for block, top, height in self.visible_blocks():
+            issues = block_issues(block)
+            if not issues:
+                continue
+            size = GUTTER_WIDTH - 6
+            line_height = self.editor.fontMetrics().height()
+            painter.setBrush(issue_color(issues[0]))
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.drawEllipse(
+                QRect(3, offset + top + (line_height - size) // 2, size, size)
+            )
+        painter.end()
+
+    def event(self, event):
+        if event.type() == QEvent.Type.ToolTip:
+            y = event.pos().y() - (self.editor.viewport().y() - self.y())
+            for block, top, height in self.visible_blocks():
+                if top <= y < top + height:
+                    issues = block_issues(block)
+                    if issues:
+                        QToolTip.showText(
+                            event.globalPos(),
+                            "\n".join(issue.message for issue in issues),
+                            self,
+                        )
+                        return True
+            QToolTip.hideText()
+            event.ignore()
+            return True
+        return super().event(event)
+
+
+class TTEditor(QTextEdit):
+    """Поле ТТ с полосой маркеров замечаний"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.gutter = TTIssueGutter(self)
+        self.setViewportMargins(GUTTER_WIDTH, 0, 0, 0)
+        self.verticalScrollBar().valueChanged.connect(self.gutter.update)
+        self.textChanged.connect(self.gutter.update)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        rect = self.contentsRect()
+        self.gutter.setGeometry(
+            QRect(rect.left(), rect.top(), GUTTER_WIDTH, rect.height())
+        )
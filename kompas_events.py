@@ -0,0 +1,189 @@
+"""Отслеживание изменений набора документов KOMPAS-3D по событиям COM.
+
+KOMPAS сообщает об открытии, создании и смене активного документа событиями
+приложения (ksKompasObjectNotify), а о закрытии, сохранении и "сохранить как"
+- событиями документа (ksDocumentFileNotify). Трекер подписывается на оба вида
+событий, копит их и уведомляет окно; окно по уведомлению обновляет реестр
+документов. Опрос остается только резервом с адаптивным интервалом.
+"""
+
+import logging
+
+logger = logging.getLogger("kompas")
+
+EVENT_OPENED = "opened"
+EVENT_CLOSED = "closed"
+EVENT_ACTIVATED = "activated"
+EVENT_SAVED = "saved"
+EVENT_RENAMED = "renamed"
+EVENT_DESTROYED = "destroyed"
+
+# События, после которых нужно перечитать набор документов (а не только активный)
+DOCUMENT_SET_EVENTS = {EVENT_OPENED, EVENT_CLOSED, EVENT_SAVED, EVENT_RENAMED}
+
+
+class ApplicationEventSink:
+    """Обработчик событий приложения для win32com.client.WithEvents.
+
+    Методы обработчиков должны возвращать True: для части событий KOMPAS
+    воспринимает False как запрет операции.
+    """
+
+    handler = None
+
+    def _notify(self, event, doc_name=None):
+        if self.handler is not None:
+            self.handler(event, doc_name)
+        return True
+
+    def OnCreateDocument(self, new_doc, doc_type):
+        return self._notify(EVENT_OPENED)
+
+    def OnOpenDocument(self, new_doc, doc_type):
+        return self._notify(EVENT_OPENED)
+
+    def OnChangeActiveDocument(self, new_doc, doc_type):
+        return self._notify(EVENT_ACTIVATED)
+
+    def OnApplicationDestroy(self):
+        return self._notify(EVENT_DESTROYED)
+
+
+class DocumentEventSink:
+    """Обработчик событий одного документа для win32com.client.WithEvents"""
+
+    handler = None
+    doc_name = None
+
+    def _notify(self, event):
+        if self.handler is not None:
+            self.handler(event, self.doc_name)
+        return True
+
+    def OnCloseDocument(self):
+        return self._notify(EVENT_CLOSED)
+
+    def OnSaveDocument(self):
+        return self._notify(EVENT_SAVED)
+
+    def OnBeginSaveAsDocument(self):
+        return self._notify(EVENT_RENAMED)
+
+    def OnActivate(self):
+        return self._notify(EVENT_ACTIVATED)
+
+
+class DocumentChangeTracker:
+    """Подписка на события KOMPAS и накопление необработанных изменений"""
+
+    def __init__(self, session, on_change):
+        self.session = session
+        self.on_change = on_change  # вызывается как on_change(event, doc_name)
+        self.pending = set()
+        self._app_subscription = None
+        self._doc_subscriptions = {}  # ключ записи реестра -> подписка
+
+    @property
+    def events_active(self):
+        return self._app_subscription is not None
+
+    def start(self):
+        """Подписка на события приложения; при неудаче остается только опрос"""
+        self.stop()
+        try:
+            self._app_subscription = self.session.subscribe_events(
+                self.session.app7, self.handle_event
+            )
+        except Exception as e:
+            logger.info("События KOMPAS недоступны, используется опрос: %s", e)
+            self._app_subscription = None
+        return self.events_active
+
+    def stop(self):
+        for subscription in self._doc_subscriptions.values():
+            subscription.close()
+        self._doc_subscriptions = {}
+        if self._app_subscription is not None:
+            self._app_subscription.close()
+            self._app_subscription = None
+        self.pending.clear()
+
+    def sync_documents(self, changes):
+        """Подписка на события добавленных документов и отписка от удаленных"""
+        if not self.events_active:
+            return
+        for record in changes.removed:
+            subscription = self._doc_subscriptions.pop(record.key, None)
+            if subscription is not None:
+                subscription.close()
+        for record in changes.added:
+            try:
+                self._doc_subscriptions[record.key] = self.session.subscribe_events(
+                    record.document, self.handle_event, record.name
+                )
+            except Exception as e:
+                logger.debug("Нет событий документа %s: %s", record.name, e)
+
+    def handle_event(self, event, doc_name=None):
+        self.pending.add(event)
+        self.on_change(event, doc_name)
+
+    def take_pending(self):
+        """Накопленные события с очисткой очереди"""
+        pending = self.pending
+        self.pending = set()
+        return pending
+
+
+class AdaptivePollInterval:
+    """Интервал резервного опроса: растет вдвое, пока ничего не меняется.
+
+    При работающих событиях опрос нужен только для подстраховки, поэтому и
+    базовый, и предельный интервалы больше. Свернутое окно опрашивается реже
+    всего.
+    """
+
+    def __init__(
+        self,
+        base=1000,
+        maximum=8000,
+        events_factor=5,
+        minimized=60000,
+        full_refresh_every=10,
+    ):
+        self.base = base
+        self.maximum = maximum
+        self.events_factor = events_factor
+        self.minimized = minimized
+        self.full_refresh_every = full_refresh_every
+        self.events_active = False
+        self.current = base
+        self._idle_polls = 0
+
+    def _limits(self):
+        factor = self.events_factor if self.events_active else 1
+        return self.base * factor, self.maximum * factor
+
+    def reset(self):
+        self.current = self._limits()[0]
+        self._idle_polls = 0
+        return self.current
+
+    def next(self, changed, minimized=False):
+        """Интервал до следующего опроса по итогам текущего"""
+        base, maximum = self._limits()
+        if changed:
+            self._idle_polls = 0
+            self.current = base
+        else:
+            self._idle_polls += 1
+            self.current = min(max(self.current, base) * 2, maximum)
+        if minimized:
+            return max(self.current, self.minimized)
+        return self.current
+
+    def full_refresh_due(self):
+        """Полное перечитывание раз в full_refresh_every простоев без событий"""
+        if self.events_active or not self._idle_polls:
+            return False
+        return self._idle_polls % self.full_refresh_every == 0
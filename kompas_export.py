@@ -0,0 +1,449 @@
+"""Пакетный экспорт открытых чертежей в PDF.
+
+PDF пишется через ksDocument2D.SaveAs без активации документов. Чертеж
+пропускается, если его PDF в "Чертежи в pdf" новее исходного файла, а хеш
+исходного файла совпадает с записанным при прошлом экспорте. Результаты
+пишутся в журнал (манифест), поэтому прерванный экспорт при повторном запуске
+продолжается с того места, где остановился.
+
+Проверка актуальности (чтение и хеширование файлов) идет в пуле потоков с
+опережением, параллельно с сохранением предыдущих чертежей в KOMPAS.
+
+Параллельный режим запускает пул процессов, в каждом - свой COM и свой
+невидимый экземпляр KOMPAS. Чертежи открываются в нем по пути только для
+чтения; список файлов делится между процессами, результаты сводятся в один
+отчет и журнал.
+"""
+
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from kompas_batch import BATCH_FAILED, BATCH_OK, BATCH_SKIPPED
+from kompas_hash import file_hash
+from kompas_ready import call_when_ready, file_written, wait_until
+from kompas_session import DRAWING_TYPE, KompasSession
+from kompas_worker import JobCancelled
+
+logger = logging.getLogger("kompas")
+
+PDF_FOLDER_NAME = "Чертежи в pdf"
+MANIFEST_VERSION = 1
+# Экземпляр KOMPAS занимает сотни мегабайт памяти, поэтому пул ограничен
+MAX_POOL_SIZE = 4
+# Сколько ждать появления PDF на диске после SaveAs, с
+PDF_WRITE_TIMEOUT = 30.0
+
+STATUS_EXPORTED = "exported"
+STATUS_FAILED = "failed"
+
+ExportItem = namedtuple("ExportItem", ["name", "source", "pdf", "changed", "document"])
+ExportResult = namedtuple(
+    "ExportResult",
+    ["total", "exported", "skipped", "failed", "cancelled", "elapsed", "processes"],
+    defaults=(1,),
+)
+
+
+def pdf_path_for(doc_path):
+    """Путь PDF чертежа в папке "Чертежи в pdf" рядом с исходным файлом"""
+    doc_dir = os.path.dirname(doc_path)
+    doc_name_without_ext = os.path.splitext(os.path.basename(doc_path))[0]
+    return os.path.join(doc_dir, PDF_FOLDER_NAME, f"{doc_name_without_ext}.pdf")
+
+
+def sheets_per_minute(count, elapsed):
+    return count * 60.0 / elapsed if elapsed > 0 else 0.0
+
+
+def default_pool_size(file_count=None):
+    """Число экземпляров KOMPAS по умолчанию: половина ядер, не больше MAX_POOL_SIZE"""
+    size = max(1, min(MAX_POOL_SIZE, (os.cpu_count() or 2) // 2))
+    if file_count is not None:
+        size = max(1, min(size, file_count))
+    return size
+
+
+def save_pdf(session, document, pdf_path, timeout=PDF_WRITE_TIMEOUT):
+    """Сохранение чертежа в PDF через ksDocument2D.SaveAs; ошибка - исключение.
+
+    Занятому KOMPAS вызов повторяется. Чертеж сохранен, когда PDF записан на
+    диск: следующий чертеж не начинается раньше.
+    """
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    started = time.time_ns()
+    result = call_when_ready(session.document_2d(document).SaveAs, pdf_path)
+    if not (result or result is None):
+        raise RuntimeError("SaveAs вернул ошибку")
+    wait_until(file_written(pdf_path, started), timeout, os.path.basename(pdf_path))
+
+
+class ExportManifest:
+    """Журнал экспорта: исходный файл -> хеш, путь PDF, статус и время"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        """Запись журнала через временный файл (без порчи при сбое)"""
+        if not self.dirty:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "entries": self.entries},
+                f,
+                ensure_ascii=False,
+                indent=1,
+            )
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def get(self, source):
+        return self.entries.get(os.path.normcase(source))
+
+    def record(self, source, pdf_path, status, source_hash=None, error=None):
+        self.entries[os.path.normcase(source)] = {
+            "pdf": pdf_path,
+            "hash": source_hash,
+            "status": status,
+            "error": error,
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.dirty = True
+
+
+def check_up_to_date(item, entry):
+    """(PDF актуален, хеш исходного файла); выполняется в пуле потоков.
+
+    Несохраненный в KOMPAS чертеж всегда экспортируется: его PDF будет
+    отличаться от файла на диске, поэтому хеш для него не записывается.
+    """
+    if item.changed:
+        return False, None
+    try:
+        source_hash = file_hash(item.source)
+    except OSError:
+        return False, None
+    if not entry or entry.get("hash") != source_hash:
+        return False, source_hash
+    try:
+        up_to_date = os.path.getmtime(item.pdf) >= os.path.getmtime(item.source)
+    except OSError:
+        up_to_date = False
+    return up_to_date, source_hash
+
+
+def collect_drawings(session):
+    """Сохраненные на диск открытые чертежи и список пропущенных без файла"""
+    items = []
+    unsaved = []
+    for doc in session.documents():
+        if doc.DocumentType != DRAWING_TYPE:
+            continue
+        name = doc.Name
+        source = doc.PathName
+        if not source:
+            unsaved.append(name)
+            continue
+        items.append(
+            ExportItem(name, source, pdf_path_for(source), bool(doc.Changed), doc)
+        )
+    return items, unsaved
+
+
+def export_drawings_pdf_job(ctx, manifest_path, force=False, save_every=10):
+    """Задание ComWorker: экспорт открытых чертежей в PDF; возвращает ExportResult.
+
+    force - экспортировать и актуальные чертежи. Отмена (ctx.checkpoint)
+    прерывает экспорт между чертежами; журнал при этом сохраняется.
+    """
+    session = ctx.session
+    manifest = ExportManifest(manifest_path)
+    items, unsaved = collect_drawings(session)
+    failed = [(name, "Документ не сохранен") for name in unsaved]
+    for name, error in failed:
+        ctx.report(name, BATCH_FAILED, error)
+    exported = skipped = 0
+    cancelled = False
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-check") as pool:
+        checks = [
+            pool.submit(check_up_to_date, item, manifest.get(item.source))
+            for item in items
+        ]
+        try:
+            for i, (item, check) in enumerate(zip(items, checks)):
+                ctx.checkpoint()
+                up_to_date, source_hash = check.result()
+                if up_to_date and not force:
+                    skipped += 1
+                    ctx.report(item.name, BATCH_SKIPPED, "PDF актуален")
+                    continue
+
+                rate = sheets_per_minute(exported, time.monotonic() - started)
+                ctx.progress(
+                    i, len(items), f"Экспорт PDF: {item.name} ({rate:.0f} листов/мин)"
+                )
+                try:
+                    save_pdf(session, item.document, item.pdf)
+                except Exception as e:
+                    failed.append((item.name, str(e)))
+                    manifest.record(item.source, item.pdf, STATUS_FAILED, error=str(e))
+                    ctx.report(item.name, BATCH_FAILED, str(e))
+                else:
+                    exported += 1
+                    manifest.record(item.source, item.pdf, STATUS_EXPORTED, source_hash)
+                    ctx.report(item.name, BATCH_OK, item.pdf)
+                if (exported + len(failed)) % save_every == 0:
+                    manifest.save()
+        except JobCancelled:
+            cancelled = True
+            for check in checks:
+                check.cancel()
+        finally:
+            manifest.save()
+
+    return ExportResult(
+        len(items) + len(unsaved),
+        exported,
+        skipped,
+        failed,
+        cancelled,
+        time.monotonic() - started,
+    )
+
+
+def shard_items(items, count):
+    """Раскладка чертежей по count частям: крупные файлы - в наименее загруженную"""
+
+    def size(item):
+        try:
+            return os.path.getsize(item.source)
+        except OSError:
+            return 0
+
+    shards = [[] for _ in range(count)]
+    loads = [(0, index) for index in range(count)]
+    for item in sorted(items, key=size, reverse=True):
+        load, index = heapq.heappop(loads)
+        shards[index].append(item)
+        heapq.heappush(loads, (load + size(item), index))
+    return [shard for shard in shards if shard]
+
+
+def export_shard(backend, files, progress_queue=None, cancel_event=None):
+    """Экспорт части файлов в отдельном процессе; [(путь, статус, ошибка)].
+
+    Процесс инициализирует свой COM и запускает свой невидимый KOMPAS, который
+    закрывается по окончании. Результат каждого файла сразу уходит в
+    progress_queue.
+    """
+    backend.initialize()
+    session = KompasSession(backend)
+    results = []
+    try:
+        session.launch_instance()
+        for source, pdf_path in files:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            try:
+                doc = session.open_document(source, visible=False, read_only=True)
+                try:
+                    save_pdf(session, doc, pdf_path)
+                finally:
+                    doc.Close(0)
+            except Exception as e:
+                results.append((source, STATUS_FAILED, str(e)))
+            else:
+                results.append((source, STATUS_EXPORTED, None))
+            if progress_queue is not None:
+                progress_queue.put(results[-1])
+    finally:
+        try:
+            session.quit_instance()
+        except Exception as e:
+            logger.debug("Не удалось закрыть экземпляр KOMPAS: %s", e)
+        backend.uninitialize()
+    return results
+
+
+def export_drawings_pdf_pool_job(
+    ctx, manifest_path, processes=None, force=False, save_every=10
+):
+    """Задание ComWorker: экспорт в PDF пулом процессов KOMPAS.
+
+    Актуальность проверяется здесь же, в пул уходят только устаревшие
+    чертежи. Несохраненные изменения есть только в KOMPAS пользователя, поэтому
+    такие чертежи сохраняются через сессию задания, как в обычном режиме.
+    Результаты процессов учитываются по мере экспорта каждого чертежа.
+    """
+    session = ctx.session
+    manifest = ExportManifest(manifest_path)
+    items, unsaved = collect_drawings(session)
+    failed = [(name, "Документ не сохранен") for name in unsaved]
+    for name, error in failed:
+        ctx.report(name, BATCH_FAILED, error)
+    exported = skipped = 0
+    cancelled = False
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-check") as pool:
+        checks = list(
+            pool.map(
+                lambda item: check_up_to_date(item, manifest.get(item.source)), items
+            )
+        )
+    hashes = {}
+    local_items = []
+    pool_items = []
+    for item, (up_to_date, source_hash) in zip(items, checks):
+        if up_to_date and not force:
+            skipped += 1
+            ctx.report(item.name, BATCH_SKIPPED, "PDF актуален")
+            continue
+        hashes[item.source] = source_hash
+        (local_items if item.changed else pool_items).append(item)
+    by_source = {item.source: item for item in local_items + pool_items}
+    pending = len(by_source)
+
+    def record(source, status, error=None):
+        nonlocal exported
+        item = by_source[source]
+        if status == STATUS_EXPORTED:
+            exported += 1
+            manifest.record(source, item.pdf, status, hashes.get(source))
+            ctx.report(item.name, BATCH_OK, item.pdf)
+        else:
+            failed.append((item.name, error))
+            manifest.record(source, item.pdf, status, error=error)
+            ctx.report(item.name, BATCH_FAILED, error)
+        if (exported + len(failed) - len(unsaved)) % save_every == 0:
+            manifest.save()
+
+    def report(name):
+        rate = sheets_per_minute(exported, time.monotonic() - started)
+        ctx.progress(
+            exported + len(failed) - len(unsaved),
+            pending,
+            f"Экспорт PDF: {name} ({rate:.0f} листов/мин)",
+        )
+
+    processes = processes or default_pool_size(len(pool_items))
+    processes = max(1, min(processes, len(pool_items) or 1))
+    try:
+        for item in local_items:
+            ctx.checkpoint()
+            report(item.name)
+            try:
+                save_pdf(session, item.document, item.pdf)
+            except Exception as e:
+                record(item.source, STATUS_FAILED, str(e))
+            else:
+                record(item.source, STATUS_EXPORTED)
+
+        if pool_items:
+            cancelled = _run_pool(
+                ctx,
+                session.backend.for_process(),
+                shard_items(pool_items, processes),
+                record,
+                report,
+            )
+    except JobCancelled:
+        cancelled = True
+    finally:
+        manifest.save()
+
+    return ExportResult(
+        len(items) + len(unsaved),
+        exported,
+        skipped,
+        failed,
+        cancelled,
+        time.monotonic() - started,
+        processes,
+    )
+
+
+def _run_pool(ctx, backend, shards, record, report):
+    """Запуск частей в пуле процессов; возвращает True, если экспорт отменен"""
+    cancelled = False
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        progress_queue = manager.Queue()
+        cancel_event = manager.Event()
+        with ProcessPoolExecutor(len(shards), mp_context=context) as pool:
+            futures = {
+                pool.submit(
+                    export_shard,
+                    backend,
+                    [(item.source, item.pdf) for item in shard],
+                    progress_queue,
+                    cancel_event,
+                ): shard
+                for shard in shards
+            }
+            names = {item.source: item.name for shard in shards for item in shard}
+            recorded = set()
+
+            def consume(source, status, error):
+                # Результат приходит и из очереди, и из future.result()
+                if source not in recorded:
+                    recorded.add(source)
+                    record(source, status, error)
+                    report(names[source])
+
+            not_done = set(futures)
+            while not_done:
+                done, not_done = wait(not_done, timeout=0.2)
+                _drain_progress(progress_queue, consume)
+                for future in done:
+                    try:
+                        for result in future.result():
+                            consume(*result)
+                    except Exception as e:
+                        # Процесс упал: неучтенные файлы его части - с ошибкой
+                        for item in futures[future]:
+                            consume(item.source, STATUS_FAILED, str(e))
+                if not cancelled:
+                    try:
+                        ctx.checkpoint()
+                    except JobCancelled:
+                        # Процессы дорабатывают текущий чертеж и выходят
+                        cancelled = True
+                        cancel_event.set()
+    return cancelled
+
+
+def _drain_progress(progress_queue, consume):
+    """Учет результатов (путь, статус, ошибка), пришедших от процессов"""
+    while True:
+        try:
+            result = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        consume(*result)
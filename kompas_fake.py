@@ -0,0 +1,464 @@
+"""Модель объектов KOMPAS-3D в памяти процесса.
+
+Повторяет ту часть API 7, которой пользуется приложение: Documents, документы с
+DocumentType/Name/Path, IDrawingDocument.TechnicalDemand, Text/TextLines со
+Str и Numbering, ksDocument2D.SaveAs. Позволяет запускать сессию и окно без
+KOMPAS (на Linux, в CI) и считать обращения к COM через KompasSession.
+
+Фейк генерирует те же события, что и KOMPAS (открытие, закрытие, активация,
+сохранение, переименование), а fire_event() позволяет подать любое событие
+искусственно.
+
+Файлы "чертежей" фейка - JSON вида {"type": 1, "tt": [["текст", 1], ...]}.
+"""
+
+import json
+import os
+import threading
+import time
+
+from kompas_events import (
+    EVENT_ACTIVATED,
+    EVENT_CLOSED,
+    EVENT_OPENED,
+    EVENT_RENAMED,
+    EVENT_SAVED,
+)
+
+APP_NAME = "KOMPAS-3D (fake)"
+APP_VERSION = "0.0.0"
+
+
+class FakeTextItem:
+    """Компонент строки текста: запись Str дописывает текст в строку"""
+
+    def __init__(self, line):
+        self._line = line
+        self._str = ""
+
+    @property
+    def Str(self):
+        return self._str
+
+    @Str.setter
+    def Str(self, value):
+        self._line.Str += value
+        self._str = value
+
+
+class FakeTextLine:
+    def __init__(self, text, line="", numbering=0):
+        self._text = text
+        self.Str = line
+        self.Numbering = numbering
+
+    def Add(self):
+        return FakeTextItem(self)
+
+    def Delete(self):
+        self._text._lines.remove(self)
+        return True
+
+
+class FakeTextLines:
+    """Индексируемая коллекция строк (TextLines[i])"""
+
+    def __init__(self, lines):
+        self._lines = lines
+
+    def __getitem__(self, index):
+        return self._lines[index]
+
+    def __len__(self):
+        return len(self._lines)
+
+
+class FakeText:
+    def __init__(self, lines=()):
+        self._lines = [FakeTextLine(self, line, numbering) for line, numbering in lines]
+
+    @property
+    def Count(self):
+        return len(self._lines)
+
+    @property
+    def TextLines(self):
+        return FakeTextLines(self._lines)
+
+    @property
+    def Str(self):
+        """Весь текст одной строкой (строки разделены CRLF)"""
+        return "\r\n".join(line.Str for line in self._lines)
+
+    def Add(self):
+        line = FakeTextLine(self)
+        self._lines.append(line)
+        return line
+
+    def snapshot(self):
+        return [(line.Str, line.Numbering) for line in self._lines]
+
+
+class FakeTechnicalDemand:
+    def __init__(self, lines=()):
+        self.Text = FakeText(lines)
+        self._created = bool(lines)
+
+    @property
+    def IsCreated(self):
+        return self._created or self.Text.Count > 0
+
+    def Create(self):
+        self._created = True
+        return True
+
+    def Update(self):
+        return True
+
+
+class FakeDrawingDocument:
+    def __init__(self, document, lines=()):
+        self._document = document
+        self.TechnicalDemand = FakeTechnicalDemand(lines)
+
+    def Update(self):
+        return True
+
+
+class FakeSubscription:
+    def __init__(self, listeners, listener):
+        self._listeners = listeners
+        self._listener = listener
+        listeners.append(listener)
+
+    def close(self):
+        if self._listener in self._listeners:
+            self._listeners.remove(self._listener)
+
+
+class FakeEventSource:
+    """Источник событий: подписчики вызываются как handler(event, doc_name)"""
+
+    def __init__(self):
+        self._listeners = []
+
+    def subscribe(self, handler, doc_name=None):
+        return FakeSubscription(self._listeners, (handler, doc_name))
+
+    def fire_event(self, event, doc_name=None):
+        for handler, subscribed_name in list(self._listeners):
+            handler(event, subscribed_name or doc_name)
+
+
+class FakeDocument(FakeEventSource):
+    def __init__(self, app, path_name, doc_type=1, lines=(), on_disk=False):
+        super().__init__()
+        self._app = app
+        self._on_disk = on_disk
+        self.PathName = path_name
+        self.Name = os.path.basename(path_name) or "Без имени"
+        self.Path = os.path.dirname(path_name) + os.sep if path_name else ""
+        self.DocumentType = doc_type
+        self.Changed = False
+        self.ReadOnly = False
+        self.Visible = True
+        self.drawing = FakeDrawingDocument(self, lines) if doc_type == 1 else None
+
+    @property
+    def Active(self):
+        return self._app.ActiveDocument is self
+
+    @Active.setter
+    def Active(self, value):
+        if value and self._app.ActiveDocument is not self:
+            self._app.ActiveDocument = self
+            self._app.fire_event(EVENT_ACTIVATED, self.Name)
+
+    def Update(self):
+        return True
+
+    def Save(self):
+        if self._on_disk and self.PathName:
+            write_drawing_file(self.PathName, self.DocumentType, self.tt_snapshot())
+        self.Changed = False
+        self.fire_event(EVENT_SAVED)
+        return True
+
+    def rename(self, path_name):
+        """Имитация "Сохранить как" под другим именем"""
+        self.fire_event(EVENT_RENAMED)
+        self.PathName = path_name
+        self.Name = os.path.basename(path_name)
+        self.Path = os.path.dirname(path_name) + os.sep
+        self.fire_event(EVENT_SAVED)
+
+    def SaveAs(self, path):
+        """ksDocument2D.SaveAs: фейк пишет файл-заглушку по указанному пути.
+
+        При write_delay у приложения файл появляется на диске позже возврата.
+        """
+        self._app.simulate_latency()
+
+        def write():
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"%PDF-fake {self.Name}\n")
+
+        if self._app.write_delay:
+            threading.Timer(self._app.write_delay, write).start()
+        else:
+            write()
+        return True
+
+    def Close(self, mode=0):
+        self._app._documents.remove(self)
+        self.fire_event(EVENT_CLOSED)
+        if self._app.ActiveDocument is self:
+            documents = self._app._documents
+            self._app.ActiveDocument = documents[-1] if documents else None
+            if documents:
+                self._app.fire_event(EVENT_ACTIVATED, documents[-1].Name)
+        return True
+
+    def tt_snapshot(self):
+        if self.drawing is None:
+            return []
+        return self.drawing.TechnicalDemand.Text.snapshot()
+
+
+class FakeDocuments:
+    def __init__(self, app):
+        self._app = app
+
+    @property
+    def Count(self):
+        return len(self._app._documents)
+
+    def Item(self, index):
+        return self._app._documents[index]
+
+    def Add(self, doc_type=1, visible=True):
+        return self._app.add_document("", doc_type)
+
+    def Open(self, path, visible=True, readonly=False):
+        """Открытие "чертежа" фейка с диска"""
+        doc_type, lines = read_drawing_file(path)
+        doc = self._app.add_document(path, doc_type, lines, on_disk=True)
+        doc.Visible = visible
+        doc.ReadOnly = readonly
+        if visible:
+            doc.Active = True
+        return doc
+
+
+class FakeApplication(FakeEventSource):
+    def __init__(self, latency=0.0, write_delay=0.0):
+        super().__init__()
+        self._documents = []
+        self.ActiveDocument = None
+        self.Visible = False
+        self.HideMessage = False
+        self.latency = latency
+        self.write_delay = write_delay
+
+    @property
+    def Documents(self):
+        return FakeDocuments(self)
+
+    def ApplicationName(self, FullName=False):
+        return APP_NAME
+
+    def ApplicationVersion(self):
+        return APP_VERSION
+
+    def add_document(self, path_name, doc_type=1, lines=(), on_disk=False):
+        doc = FakeDocument(self, path_name, doc_type, lines, on_disk)
+        self._documents.append(doc)
+        if self.ActiveDocument is None:
+            self.ActiveDocument = doc
+        self.fire_event(EVENT_OPENED, doc.Name)
+        return doc
+
+    def Quit(self):
+        for doc in list(self._documents):
+            doc.Close(0)
+        return True
+
+    def simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeModule7:
+    """Заменитель модуля gencache API 7"""
+
+    NamesToIIDMap = {}
+
+    def IDrawingDocument(self, doc):
+        if doc.drawing is None:
+            raise TypeError("Документ не является чертежом")
+        return doc.drawing
+
+
+class FakeBackend:
+    """Бэкенд KompasSession поверх модели KOMPAS в памяти процесса"""
+
+    name = "Fake"
+
+    def __init__(self, app=None):
+        self.app = app if app is not None else FakeApplication()
+
+    def initialize(self):
+        pass
+
+    def uninitialize(self):
+        pass
+
+    def connect(self, launch=False):
+        if launch:
+            self.app.Visible = True
+        return self.attach(self.app)
+
+    def launch_instance(self):
+        # В дочернем процессе фейк - отдельный экземпляр "KOMPAS"
+        return self.attach(self.app)
+
+    def for_process(self):
+        return FakeBackend(FakeApplication(latency=self.app.latency))
+
+    def attach(self, app7):
+        return app7, FakeModule7(), None, None
+
+    def marshal(self, obj):
+        return obj
+
+    def unmarshal(self, stream):
+        return stream
+
+    def query_interface(self, obj, iid):
+        raise TypeError("QueryInterface не поддерживается фейком")
+
+    def subscribe(self, obj, handler, doc_name=None):
+        return obj.subscribe(handler, doc_name)
+
+    def document_2d(self, doc):
+        return doc
+
+
+def read_drawing_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("type", 1), [tuple(line) for line in data.get("tt", [])]
+
+
+def write_drawing_file(path, doc_type, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": doc_type, "tt": lines}, f, ensure_ascii=False)
+
+
+SAMPLE_TT = [
+    ("Сталь 45 ГОСТ 1050-2013. Термическая обработка: HRC 40...45.", 1),
+    ("Общие допуски по ГОСТ 30893.2-mK.", 1),
+    ("Неуказанные радиусы скруглений 1 мм.", 1),
+    ("Покрытие: Хим. Окс. прм.", 1),
+    ("Маркировать шрифтом 5 по ГОСТ 2.304.", 1),
+]
+
+
+def build_fake_project(
+    drawings=300, others=0, folder=None, lines=SAMPLE_TT, latency=0.0
+):
+    """Фейковый KOMPAS с открытыми чертежами; folder - записать чертежи на диск.
+
+    latency - задержка "тяжелых" операций (SaveAs) в секундах.
+    """
+    app = FakeApplication(latency)
+    base = folder or os.path.join(os.sep, "fake-project")
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    for i in range(drawings):
+        path = os.path.join(base, f"Деталь-{i + 1:04d}.cdw")
+        if folder:
+            write_drawing_file(path, 1, list(lines))
+        app.add_document(path, 1, lines, on_disk=bool(folder))
+    for i in range(others):
+        app.add_document(os.path.join(base, f"Модель-{i + 1:04d}.m3d"), 4)
+    return app
+
+
+_CORPUS_TT = [
+    ("Сталь {0} ГОСТ 1050-2013.", ("10", "20", "35", "45", "40Х")),
+    ("Термическая обработка: HRC {0}…{1}.", ("28", "35", "40", "45", "50")),
+    ("Общие допуски по ГОСТ 30893.2-{0}.", ("mK", "mH", "cK")),
+    ("Неуказанные радиусы скруглений {0} мм.", ("0,5", "1", "2", "3")),
+    ("Размеры для справок отмечены знаком *.", ()),
+    ("Острые кромки притупить R {0} мм.", ("0,3", "0,5", "1")),
+    ("Покрытие: {0}.", ("Хим. Окс. прм", "Ц9.хр", "Ан.Окс.нхр", "Н12")),
+    ("Маркировать шрифтом {0} по ГОСТ 2.304.", ("3,5", "5", "7")),
+    ("Сварные швы по ГОСТ {0}.", ("5264-80", "14771-76", "8713-79")),
+    ("Допускается замена материала на {0}.", ("сталь 40", "сталь 20", "АМг6")),
+]
+
+
+def build_fake_tt_corpus(drawings=10000, folder=None, seed=1):
+    """Строки ТТ синтетического проекта: {путь: [(текст, нумерация)]}.
+
+    ТТ собираются из типовых пунктов с разными значениями, как в реальном
+    архиве, где большая часть строк повторяется от чертежа к чертежу.
+    """
+    import random
+
+    rnd = random.Random(seed)
+    base = folder or os.path.join(os.sep, "fake-project")
+    corpus = {}
+    for i in range(drawings):
+        lines = []
+        for template, values in _CORPUS_TT:
+            if rnd.random() < 0.5:
+                continue
+            args = [rnd.choice(values) for _ in range(2)] if values else []
+            lines.append((template.format(*args), 1))
+        lines.append((f"Деталь {i + 1} изготавливать по ТУ-{rnd.randint(1, 999)}.", 1))
+        corpus[
+            os.path.join(base, f"Узел-{i // 100:03d}", f"Деталь-{i + 1:05d}.cdw")
+        ] = lines
+    return corpus
+
+
+_TEMPLATE_PHRASES = [
+    "Неуказанная шероховатость поверхностей Ra {0}.",
+    "Неуказанные предельные отклонения размеров: отверстий H{0}, валов h{0}.",
+    "Покрытие {0} по ГОСТ 9.306-85.",
+    "Допуск плоскостности поверхности {0} мм.",
+    "Резьба по ГОСТ 24705-{0}.",
+    "Размеры обеспечить инструментом, радиус {0} мм.",
+    "Контроль герметичности давлением {0} МПа.",
+    "Маркировать обозначение детали краской {0}.",
+    "Заусенцы не допускаются, кромки скруглить R {0}.",
+    "Паять припоем ПОС {0} ГОСТ 21931-76.",
+    "Клеймить клеймом ОТК {0}.",
+    "Поверхности под окраску грунтовать {0}.",
+]
+
+
+def build_fake_templates(count=20000, seed=1):
+    """Библиотека шаблонов ТТ в формате templates.json:
+    {категория: [{"text": ..., "variants": [...]}]}"""
+    import random
+
+    rnd = random.Random(seed)
+    phrases = _TEMPLATE_PHRASES + [template for template, _ in _CORPUS_TT]
+    categories = ["Общие", "Покрытия", "Термообработка", "Сварка", "Маркировка"]
+    templates = {category: [] for category in categories}
+    for i in range(count):
+        text = " ".join(
+            phrase.format(rnd.randint(1, 200), rnd.randint(1, 200))
+            for phrase in rnd.sample(phrases, rnd.randint(1, 2))
+        )
+        variants = [
+            {"text": f" Вариант {i}-{j}.", "custom_input": False}
+            for j in range(rnd.randint(0, 2))
+        ]
+        templates[categories[i % len(categories)]].append(
+            {"text": text, "variants": variants}
+        )
+    return templates
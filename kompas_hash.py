@@ -0,0 +1,16 @@
+"""Хеши содержимого файлов.
+
+Модуль без зависимостей от Qt и KOMPAS: им пользуются и экспорт, и индекс
+ТТ, и общая библиотека шаблонов.
+"""
+
+import hashlib
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 содержимого файла (читается блоками)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
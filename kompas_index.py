@@ -0,0 +1,265 @@
+"""Локальный индекс технических требований чертежей (SQLite).
+
+Для каждого чертежа на диске хранятся прочитанные строки ТТ (текст и
+нумерация), тип документа и результат последней проверки. Запись привязана к
+абсолютному пути, времени изменения, размеру и SHA-256 файла: пока файл не
+менялся, его ТТ берутся из индекса, и KOMPAS не нужен. Если время изменения
+другое, а размер тот же, сверяется хеш (файл могли скопировать или "тронуть").
+
+Результаты проверки хранятся вместе с отпечатком правил классификации
+(TTClassifier.key); после смены правил замечания пересчитываются по
+сохраненным строкам без KOMPAS.
+
+Индекс - кеш: при повреждении базы или версии схемы новее известной он
+создается заново. Соединения открываются отдельно для каждого потока.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from kompas_checks import check_tt_text
+from kompas_hash import file_hash
+from kompas_tt import format_tt_lines
+
+logger = logging.getLogger("kompas")
+
+INDEX_FILE_NAME = "tt_index.sqlite3"
+SCHEMA_VERSION = 2
+
+# _MIGRATIONS[i] переводит схему из версии i в версию i + 1
+_MIGRATIONS = [
+    [
+        """
+        CREATE TABLE drawings (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            doc_type INTEGER,
+            lines TEXT NOT NULL,
+            issues TEXT,
+            rules_key TEXT,
+            indexed_at REAL NOT NULL
+        )
+        """,
+    ],
+    # Выборка изменений для поискового индекса (kompas_search)
+    ["CREATE INDEX drawings_indexed_at ON drawings (indexed_at)"],
+]
+
+IndexEntry = namedtuple(
+    "IndexEntry",
+    ["path", "mtime_ns", "size", "hash", "doc_type", "lines", "issues", "rules_key"],
+)
+# Состояние файла на момент чтения ТТ
+FileSignature = namedtuple("FileSignature", ["mtime_ns", "size", "hash"])
+
+
+def index_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def file_signature(path):
+    """Время изменения, размер и хеш файла; снимается до чтения ТТ"""
+    stat = os.stat(path)
+    return FileSignature(stat.st_mtime_ns, stat.st_size, file_hash(path))
+
+
+class TTIndex:
+    """Индекс ТТ чертежей в файле SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            with self._lock:
+                if not self._ready:
+                    self._prepare()
+                    self._ready = True
+            connection = self._open()
+            self._local.connection = connection
+        return connection
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _prepare(self):
+        """Создание или обновление схемы; поврежденная база пересоздается"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        try:
+            self._migrate()
+        except sqlite3.DatabaseError as e:
+            logger.warning("Индекс ТТ поврежден и будет создан заново: %s", e)
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.path + suffix)
+                except OSError:
+                    pass
+            self._migrate()
+
+    def _migrate(self):
+        connection = self._open()
+        try:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                # Индекс записан более новой версией программы
+                logger.info("Индекс ТТ версии %s создается заново", version)
+                connection.execute("DROP TABLE IF EXISTS drawings")
+                version = 0
+            for target in range(version, SCHEMA_VERSION):
+                with connection:
+                    for statement in _MIGRATIONS[target]:
+                        connection.execute(statement)
+                    connection.execute(f"PRAGMA user_version={target + 1}")
+        finally:
+            connection.close()
+
+    def close(self):
+        """Закрытие соединения текущего потока"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM drawings").fetchone()[0]
+
+    def _row(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT path, mtime_ns, size, hash, doc_type, lines, issues, rules_key"
+                " FROM drawings WHERE path = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        lines = [tuple(line) for line in json.loads(row[5])]
+        issues = json.loads(row[6]) if row[6] is not None else None
+        return IndexEntry(row[0], row[1], row[2], row[3], row[4], lines, issues, row[7])
+
+    def lookup(self, path, check_hash=True):
+        """Запись, если файл не менялся с момента индексации, иначе None.
+
+        check_hash=False - не читать файл: при другом времени изменения запись
+        считается устаревшей (для быстрых проверок в потоке окна).
+        """
+        key = index_key(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self._row(key)
+        if entry is None or entry.size != stat.st_size:
+            return None
+        if entry.mtime_ns == stat.st_mtime_ns:
+            return entry
+        if not check_hash:
+            return None
+        try:
+            if file_hash(path) != entry.hash:
+                return None
+        except OSError:
+            return None
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE drawings SET mtime_ns = ? WHERE path = ?",
+                (stat.st_mtime_ns, key),
+            )
+        return entry._replace(mtime_ns=stat.st_mtime_ns)
+
+    def signature(self, path):
+        """file_signature() или None, если файл недоступен"""
+        try:
+            return file_signature(path)
+        except OSError:
+            return None
+
+    def store(self, path, signature, doc_type, lines, issues=None, classifier=None):
+        """Сохранение прочитанных ТТ; signature - file_signature() до чтения"""
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO drawings"
+                " (path, mtime_ns, size, hash, doc_type, lines, issues, rules_key,"
+                " indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    index_key(path),
+                    signature.mtime_ns,
+                    signature.size,
+                    signature.hash,
+                    doc_type,
+                    json.dumps([list(line) for line in lines], ensure_ascii=False),
+                    (
+                        json.dumps(issues, ensure_ascii=False)
+                        if issues is not None
+                        else None
+                    ),
+                    classifier.key if classifier is not None else None,
+                    time.time(),
+                ),
+            )
+
+    def store_issues(self, path, issues, classifier):
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE drawings SET issues = ?, rules_key = ? WHERE path = ?",
+                (
+                    json.dumps(issues, ensure_ascii=False),
+                    classifier.key,
+                    index_key(path),
+                ),
+            )
+
+    def issues(self, entry, classifier):
+        """Замечания по записи; после смены правил - пересчет по строкам"""
+        if entry.issues is not None and entry.rules_key == classifier.key:
+            return entry.issues
+        formatted_text = format_tt_lines(entry.lines)
+        issues = check_tt_text(formatted_text, classifier) if formatted_text else []
+        self.store_issues(entry.path, issues, classifier)
+        return issues
+
+    def entries_since(self, timestamp):
+        """[(путь, строки, время индексации)] записей, сохраненных с timestamp"""
+        rows = self._connection().execute(
+            "SELECT path, lines, indexed_at FROM drawings WHERE indexed_at >= ?",
+            (timestamp,),
+        )
+        return [
+            (path, [tuple(line) for line in json.loads(lines)], indexed_at)
+            for path, lines, indexed_at in rows
+        ]
+
+    def compact(self):
+        """Удаление записей об исчезнувших файлах и сжатие базы; число удаленных"""
+        connection = self._connection()
+        paths = [row[0] for row in connection.execute("SELECT path FROM drawings")]
+        missing = [(path,) for path in paths if not os.path.isfile(path)]
+        with connection:
+            connection.executemany("DELETE FROM drawings WHERE path = ?", missing)
+        connection.execute("VACUUM")
+        return len(missing)
+
+
+def compact_index_job(ctx, index):
+    """Задание ComWorker: сжатие индекса ТТ; (удалено записей, осталось)"""
+    ctx.progress(0, 0, "Сжатие индекса ТТ...")
+    removed = index.compact()
+    return removed, len(index)
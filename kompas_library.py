@@ -0,0 +1,181 @@
+"""Общая библиотека шаблонов в сетевой папке с локальной копией.
+
+В папке библиотеки лежит templates.json (формат файла шаблонов). Окно читает
+только локальную копию, поэтому медленная или недоступная сетевая папка не
+задерживает запуск и перезагрузку шаблонов. Копия сверяется с папкой в
+фоновом потоке: по манифесту сравниваются время изменения и размер файла в
+папке, и только если они другие, файл копируется, проверяется и его SHA-256
+сравнивается с прежним. Манифест хранит и время изменения самой копии: если
+копию изменили, она сверяется по хешу и при расхождении не используется.
+
+Личные шаблоны накладываются на общие: в каждой категории сначала общие,
+затем личные. Редактируются только личные.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+from kompas_hash import file_hash
+from kompas_templates import load_templates_file
+
+logger = logging.getLogger("kompas")
+
+LIBRARY_FILE_NAME = "templates.json"
+CACHE_FOLDER_NAME = "shared_templates"
+MANIFEST_FILE_NAME = "manifest.json"
+
+SYNC_FRESH = "fresh"
+SYNC_UPDATED = "updated"
+SYNC_UNAVAILABLE = "unavailable"
+
+# status - SYNC_*, message - текст для строки состояния
+SyncResult = namedtuple("SyncResult", ["folder", "status", "message"])
+
+
+def layer_templates(shared, personal):
+    """Общие шаблоны с наложенными личными (словари не изменяются)"""
+    templates = {}
+    for category, rows in shared.items():
+        templates[category] = list(rows) + list(personal.get(category, ()))
+    for category, rows in personal.items():
+        if category not in templates:
+            templates[category] = list(rows)
+    return templates
+
+
+class SharedLibrary:
+    """Общая библиотека шаблонов в папке folder с копией в cache_folder"""
+
+    def __init__(self, folder, cache_folder):
+        self.folder = folder
+        self.cache_folder = cache_folder
+        self.source = os.path.join(folder, LIBRARY_FILE_NAME)
+        self.cache_file = os.path.join(cache_folder, LIBRARY_FILE_NAME)
+        self.manifest_file = os.path.join(cache_folder, MANIFEST_FILE_NAME)
+
+    def read_manifest(self):
+        """Манифест копии; {} - копии нет или она от другой папки"""
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get("folder") != self.folder:
+            return {}
+        return manifest
+
+    def write_manifest(self, manifest):
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(temp_file, self.manifest_file)
+
+    def cached_templates(self):
+        """Шаблоны из локальной копии; {} - копии нет или она не сходится.
+
+        Папка библиотеки не читается, метод можно вызывать в потоке окна.
+        """
+        manifest = self.read_manifest()
+        if not manifest:
+            return {}
+        try:
+            stat = os.stat(self.cache_file)
+            if stat.st_size != manifest["cache_size"]:
+                logger.warning("Копия общей библиотеки изменена и не используется")
+                return {}
+            if stat.st_mtime_ns != manifest["cache_mtime_ns"]:
+                # Копию "тронули": сверяется содержимое
+                if file_hash(self.cache_file) != manifest["hash"]:
+                    logger.warning("Копия общей библиотеки изменена и не используется")
+                    return {}
+                manifest["cache_mtime_ns"] = stat.st_mtime_ns
+                self.write_manifest(manifest)
+            return load_templates_file(self.cache_file)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Копия общей библиотеки не прочитана: %s", e)
+            return {}
+
+    def stat_source(self):
+        return os.stat(self.source)
+
+    def copy_source(self, target):
+        shutil.copyfile(self.source, target)
+
+    def sync(self):
+        """Сверка копии с папкой библиотеки (для фонового потока); SyncResult"""
+        manifest = self.read_manifest()
+        try:
+            stat = self.stat_source()
+        except OSError as e:
+            return SyncResult(
+                self.folder, SYNC_UNAVAILABLE, f"Общая библиотека недоступна: {e}"
+            )
+        if (
+            manifest.get("mtime_ns") == stat.st_mtime_ns
+            and manifest.get("size") == stat.st_size
+            and os.path.exists(self.cache_file)
+        ):
+            return SyncResult(self.folder, SYNC_FRESH, "Общая библиотека актуальна")
+
+        os.makedirs(self.cache_folder, exist_ok=True)
+        temp_file = self.cache_file + ".tmp"
+        try:
+            self.copy_source(temp_file)
+            digest = file_hash(temp_file)
+            # Недописанный или испорченный файл не заменяет рабочую копию
+            count = sum(len(rows) for rows in load_templates_file(temp_file).values())
+        except (OSError, ValueError) as e:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+            return SyncResult(
+                self.folder, SYNC_UNAVAILABLE, f"Общая библиотека не прочитана: {e}"
+            )
+
+        changed = digest != manifest.get("hash") or not os.path.exists(self.cache_file)
+        if changed:
+            os.replace(temp_file, self.cache_file)
+        else:
+            os.remove(temp_file)
+        cache_stat = os.stat(self.cache_file)
+        self.write_manifest(
+            {
+                "folder": self.folder,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "hash": digest,
+                "cache_mtime_ns": cache_stat.st_mtime_ns,
+                "cache_size": cache_stat.st_size,
+                "checked_at": time.time(),
+            }
+        )
+        if not changed:
+            return SyncResult(self.folder, SYNC_FRESH, "Общая библиотека актуальна")
+        return SyncResult(
+            self.folder,
+            SYNC_UPDATED,
+            f"Общая библиотека обновлена: {count} шаблонов",
+        )
+
+
+def sync_in_background(library, callback):
+    """Сверка библиотеки в фоновом потоке; callback(SyncResult) - из него же"""
+
+    def run():
+        try:
+            result = library.sync()
+        except Exception as e:
+            result = SyncResult(
+                library.folder, SYNC_UNAVAILABLE, f"Ошибка общей библиотеки: {e}"
+            )
+        callback(result)
+
+    thread = threading.Thread(target=run, name="shared-templates", daemon=True)
+    thread.start()
+    return thread
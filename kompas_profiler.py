@@ -0,0 +1,394 @@
+"""Профилирование обращений к COM: время, ошибки, действие пользователя.
+
+ComProfiler подключается к счетчикам сессий (ComCallCounter.profiler) и
+замеряет каждое обращение прокси к KOMPAS: число, суммарное время, p95,
+максимум и исключения по члену ("Тип.член") и по действию, внутри которого
+обращение случилось (com_action окна или имя задания ComWorker). Последние
+обращения хранятся как события для выгрузки в формате Chrome trace
+(chrome://tracing, Perfetto).
+
+Выключенный профилировщик ничего не стоит: прокси только проверяет, что
+counter.profiler - None.
+"""
+
+import json
+import math
+import threading
+import time
+from collections import deque, namedtuple
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import (
+    QCheckBox,
+    QDockWidget,
+    QFileDialog,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QMessageBox,
+    QPushButton,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+# Длительностей на член для p95 (последние)
+PROFILE_SAMPLES = 512
+# Событий для Chrome trace (старые вытесняются)
+TRACE_EVENTS = 200000
+# Обращения вне com_action и заданий
+NO_ACTION = "(вне действия)"
+# Обновление панели, мс
+DOCK_REFRESH_INTERVAL = 1000
+DOCK_ROWS = 200
+
+# Строка отчета; время - в секундах
+ProfileRow = namedtuple(
+    "ProfileRow",
+    ["action", "kind", "member", "count", "total", "mean", "p95", "max", "errors"],
+)
+
+
+def percentile(values, fraction):
+    """Процентиль по ближайшему рангу; values отсортированы"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class MemberProfile:
+    """Замеры одного члена COM в одном действии"""
+
+    __slots__ = ("count", "total", "max", "errors", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.samples = deque(maxlen=PROFILE_SAMPLES)
+
+    def add(self, duration, error=False):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        if error:
+            self.errors += 1
+        self.samples.append(duration)
+
+
+class ComProfiler:
+    """Замеры обращений к COM из всех потоков, подключенных к нему"""
+
+    def __init__(self, trace_events=TRACE_EVENTS):
+        self.members = {}  # (действие, вид, член) -> MemberProfile
+        # (имя, вид, начало, конец, поток, действие, ошибка)
+        self.events = deque(maxlen=trace_events)
+        self.threads = {}  # ident -> имя потока (для Chrome trace)
+        self.started = time.perf_counter()
+        self._owner_names = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def member_name(self, owner, name):
+        """Имя "Тип.член": для динамического IDispatch pywin32 тип - имя, под
+        которым объект получен (Documents, TextLines), иначе - имя класса"""
+        try:
+            username = vars(owner).get("_username_")
+        except TypeError:
+            username = None
+        if username and username != "<unknown>":
+            return f"{username}.{name}"
+        owner_type = type(owner)
+        owner_name = self._owner_names.get(owner_type)
+        if owner_name is None:
+            owner_name = self._owner_names[owner_type] = owner_type.__name__
+        return f"{owner_name}.{name}"
+
+    def current_action(self):
+        actions = getattr(self._local, "actions", None)
+        return actions[-1] if actions else NO_ACTION
+
+    def begin_action(self, name):
+        actions = getattr(self._local, "actions", None)
+        if actions is None:
+            actions = self._local.actions = []
+        actions.append(name)
+
+    def end_action(self, name, started_at):
+        actions = getattr(self._local, "actions", None)
+        if actions:
+            actions.pop()
+        with self._lock:
+            self._event(name, "action", started_at, time.perf_counter(), name, False)
+
+    def _event(self, name, kind, started_at, finished_at, action, error):
+        """Событие для Chrome trace (вызывается под self._lock)"""
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads[ident] = threading.current_thread().name
+        self.events.append((name, kind, started_at, finished_at, ident, action, error))
+
+    def add(self, kind, member, started_at, finished_at, error=False):
+        """Одно обращение к члену member (kind - "get", "set" или "call")"""
+        action = self.current_action()
+        key = (action, kind, member)
+        with self._lock:
+            profile = self.members.get(key)
+            if profile is None:
+                profile = self.members[key] = MemberProfile()
+            profile.add(finished_at - started_at, error)
+            self._event(member, kind, started_at, finished_at, action, error)
+
+    def measure(self, kind, member, func, *args):
+        """func(*args) с замером как обращение к member"""
+        started_at = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self.add(kind, member, started_at, time.perf_counter(), True)
+            raise
+        self.add(kind, member, started_at, time.perf_counter())
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.members.clear()
+            self.events.clear()
+            self.started = time.perf_counter()
+
+    def rows(self, by_action=True):
+        """[ProfileRow] по убыванию суммарного времени.
+
+        by_action=False - члены сводятся по всем действиям (действие - "*").
+        """
+        with self._lock:
+            items = [
+                (key, profile.count, profile.total, profile.max, profile.errors)
+                for key, profile in self.members.items()
+            ]
+            samples = {key: list(p.samples) for key, p in self.members.items()}
+        merged = {}
+        for (action, kind, member), count, total, maximum, errors in items:
+            key = (action if by_action else "*", kind, member)
+            profile = merged.get(key)
+            if profile is None:
+                profile = merged[key] = MemberProfile()
+                profile.samples = deque(maxlen=None)
+            profile.count += count
+            profile.total += total
+            profile.max = max(profile.max, maximum)
+            profile.errors += errors
+            profile.samples.extend(samples[(action, kind, member)])
+        rows = [
+            ProfileRow(
+                action,
+                kind,
+                member,
+                profile.count,
+                profile.total,
+                profile.total / profile.count if profile.count else 0.0,
+                percentile(sorted(profile.samples), 0.95),
+                profile.max,
+                profile.errors,
+            )
+            for (action, kind, member), profile in merged.items()
+        ]
+        rows.sort(key=lambda row: row.total, reverse=True)
+        return rows
+
+    def to_dict(self):
+        """Сводка для выгрузки в JSON (время - в миллисекундах)"""
+        return {
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "members": [
+                {
+                    "action": row.action,
+                    "kind": row.kind,
+                    "member": row.member,
+                    "count": row.count,
+                    "total_ms": round(row.total * 1000, 3),
+                    "mean_ms": round(row.mean * 1000, 4),
+                    "p95_ms": round(row.p95 * 1000, 4),
+                    "max_ms": round(row.max * 1000, 3),
+                    "errors": row.errors,
+                }
+                for row in self.rows()
+            ],
+        }
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+    def chrome_trace(self):
+        """События в формате Trace Event (ph "X", время - в микросекундах)"""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        trace = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": ident,
+                "args": {"name": name},
+            }
+            for ident, name in threads.items()
+        ]
+        for name, kind, started_at, finished_at, ident, action, error in events:
+            event = {
+                "name": name,
+                "cat": kind,
+                "ph": "X",
+                "pid": 1,
+                "tid": ident,
+                "ts": round((started_at - self.started) * 1e6, 3),
+                "dur": round((finished_at - started_at) * 1e6, 3),
+                "args": {"action": action},
+            }
+            if error:
+                event["args"]["error"] = True
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+class ComProfilerDock(QDockWidget):
+    """Панель профилирования COM: члены по убыванию времени и выгрузка"""
+
+    COLUMNS = [
+        "Член",
+        "Вид",
+        "Действие",
+        "Обращений",
+        "Всего, мс",
+        "Среднее, мс",
+        "p95, мс",
+        "Макс., мс",
+        "Ошибок",
+    ]
+
+    def __init__(self, parent=None):
+        super().__init__("Профилирование COM", parent)
+        self.setObjectName("com_profiler_dock")
+        self.profiler = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(DOCK_REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        self.members_tree = QTreeWidget()
+        self.members_tree.setHeaderLabels(self.COLUMNS)
+        self.members_tree.setRootIsDecorated(False)
+        self.members_tree.setUniformRowHeights(True)
+        self.members_tree.header().setSectionResizeMode(
+            QHeaderView.ResizeMode.ResizeToContents
+        )
+        layout.addWidget(self.members_tree)
+
+        buttons = QHBoxLayout()
+        self.by_action_check = QCheckBox("По действиям")
+        self.by_action_check.setChecked(True)
+        self.by_action_check.toggled.connect(self.refresh)
+        buttons.addWidget(self.by_action_check)
+        buttons.addStretch()
+        reset_button = QPushButton("Сбросить")
+        reset_button.clicked.connect(self.reset)
+        buttons.addWidget(reset_button)
+        json_button = QPushButton("JSON...")
+        json_button.clicked.connect(self.export_json)
+        buttons.addWidget(json_button)
+        trace_button = QPushButton("Chrome trace...")
+        trace_button.clicked.connect(self.export_chrome_trace)
+        buttons.addWidget(trace_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(widget)
+
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+        self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.timer.start()
+        self.refresh()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def refresh(self):
+        if self.profiler is None:
+            self.summary_label.setText("Профилирование выключено")
+            return
+        rows = self.profiler.rows(self.by_action_check.isChecked())
+        total = sum(row.total for row in rows)
+        calls = sum(row.count for row in rows)
+        errors = sum(row.errors for row in rows)
+        self.summary_label.setText(
+            f"Обращений: {calls}, время в COM: {total * 1000:.1f} мс, "
+            f"ошибок: {errors}"
+        )
+        self.members_tree.clear()
+        items = []
+        for row in rows[:DOCK_ROWS]:
+            item = QTreeWidgetItem(
+                [
+                    row.member,
+                    row.kind,
+                    row.action,
+                    str(row.count),
+                    f"{row.total * 1000:.2f}",
+                    f"{row.mean * 1000:.3f}",
+                    f"{row.p95 * 1000:.3f}",
+                    f"{row.max * 1000:.2f}",
+                    str(row.errors),
+                ]
+            )
+            for column in range(3, len(self.COLUMNS)):
+                item.setTextAlignment(column, Qt.AlignmentFlag.AlignRight)
+            items.append(item)
+        self.members_tree.addTopLevelItems(items)
+
+    def reset(self):
+        if self.profiler is not None:
+            self.profiler.reset()
+            self.refresh()
+
+    def _export(self, title, default_name, file_filter, export):
+        if self.profiler is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, title, default_name, file_filter)
+        if not path:
+            return
+        try:
+            export(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить: {str(e)}")
+
+    def export_json(self):
+        self._export(
+            "Экспорт профиля COM",
+            "com_profile.json",
+            "JSON (*.json)",
+            self.profiler.export_json if self.profiler else None,
+        )
+
+    def export_chrome_trace(self):
+        self._export(
+            "Экспорт Chrome trace",
+            "com_trace.json",
+            "Trace (*.json)",
+            self.profiler.export_chrome_trace if self.profiler else None,
+        )
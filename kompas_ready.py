@@ -0,0 +1,174 @@
+"""Запуск операций KOMPAS по готовности вместо фиксированных пауз.
+
+Следующая операция ждет не заданное число миллисекунд, а условие: документ
+стал активным, документ закрыт, файл записан, KOMPAS снова принимает вызовы.
+Условие проверяется сразу, затем с растущим вдвое интервалом (до
+MAX_INTERVAL), пока не истечет таймаут. На быстрой машине операция идет без
+задержки, на медленной - дожидается KOMPAS.
+
+wait_until - ожидание в потоке заданий, ReadinessScheduler - в потоке окна
+(по QTimer, цикл событий не блокируется).
+"""
+
+import logging
+import os
+import time
+
+from PyQt6.QtCore import QObject, QTimer
+
+logger = logging.getLogger("kompas")
+
+DEFAULT_TIMEOUT = 10.0
+FIRST_INTERVAL = 0.005
+MAX_INTERVAL = 0.25
+BACKOFF_FACTOR = 2
+# Время изменения файла на FAT и сетевых дисках округляется до 2 с
+MTIME_SLACK_NS = 2_000_000_000
+
+# HRESULT занятого KOMPAS: вызов отклонен, повторить позже
+RPC_E_CALL_REJECTED = -2147418111
+RPC_E_SERVERCALL_RETRYLATER = -2147417846
+BUSY_HRESULTS = (RPC_E_CALL_REJECTED, RPC_E_SERVERCALL_RETRYLATER)
+
+
+class NotReady(TimeoutError):
+    """Условие не выполнено за отведенное время"""
+
+
+def backoff_intervals(
+    first=FIRST_INTERVAL, maximum=MAX_INTERVAL, factor=BACKOFF_FACTOR
+):
+    """Интервалы между проверками: first, first * factor, ... до maximum"""
+    interval = first
+    while True:
+        yield interval
+        interval = min(maximum, interval * factor)
+
+
+def check(condition):
+    """Значение условия; ошибка при проверке (KOMPAS занят) - не готово"""
+    try:
+        return condition()
+    except Exception as e:
+        logger.debug("Условие готовности не проверено: %s", e)
+        return None
+
+
+def wait_until(condition, timeout=DEFAULT_TIMEOUT, description=""):
+    """Ожидание condition() в текущем потоке; значение условия или NotReady"""
+    deadline = time.monotonic() + timeout
+    for interval in backoff_intervals():
+        value = check(condition)
+        if value:
+            return value
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise NotReady(f"{description or 'KOMPAS'}: нет готовности за {timeout} с")
+        time.sleep(min(interval, remaining))
+
+
+def is_busy_error(error):
+    """Ошибка COM "KOMPAS занят" (вызов стоит повторить)"""
+    hresult = getattr(error, "hresult", None)
+    if hresult is None and getattr(error, "args", None):
+        hresult = error.args[0]
+    return hresult in BUSY_HRESULTS
+
+
+def call_when_ready(func, *args, timeout=DEFAULT_TIMEOUT):
+    """func(*args) с повтором, пока KOMPAS отклоняет вызовы как занятый"""
+    deadline = time.monotonic() + timeout
+    for interval in backoff_intervals():
+        try:
+            return func(*args)
+        except Exception as e:
+            remaining = deadline - time.monotonic()
+            if not is_busy_error(e) or remaining <= 0:
+                raise
+            time.sleep(min(interval, remaining))
+
+
+def document_active(session, doc_name):
+    """Условие: активен документ doc_name"""
+
+    def condition():
+        doc = session.active_document()
+        return doc if doc and doc.Name == doc_name else None
+
+    return condition
+
+
+def document_closed(session, doc_name):
+    """Условие: документа doc_name нет среди открытых"""
+    return lambda: session.find_document(doc_name) is None
+
+
+def file_written(path, since_ns):
+    """Условие: файл path не пуст и записан не раньше since_ns (time.time_ns())"""
+
+    def condition():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size > 0 and stat.st_mtime_ns >= since_ns - MTIME_SLACK_NS
+
+    return condition
+
+
+class ReadinessScheduler(QObject):
+    """Операции окна, запускаемые по готовности KOMPAS.
+
+    when(condition, action) проверяет условие сразу и затем по таймеру с
+    растущим интервалом; action() выполняется, как только условие истинно,
+    on_timeout() - если не дождались. Новая операция с тем же name заменяет
+    ожидающую (например, повторный двойной щелчок по другому чертежу).
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pending = {}
+
+    def when(
+        self, condition, action, timeout=DEFAULT_TIMEOUT, on_timeout=None, name=None
+    ):
+        if name is not None:
+            self.cancel(name)
+        if check(condition):
+            action()
+            return
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        waiter = {
+            "deadline": time.monotonic() + timeout,
+            "intervals": backoff_intervals(),
+            "timer": timer,
+        }
+        key = name if name is not None else timer
+        self.pending[key] = waiter
+
+        def poll():
+            if check(condition):
+                self.cancel(key)
+                action()
+                return
+            remaining = waiter["deadline"] - time.monotonic()
+            if remaining <= 0:
+                self.cancel(key)
+                if on_timeout is not None:
+                    on_timeout()
+                return
+            timer.start(int(min(next(waiter["intervals"]), remaining) * 1000))
+
+        timer.timeout.connect(poll)
+        timer.start(int(next(waiter["intervals"]) * 1000))
+
+    def cancel(self, name):
+        waiter = self.pending.pop(name, None)
+        if waiter is not None:
+            waiter["timer"].stop()
+            waiter["timer"].deleteLater()
+
+    def clear(self):
+        for name in list(self.pending):
+            self.cancel(name)
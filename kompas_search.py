@@ -0,0 +1,218 @@
+"""Полнотекстовый поиск по ТТ чертежей.
+
+Обратный индекс строится в памяти по записям индекса ТТ (kompas_index) и
+дополняется только записями, сохраненными после прошлой синхронизации, то есть
+чертежами, которые приложение читало при проверках. Строки нормализуются
+(NFKC, нижний регистр, е вместо ё, одно тире, одиночные пробелы), поэтому
+"HRC 40…45" находится по "hrc 40...45".
+
+Одинаковые строки разных чертежей (шаблонные ТТ) хранятся один раз. По
+уникальным строкам ведутся два индекса: триграммы - для поиска подстроки и
+слова - для поиска по началу слов. Регулярное выражение проверяется по всем
+уникальным строкам в нормализованном виде. Номер строки, которой больше нет
+ни в одном чертеже, занимает следующая новая строка, поэтому при повторных
+обновлениях чертежей индекс не растет.
+"""
+
+import bisect
+import os
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+
+SEARCH_SUBSTRING = "substring"
+SEARCH_PREFIX = "prefix"
+SEARCH_REGEX = "regex"
+
+SEARCH_MODE_NAMES = {
+    SEARCH_SUBSTRING: "Подстрока",
+    SEARCH_PREFIX: "Начало слов",
+    SEARCH_REGEX: "Рег. выражение",
+}
+
+# line - номер строки ТТ (с 1), text - строка как в чертеже
+SearchHit = namedtuple("SearchHit", ["path", "line", "text"])
+
+# str.replace заметно быстрее str.translate для кириллицы
+_REPLACEMENTS = (("–", "-"), ("—", "-"), ("−", "-"), ("ё", "е"))
+_SPACES = re.compile(r"\s+")
+_WORD = re.compile(r"\w+")
+
+
+def normalize_tt_text(text):
+    """Строка ТТ для поиска: NFKC, нижний регистр, е/ё и тире унифицированы"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    for old, new in _REPLACEMENTS:
+        if old in text:
+            text = text.replace(old, new)
+    return _SPACES.sub(" ", text).strip()
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TTSearchIndex:
+    """Обратный индекс строк ТТ: путь чертежа -> строки, строка -> чертежи"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._line_ids = {}  # нормализованная строка -> номер
+        self._lines = []  # номер -> нормализованная строка
+        self._line_paths = []  # номер -> пути чертежей со строкой
+        self._free_ids = []  # номера удаленных строк для новых
+        self._documents = {}  # путь -> [(номер строки, номер в ТТ, текст)]
+        self._trigrams = defaultdict(set)
+        self._words = defaultdict(set)
+        self._sorted_words = None
+        self.synced_at = 0.0
+
+    def __len__(self):
+        return len(self._documents)
+
+    @property
+    def line_count(self):
+        return sum(1 for paths in self._line_paths if paths)
+
+    def sync(self, tt_index):
+        """Добавление записей индекса ТТ, сохраненных после прошлой синхронизации"""
+        entries = tt_index.entries_since(self.synced_at)
+        for path, lines, indexed_at in entries:
+            self.update_document(path, lines)
+            self.synced_at = max(self.synced_at, indexed_at)
+        return len(entries)
+
+    def update_document(self, path, lines):
+        """Замена строк чертежа; lines - [(текст, нумерация)]"""
+        self.remove_document(path)
+        refs = []
+        for line_no, (text, _) in enumerate(lines, 1):
+            normalized = normalize_tt_text(text)
+            if not normalized:
+                continue
+            line_id = self._line_id(normalized)
+            self._line_paths[line_id].add(path)
+            refs.append((line_id, line_no, text))
+        self._documents[path] = refs
+
+    def remove_document(self, path):
+        for line_id, _, _ in self._documents.pop(path, ()):
+            paths = self._line_paths[line_id]
+            paths.discard(path)
+            if not paths:
+                self._drop_line(line_id)
+
+    def _line_id(self, normalized):
+        line_id = self._line_ids.get(normalized)
+        if line_id is not None:
+            return line_id
+        if self._free_ids:
+            line_id = self._free_ids.pop()
+            self._lines[line_id] = normalized
+        else:
+            line_id = len(self._lines)
+            self._lines.append(normalized)
+            self._line_paths.append(set())
+        self._line_ids[normalized] = line_id
+        for trigram in _trigrams(normalized):
+            self._trigrams[trigram].add(line_id)
+        for word in set(_WORD.findall(normalized)):
+            if word not in self._words:
+                self._sorted_words = None
+            self._words[word].add(line_id)
+        return line_id
+
+    def _drop_line(self, line_id):
+        """Строка больше не встречается ни в одном чертеже - убрать из индексов"""
+        normalized = self._lines[line_id]
+        del self._line_ids[normalized]
+        self._lines[line_id] = None
+        for trigram in _trigrams(normalized):
+            self._discard(self._trigrams, trigram, line_id)
+        for word in set(_WORD.findall(normalized)):
+            if self._discard(self._words, word, line_id):
+                self._sorted_words = None
+        self._free_ids.append(line_id)
+
+    @staticmethod
+    def _discard(postings, key, line_id):
+        """Удаление из списка вхождений; True, если ключ исчез"""
+        ids = postings.get(key)
+        if ids is None:
+            return False
+        ids.discard(line_id)
+        if not ids:
+            del postings[key]
+            return True
+        return False
+
+    def search(self, query, mode=SEARCH_SUBSTRING, folder=None, limit=1000):
+        """Совпадения [SearchHit] по пути и номеру строки.
+
+        folder - искать только в чертежах этой папки (с подпапками). Ошибка
+        в регулярном выражении - re.error.
+        """
+        if mode == SEARCH_REGEX:
+            line_ids = self._match_regex(query)
+        elif mode == SEARCH_PREFIX:
+            line_ids = self._match_prefixes(query)
+        else:
+            line_ids = self._match_substring(query)
+        line_ids = set(line_ids)
+        if folder:
+            folder = os.path.join(os.path.normcase(os.path.abspath(folder)), "")
+        paths = set()
+        for line_id in line_ids:
+            paths.update(self._line_paths[line_id])
+        hits = []
+        for path in sorted(paths):
+            if folder and not os.path.normcase(path).startswith(folder):
+                continue
+            for line_id, line_no, text in self._documents[path]:
+                if line_id in line_ids:
+                    hits.append(SearchHit(path, line_no, text))
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+
+    def _match_substring(self, query):
+        query = normalize_tt_text(query)
+        if not query:
+            return []
+        if len(query) < 3:
+            candidates = self._line_ids.values()
+        else:
+            postings = sorted(
+                (self._trigrams.get(t, ()) for t in _trigrams(query)), key=len
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return [i for i in candidates if query in self._lines[i]]
+
+    def _match_prefixes(self, query):
+        prefixes = _WORD.findall(normalize_tt_text(query))
+        if not prefixes:
+            return []
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self._words)
+        result = None
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            ids = set()
+            words = self._sorted_words
+            i = bisect.bisect_left(words, prefix)
+            while i < len(words) and words[i].startswith(prefix):
+                ids.update(self._words[words[i]])
+                i += 1
+            result = ids if result is None else result & ids
+            if not result:
+                return []
+        return result
+
+    def _match_regex(self, query):
+        pattern = re.compile(query, re.IGNORECASE)
+        return [
+            line_id
+            for normalized, line_id in self._line_ids.items()
+            if pattern.search(normalized)
+        ]
@@ -0,0 +1,544 @@
+"""Слой сессии KOMPAS-3D: подключение, перечисление документов и доступ к ТТ.
+
+Модуль не зависит от Qt. Все объекты KOMPAS, выдаваемые сессией, обернуты в
+счетный прокси, который учитывает каждое чтение свойства, запись и вызов метода
+COM. Если к счетчику подключен профилировщик (kompas_profiler.ComProfiler),
+каждое обращение еще и замеряется; без него прокси только проверяет, что
+профилировщика нет. Бэкенд подключения подменяемый: ComBackend работает с
+живым KOMPAS через pywin32, FakeBackend (kompas_fake.py) - с моделью KOMPAS в
+памяти процесса.
+"""
+
+import functools
+import logging
+import time
+import types
+from contextlib import contextmanager
+
+logger = logging.getLogger("kompas")
+
+DOCUMENT_TYPE_NAMES = {
+    1: "Чертеж",
+    2: "Фрагмент",
+    3: "Спецификация",
+    4: "Модель",
+    5: "Сборка",
+}
+DRAWING_TYPE = 1
+UNSAVED_PATH = "Документ не сохранен"
+
+# Значения, которые COM возвращает "как есть" и которые не нужно оборачивать
+_PLAIN_TYPES = (str, bytes, int, float, bool, type(None), tuple, list, dict)
+_METHOD_TYPES = (types.MethodType, types.BuiltinMethodType, types.FunctionType)
+
+
+class ComCallCounter:
+    """Счетчик обращений к COM: чтения свойств, записи и вызовы методов"""
+
+    def __init__(self):
+        self.gets = 0
+        self.sets = 0
+        self.calls = 0
+        self.members = {}  # (вид, член) -> количество обращений
+        # действие -> [запусков, обращений всего, обращений в последнем]
+        self.actions = {}
+        # Замер времени обращений (kompas_profiler.ComProfiler); None - выключен
+        self.profiler = None
+
+    @property
+    def total(self):
+        return self.gets + self.sets + self.calls
+
+    def record(self, kind, member):
+        """Учет одного обращения: kind - "get", "set" или "call" """
+        if kind == "get":
+            self.gets += 1
+        elif kind == "set":
+            self.sets += 1
+        else:
+            self.calls += 1
+        key = (kind, member)
+        self.members[key] = self.members.get(key, 0) + 1
+
+    def invoke(self, kind, member, func, *args, owner=None):
+        """Обращение к COM func(*args): учет, при профилировании - и замер.
+
+        owner - объект KOMPAS, чей это член (профилировщик пишет "Тип.член").
+        """
+        self.record(kind, member)
+        if self.profiler is None:
+            return func(*args)
+        return self.profiled(kind, member, func, *args, owner=owner)
+
+    def profiled(self, kind, member, func, *args, owner=None):
+        """func(*args) с замером профилировщиком (обращение уже учтено)"""
+        profiler = self.profiler
+        if owner is not None:
+            member = profiler.member_name(owner, member)
+        return profiler.measure(kind, member, func, *args)
+
+    def reset(self):
+        self.gets = self.sets = self.calls = 0
+        self.members.clear()
+        self.actions.clear()
+
+    def snapshot(self):
+        """Текущие значения счетчиков в виде словаря"""
+        return {
+            "get": self.gets,
+            "set": self.sets,
+            "call": self.calls,
+            "total": self.total,
+        }
+
+    @contextmanager
+    def action(self, name):
+        """Отнесение всех обращений внутри блока к действию пользователя name"""
+        start = self.total
+        started_at = time.perf_counter()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_action(name)
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.end_action(name, started_at)
+            used = self.total - start
+            stats = self.actions.setdefault(name, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += used
+            stats[2] = used
+            logger.debug(
+                "%s: %d обращений к COM за %.1f мс",
+                name,
+                used,
+                (time.perf_counter() - started_at) * 1000,
+            )
+
+    def summary(self):
+        """Текстовый отчет по действиям и самым частым членам COM"""
+        lines = [
+            f"Обращений к COM: {self.total} "
+            f"(чтений {self.gets}, записей {self.sets}, вызовов {self.calls})"
+        ]
+        for name, (runs, total, last) in sorted(self.actions.items()):
+            lines.append(
+                f"  {name}: запусков {runs}, в среднем {total // max(runs, 1)}, "
+                f"последний {last}"
+            )
+        hottest = sorted(self.members.items(), key=lambda kv: kv[1], reverse=True)
+        for (kind, member), count in hottest[:10]:
+            lines.append(f"  {kind} {member}: {count}")
+        return "\n".join(lines)
+
+
+def com_action(name):
+    """Декоратор метода окна: обращения к COM внутри относятся к действию name.
+
+    Окно должно хранить сессию в атрибуте session. Лишние позиционные аргументы
+    сигналов Qt (например, checked от QAction.triggered) отбрасываются так же,
+    как это делает PyQt для недекорированных слотов.
+    """
+
+    def decorator(func):
+        code = func.__code__
+        max_args = None if code.co_flags & 0x04 else code.co_argcount - 1
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args]
+            with self.session.counter.action(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ComProxy:
+    """Прозрачная обертка над объектом KOMPAS, считающая обращения к COM"""
+
+    __slots__ = ("_target", "_counter")
+
+    def __init__(self, target, counter):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_counter", counter)
+
+    def __getattr__(self, name):
+        counter = self._counter
+        target = self._target
+        profiler = counter.profiler
+        if profiler is None:
+            value = getattr(target, name)
+        else:
+            started_at = time.perf_counter()
+            try:
+                value = getattr(target, name)
+            except Exception:
+                member = profiler.member_name(target, name)
+                profiler.add("get", member, started_at, time.perf_counter(), True)
+                raise
+        if isinstance(value, _METHOD_TYPES):
+            return _ComMethod(value, name, counter, target)
+        if not name.startswith("_"):
+            # Служебные атрибуты pywin32 (_oleobj_ и т.п.) не ходят в KOMPAS
+            counter.record("get", name)
+            if profiler is not None:
+                member = profiler.member_name(target, name)
+                profiler.add("get", member, started_at, time.perf_counter())
+        return wrap(value, counter)
+
+    def __setattr__(self, name, value):
+        counter = self._counter
+        counter.record("set", name)
+        target = self._target
+        if counter.profiler is None:
+            setattr(target, name, unwrap(value))
+        else:
+            counter.profiled(
+                "set", name, setattr, target, name, unwrap(value), owner=target
+            )
+
+    def __getitem__(self, key):
+        counter = self._counter
+        counter.record("get", "[]")
+        target = self._target
+        if counter.profiler is None:
+            return wrap(target[key], counter)
+        return wrap(
+            counter.profiled("get", "[]", target.__getitem__, key, owner=target),
+            counter,
+        )
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __eq__(self, other):
+        return self._target == unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"<ComProxy {self._target!r}>"
+
+
+class _ComMethod:
+    """Метод объекта KOMPAS: каждый вызов считается одним обращением"""
+
+    __slots__ = ("_method", "_name", "_counter", "_owner")
+
+    def __init__(self, method, name, counter, owner=None):
+        self._method = method
+        self._name = name
+        self._counter = counter
+        self._owner = owner
+
+    def __call__(self, *args, **kwargs):
+        counter = self._counter
+        counter.record("call", self._name)
+        args = [unwrap(arg) for arg in args]
+        kwargs = {key: unwrap(value) for key, value in kwargs.items()}
+        if counter.profiler is None:
+            return wrap(self._method(*args, **kwargs), counter)
+        method = self._method
+        if kwargs:
+            method = functools.partial(method, **kwargs)
+        return wrap(
+            counter.profiled("call", self._name, method, *args, owner=self._owner),
+            counter,
+        )
+
+
+def wrap(value, counter):
+    """Оборачивание объекта KOMPAS в счетный прокси (простые значения - как есть)"""
+    if isinstance(value, (_PLAIN_TYPES, ComProxy)):
+        return value
+    return ComProxy(value, counter)
+
+
+def unwrap(value):
+    """Исходный объект KOMPAS из-под прокси (для передачи в pywin32)"""
+    if isinstance(value, ComProxy):
+        return object.__getattribute__(value, "_target")
+    return value
+
+
+class ComBackend:
+    """Подключение к живому KOMPAS-3D через pywin32"""
+
+    name = "COM"
+
+    def initialize(self):
+        import pythoncom
+
+        pythoncom.CoInitialize()
+
+    def uninitialize(self):
+        import pythoncom
+
+        pythoncom.CoUninitialize()
+
+    def connect(self, launch=False):
+        """Получение (app7, module7, api7, const7); launch - показать запущенный KOMPAS"""
+        import win32com.client
+
+        app7 = win32com.client.Dispatch("Kompas.Application.7")
+        if launch:
+            app7.Visible = True
+            app7.HideMessage = True
+        return self.attach(app7)
+
+    def launch_instance(self):
+        """Запуск отдельного невидимого экземпляра KOMPAS (для пула процессов)"""
+        import win32com.client
+
+        app7 = win32com.client.DispatchEx("Kompas.Application.7")
+        app7.Visible = False
+        app7.HideMessage = True
+        return self.attach(app7)
+
+    def for_process(self):
+        """Независимый бэкенд для отдельного экземпляра KOMPAS.
+
+        Передается в дочерние процессы через pickle, поэтому без состояния.
+        """
+        return ComBackend()
+
+    def attach(self, app7):
+        """(app7, module7, api7, const7) для уже полученного объекта приложения"""
+        module7, api7, const7 = self.get_kompas_api7(app7)
+        return app7, module7, api7, const7
+
+    def get_kompas_api7(self, app7=None):
+        """Получение объектов API Kompas 3D версии 7"""
+        import pythoncom
+        from win32com.client import Dispatch, gencache
+
+        module = gencache.EnsureModule(
+            "{69AC2981-37C0-4379-84FD-5DD2F3C0A520}", 0, 1, 0
+        )
+        if app7 is None:
+            app7 = Dispatch("Kompas.Application.7")
+        api = module.IKompasAPIObject(
+            app7._oleobj_.QueryInterface(
+                module.IKompasAPIObject.CLSID, pythoncom.IID_IDispatch
+            )
+        )
+        const = gencache.EnsureModule(
+            "{75C9F5D0-B5B8-4526-8681-9903C567D2ED}", 0, 1, 0
+        ).constants
+        return module, api, const
+
+    def marshal(self, obj):
+        """Упаковка интерфейса в поток для передачи в другой поток (STA)"""
+        import pythoncom
+
+        oleobj = getattr(obj, "_oleobj_", obj)
+        return pythoncom.CoMarshalInterThreadInterfaceInStream(
+            pythoncom.IID_IDispatch, oleobj
+        )
+
+    def unmarshal(self, stream):
+        """Распаковка интерфейса из потока в текущем потоке (однократно)"""
+        import pythoncom
+        import win32com.client
+
+        oleobj = pythoncom.CoGetInterfaceAndReleaseStream(
+            stream, pythoncom.IID_IDispatch
+        )
+        return win32com.client.Dispatch(oleobj)
+
+    def query_interface(self, obj, iid):
+        """QueryInterface к IDispatch; при отсутствии интерфейса - исключение"""
+        import pythoncom
+
+        oleobj = getattr(obj, "_oleobj_", obj)
+        return oleobj.QueryInterface(iid, pythoncom.IID_IDispatch)
+
+    def document_2d(self, doc):
+        """Интерфейс ksDocument2D документа (API 5)"""
+        import win32com.client
+
+        return win32com.client.Dispatch(doc, "ksDocument2D")
+
+    def subscribe(self, obj, handler, doc_name=None):
+        """Подписка на события приложения (doc_name=None) или документа.
+
+        Возвращает объект-обработчик; его close() отключает точку подключения.
+        """
+        import win32com.client
+        from kompas_events import ApplicationEventSink, DocumentEventSink
+
+        sink_class = ApplicationEventSink if doc_name is None else DocumentEventSink
+        sink = win32com.client.WithEvents(obj, sink_class)
+        sink.handler = handler
+        sink.doc_name = doc_name
+        return sink
+
+
+class KompasSession:
+    """Сессия работы с KOMPAS-3D: владеет объектом приложения и интерфейсами API"""
+
+    def __init__(self, backend=None, counter=None):
+        self.backend = backend or ComBackend()
+        self.counter = counter or ComCallCounter()
+        self.app7 = None
+        self.module7 = None
+        self.api7 = None
+        self.const7 = None
+
+    @property
+    def is_connected(self):
+        return self.app7 is not None
+
+    def connect(self, launch=False):
+        """Подключение к KOMPAS-3D; исключения бэкенда пробрасываются вызывающему"""
+        return self._set_interfaces(*self.backend.connect(launch))
+
+    def launch_instance(self):
+        """Запуск собственного невидимого экземпляра KOMPAS"""
+        return self._set_interfaces(*self.backend.launch_instance())
+
+    def quit_instance(self):
+        """Закрытие экземпляра, запущенного launch_instance"""
+        try:
+            if self.app7 is not None:
+                self.app7.Quit()
+        finally:
+            self.disconnect()
+
+    def attach(self, app7):
+        """Подключение к объекту приложения, полученному из другого потока"""
+        return self._set_interfaces(*self.backend.attach(unwrap(app7)))
+
+    def _set_interfaces(self, app7, module7, api7, const7):
+        self.app7 = wrap(app7, self.counter)
+        # module7 - модуль gencache с классами интерфейсов, а не объект COM
+        self.module7 = module7
+        self.api7 = wrap(api7, self.counter)
+        self.const7 = const7
+        return self.app7
+
+    def marshal_application(self):
+        """Объект приложения, упакованный для передачи в другой поток"""
+        return self.backend.marshal(unwrap(self.app7))
+
+    def attach_marshalled(self, stream):
+        """Подключение по объекту приложения, упакованному в другом потоке"""
+        return self.attach(self.backend.unmarshal(stream))
+
+    def disconnect(self):
+        self.app7 = None
+        self.module7 = None
+        self.api7 = None
+        self.const7 = None
+
+    def application_name(self, full_name=False):
+        return self.app7.ApplicationName(FullName=full_name)
+
+    def application_version(self):
+        return self.app7.ApplicationVersion()
+
+    def documents(self):
+        """Перечисление открытых документов (пропускает пустые слоты)"""
+        documents = self.app7.Documents
+        for i in range(documents.Count):
+            doc = documents.Item(i)
+            if doc is None:
+                continue
+            yield doc
+
+    def open_document(self, path, visible=False, read_only=True):
+        """Открытие документа по пути (по умолчанию невидимо и только для чтения)"""
+        return self.app7.Documents.Open(path, visible, read_only)
+
+    def document_count(self):
+        return self.app7.Documents.Count
+
+    def active_document(self):
+        return self.app7.ActiveDocument
+
+    def find_document(self, doc_name):
+        """Поиск открытого документа по имени"""
+        for doc in self.documents():
+            if doc.Name == doc_name:
+                return doc
+        return None
+
+    def document_type(self, doc, doc_type_value=None):
+        """Определение типа документа по DocumentType с уточнением через интерфейсы.
+
+        doc_type_value - уже прочитанное значение DocumentType (экономит обращение).
+        """
+        try:
+            if doc_type_value is None:
+                doc_type_value = doc.DocumentType
+            if doc_type_value in DOCUMENT_TYPE_NAMES:
+                return DOCUMENT_TYPE_NAMES[doc_type_value]
+            return self._document_type_by_interfaces(doc, doc_type_value)
+        except Exception:
+            return "Неизвестный тип"
+
+    def _document_type_by_interfaces(self, doc, doc_type_value):
+        """Дополнительная проверка через интерфейсы для неизвестных типов"""
+        iids = self.module7.NamesToIIDMap
+        try:
+            self.query_interface(doc, iids["IDrawingDocument"])
+            return "Чертеж"
+        except Exception:
+            pass
+        try:
+            doc3d = self.query_interface(doc, iids["IDocument3D"])
+        except Exception:
+            try:
+                self.query_interface(doc, iids["ISpecificationDocument"])
+                return "Спецификация"
+            except Exception:
+                return f"Другой тип ({doc_type_value})"
+        try:
+            self.query_interface(doc3d, iids["IPart7"])
+            return "Деталь (3D-модель)"
+        except Exception:
+            pass
+        try:
+            self.query_interface(doc3d, iids["IAssembly7"])
+            return "Сборка (3D-модель)"
+        except Exception:
+            return "3D-модель (неизвестный тип)"
+
+    def query_interface(self, obj, iid):
+        return wrap(
+            self.counter.invoke(
+                "call", "QueryInterface", self.backend.query_interface, unwrap(obj), iid
+            ),
+            self.counter,
+        )
+
+    def drawing_document(self, doc):
+        """Интерфейс IDrawingDocument документа"""
+        return wrap(
+            self.counter.invoke(
+                "call", "IDrawingDocument", self.module7.IDrawingDocument, unwrap(doc)
+            ),
+            self.counter,
+        )
+
+    def technical_demand(self, doc):
+        """Технические требования чертежа (ITechnicalDemand)"""
+        return self.drawing_document(doc).TechnicalDemand
+
+    def subscribe_events(self, obj, handler, doc_name=None):
+        """Подписка на события KOMPAS: handler(event, doc_name)"""
+        return self.backend.subscribe(unwrap(obj), handler, doc_name)
+
+    def document_2d(self, doc):
+        """Интерфейс ksDocument2D документа для сохранения в другие форматы"""
+        return wrap(
+            self.counter.invoke(
+                "call", "Dispatch(ksDocument2D)", self.backend.document_2d, unwrap(doc)
+            ),
+            self.counter,
+        )
@@ -0,0 +1,419 @@
+"""База шаблонов ТТ (SQLite) для больших и общих библиотек.
+
+Вместо перезаписи всего templates.json правки редактора сохраняются
+построчно: добавленные, измененные, перемещенные и удаленные шаблоны - одной
+транзакцией, с записью в журнал изменений (кто, когда, что). Правки
+сравниваются со снимком, открытым в редакторе, поэтому изменения коллег,
+сделанные тем временем в других шаблонах, не затираются.
+
+Для поиска без загрузки всей библиотеки ведется полнотекстовый индекс FTS5
+по нормализованному тексту шаблона и вариантов; если SQLite собран без FTS5,
+поиск идет через LIKE. Журнал базы - обычный (не WAL), чтобы базу можно было
+держать в общей сетевой папке.
+
+Импорт и экспорт - в формате templates.json.
+"""
+
+import getpass
+import json
+import logging
+import re
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+from kompas_search import normalize_tt_text
+from kompas_templates import (
+    TEMPLATE_SEARCH_LIMIT,
+    Template,
+    Variant,
+    load_templates_file,
+    save_templates_file,
+)
+
+logger = logging.getLogger("kompas")
+
+TEMPLATE_STORE_FILE_NAME = "templates.sqlite3"
+SCHEMA_VERSION = 1
+
+CHANGE_ADD = "add"
+CHANGE_UPDATE = "update"
+CHANGE_DELETE = "delete"
+CHANGE_IMPORT = "import"
+
+CHANGE_NAMES = {
+    CHANGE_ADD: "Добавлен",
+    CHANGE_UPDATE: "Изменен",
+    CHANGE_DELETE: "Удален",
+    CHANGE_IMPORT: "Импорт",
+}
+
+# _MIGRATIONS[i] переводит схему из версии i в версию i + 1
+_MIGRATIONS = [
+    [
+        """
+        CREATE TABLE categories (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE templates (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            variants TEXT NOT NULL,
+            search_key TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE changes (
+            id INTEGER PRIMARY KEY,
+            changed_at REAL NOT NULL,
+            user TEXT,
+            action TEXT NOT NULL,
+            template_id INTEGER,
+            category TEXT,
+            text TEXT
+        )
+        """,
+    ],
+]
+
+# Полнотекстовый индекс создается отдельно: FTS5 есть не во всех сборках SQLite
+_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS templates_fts USING fts5(
+    search_key, content='templates', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 0'
+)
+"""
+# Триггеры, поддерживающие индекс при построчных изменениях
+_FTS_TRIGGERS = {
+    "templates_fts_insert": """
+    CREATE TRIGGER IF NOT EXISTS templates_fts_insert AFTER INSERT ON templates
+    BEGIN
+        INSERT INTO templates_fts (rowid, search_key)
+        VALUES (new.id, new.search_key);
+    END
+    """,
+    "templates_fts_delete": """
+    CREATE TRIGGER IF NOT EXISTS templates_fts_delete AFTER DELETE ON templates
+    BEGIN
+        INSERT INTO templates_fts (templates_fts, rowid, search_key)
+        VALUES ('delete', old.id, old.search_key);
+    END
+    """,
+    "templates_fts_update": """
+    CREATE TRIGGER IF NOT EXISTS templates_fts_update
+    AFTER UPDATE OF search_key ON templates BEGIN
+        INSERT INTO templates_fts (templates_fts, rowid, search_key)
+        VALUES ('delete', old.id, old.search_key);
+        INSERT INTO templates_fts (rowid, search_key)
+        VALUES (new.id, new.search_key);
+    END
+    """,
+}
+# Триггеры, отключаемые на время импорта
+_FTS_BULK_TRIGGERS = ("templates_fts_insert", "templates_fts_delete")
+
+_WORD = re.compile(r"\w+")
+
+TemplateChange = namedtuple(
+    "TemplateChange", ["changed_at", "user", "action", "category", "text"]
+)
+
+
+def variants_json(variants):
+    return json.dumps([variant.to_json() for variant in variants], ensure_ascii=False)
+
+
+class TemplateStore:
+    """Библиотека шаблонов в файле SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        self._migrate()
+        self.fts = self._prepare_fts()
+
+    def _migrate(self):
+        connection = self.connection
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            # В отличие от индекса ТТ, база - это данные: не пересоздается
+            raise RuntimeError(
+                f"База шаблонов {self.path} создана более новой версией программы"
+            )
+        for target in range(version, SCHEMA_VERSION):
+            with connection:
+                for statement in _MIGRATIONS[target]:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version={target + 1}")
+
+    def _prepare_fts(self):
+        try:
+            created = not self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'templates_fts'"
+            ).fetchone()
+            with self.connection as connection:
+                connection.execute("BEGIN")
+                connection.execute(_FTS_TABLE)
+                for statement in _FTS_TRIGGERS.values():
+                    connection.execute(statement)
+                if created:
+                    connection.execute(
+                        "INSERT INTO templates_fts (templates_fts) VALUES ('rebuild')"
+                    )
+            return True
+        except sqlite3.OperationalError as e:
+            logger.info("Полнотекстовый поиск по базе шаблонов недоступен: %s", e)
+            return False
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+    def load(self):
+        """{категория: [Template]} в сохраненном порядке"""
+        templates = {
+            sys.intern(name): []
+            for (name,) in self.connection.execute(
+                "SELECT name FROM categories ORDER BY position"
+            )
+        }
+        strings = {}
+        rows = self.connection.execute(
+            "SELECT id, category, text, variants, search_key FROM templates"
+            " ORDER BY position, id"
+        )
+        for template_id, category, text, variants, search_key in rows:
+            category = sys.intern(category)
+            templates.setdefault(category, []).append(
+                Template(
+                    category,
+                    text,
+                    self._variants(variants, strings),
+                    search_key,
+                    template_id,
+                )
+            )
+        return templates
+
+    @staticmethod
+    def _variants(data, strings):
+        variants = []
+        for item in json.loads(data):
+            variant = Variant.from_json(item)
+            variant.text = strings.setdefault(variant.text, variant.text)
+            variants.append(variant)
+        return variants
+
+    def search(self, query, limit=TEMPLATE_SEARCH_LIMIT):
+        """Шаблоны, содержащие слова, начинающиеся на слова запроса; лучшие первыми"""
+        words = _WORD.findall(normalize_tt_text(query))
+        if not words:
+            return []
+        if self.fts:
+            rows = self.connection.execute(
+                "SELECT t.id, t.category, t.text, t.variants, t.search_key"
+                " FROM templates_fts JOIN templates t ON t.id = templates_fts.rowid"
+                " WHERE templates_fts MATCH ? ORDER BY rank LIMIT ?",
+                (" ".join(f'"{word}"*' for word in words), limit),
+            )
+        else:
+            rows = self.connection.execute(
+                "SELECT id, category, text, variants, search_key FROM templates"
+                " WHERE "
+                + " AND ".join("search_key LIKE ?" for _ in words)
+                + " LIMIT ?",
+                [f"%{word}%" for word in words] + [limit],
+            )
+        strings = {}
+        return [
+            Template(category, text, self._variants(variants, strings), key, id_)
+            for id_, category, text, variants, key in rows
+        ]
+
+    def save_changes(self, old_templates, new_templates):
+        """Запись правок одной транзакцией; (добавлено, изменено, удалено).
+
+        new_templates - результат правки old_templates (снимка, открытого в
+        редакторе). Новым шаблонам присваивается id записи. Категории
+        добавляются и удаляются только те, что добавлены и удалены в редакторе.
+        Шаблон, который тем временем удалил другой пользователь, записывается
+        заново, если его правили; сдвинутый без правки - остается удаленным.
+        """
+        old = {}
+        for category, items in old_templates.items():
+            for position, template in enumerate(items):
+                if template.id is not None:
+                    old[template.id] = (category, position, template)
+        user = getpass.getuser()
+        now = time.time()
+        added = updated = 0
+        seen = set()
+        with self.connection as connection:
+            self._save_categories(connection, old_templates, new_templates)
+            for category, items in new_templates.items():
+                for position, template in enumerate(items):
+                    previous = old.get(template.id)
+                    if previous is None:
+                        template.id = self._insert(connection, position, template, now)
+                        self._log(connection, now, user, CHANGE_ADD, template)
+                        added += 1
+                        continue
+                    seen.add(template.id)
+                    old_category, old_position, old_template = previous
+                    if old_template is template and old_position == position:
+                        continue
+                    cursor = connection.execute(
+                        "UPDATE templates SET category = ?, position = ?, text = ?,"
+                        " variants = ?, search_key = ?, updated_at = ? WHERE id = ?",
+                        (
+                            template.category,
+                            position,
+                            template.text,
+                            variants_json(template.variants),
+                            template.search_key,
+                            now,
+                            template.id,
+                        ),
+                    )
+                    if not cursor.rowcount:
+                        # Запись тем временем удалили в другом окне
+                        if old_template is not template:
+                            template.id = self._insert(
+                                connection, position, template, now
+                            )
+                            self._log(connection, now, user, CHANGE_ADD, template)
+                            added += 1
+                        continue
+                    if old_template is not template:
+                        # Сдвиг позиции после удаления соседей в журнал не пишется
+                        self._log(connection, now, user, CHANGE_UPDATE, template)
+                        updated += 1
+            deleted = 0
+            for template_id, (_, _, template) in old.items():
+                if template_id in seen:
+                    continue
+                cursor = connection.execute(
+                    "DELETE FROM templates WHERE id = ?", (template_id,)
+                )
+                # Уже удаленный другим пользователем в журнал не пишется
+                if cursor.rowcount:
+                    self._log(connection, now, user, CHANGE_DELETE, template)
+                    deleted += 1
+        return added, updated, deleted
+
+    @staticmethod
+    def _save_categories(connection, old_templates, new_templates):
+        """Добавленные и удаленные в редакторе категории (чужие не трогаются)"""
+        removed = [name for name in old_templates if name not in new_templates]
+        connection.executemany(
+            "DELETE FROM categories WHERE name = ?", [(name,) for name in removed]
+        )
+        added = [name for name in new_templates if name not in old_templates]
+        if not added:
+            return
+        last = connection.execute(
+            "SELECT COALESCE(MAX(position), -1) FROM categories"
+        ).fetchone()[0]
+        connection.executemany(
+            "INSERT OR IGNORE INTO categories (name, position) VALUES (?, ?)",
+            [(name, last + 1 + i) for i, name in enumerate(added)],
+        )
+
+    def import_templates(self, templates):
+        """Замена содержимого базы шаблонами {категория: [Template]}"""
+        now = time.time()
+        with self.connection as connection:
+            connection.execute("BEGIN")
+            if self.fts:
+                # Индекс FTS5 быстрее перестроить целиком, чем вести по строкам
+                for name in _FTS_BULK_TRIGGERS:
+                    connection.execute(f"DROP TRIGGER {name}")
+            connection.execute("DELETE FROM templates")
+            connection.execute("DELETE FROM categories")
+            connection.executemany(
+                "INSERT INTO categories (name, position) VALUES (?, ?)",
+                [(name, i) for i, name in enumerate(templates)],
+            )
+            rows = []
+            for items in templates.values():
+                for position, template in enumerate(items):
+                    template.id = len(rows) + 1
+                    rows.append(
+                        (
+                            template.id,
+                            template.category,
+                            position,
+                            template.text,
+                            variants_json(template.variants),
+                            template.search_key,
+                            now,
+                        )
+                    )
+            connection.executemany(
+                "INSERT INTO templates"
+                " (id, category, position, text, variants, search_key, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            count = len(rows)
+            if self.fts:
+                connection.execute(
+                    "INSERT INTO templates_fts (templates_fts) VALUES ('rebuild')"
+                )
+                for name in _FTS_BULK_TRIGGERS:
+                    connection.execute(_FTS_TRIGGERS[name])
+            connection.execute(
+                "INSERT INTO changes (changed_at, user, action, text)"
+                " VALUES (?, ?, ?, ?)",
+                (now, getpass.getuser(), CHANGE_IMPORT, f"{count} шаблонов"),
+            )
+        return count
+
+    def import_json(self, path):
+        return self.import_templates(load_templates_file(path))
+
+    def export_json(self, path):
+        save_templates_file(path, self.load())
+
+    def changes(self, limit=500):
+        """Последние изменения [TemplateChange], новые первыми"""
+        rows = self.connection.execute(
+            "SELECT changed_at, user, action, category, text FROM changes"
+            " ORDER BY id DESC LIMIT ?",
+            (limit,),
+        )
+        return [TemplateChange(*row) for row in rows]
+
+    @staticmethod
+    def _insert(connection, position, template, now):
+        cursor = connection.execute(
+            "INSERT INTO templates"
+            " (category, position, text, variants, search_key, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                template.category,
+                position,
+                template.text,
+                variants_json(template.variants),
+                template.search_key,
+                now,
+            ),
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    def _log(connection, now, user, action, template):
+        connection.execute(
+            "INSERT INTO changes (changed_at, user, action, template_id, category,"
+            " text) VALUES (?, ?, ?, ?, ?, ?)",
+            (now, user, action, template.id, template.category, template.text),
+        )
@@ -0,0 +1,742 @@
+"""Модель шаблонов ТТ для вкладок окна.
+
+Все шаблоны лежат в одной модели списка; вкладки категорий и вкладка "Все" -
+фильтрующие прокси над ней, поэтому вкладки и списки создаются один раз при
+загрузке шаблонов.
+
+Поиск нечеткий: при загрузке строится индекс триграмм слов текста шаблона и
+его вариантов (слова дополняются пробелами по краям). Кандидаты оцениваются по
+доле триграмм запроса, найденных в шаблоне, поэтому опечатки, другие окончания
+и порядок слов ("поверхности шероховатость") не мешают найти шаблон. При равной
+доле выше шаблоны, содержащие запрос целиком, и более короткие; выдача
+ограничена лучшими TEMPLATE_SEARCH_LIMIT. Совпавшие слова подсвечиваются в
+списке.
+
+Измененный файл шаблонов применяется к модели по отличиям
+(TemplateListModel.apply_templates): меняются только затронутые строки и их
+записи в индексе поиска.
+"""
+
+import difflib
+import heapq
+import html
+import json
+import math
+import os
+import re
+import sys
+from collections import defaultdict
+
+from PyQt6.QtCore import (
+    QAbstractListModel,
+    QModelIndex,
+    QPointF,
+    QSortFilterProxyModel,
+    Qt,
+)
+from PyQt6.QtGui import QAbstractTextDocumentLayout, QPalette, QTextDocument
+from PyQt6.QtWidgets import QApplication, QStyle, QStyledItemDelegate
+
+from kompas_search import normalize_tt_text
+
+CategoryRole = Qt.ItemDataRole.UserRole + 1
+# Участки текста строки, совпавшие с запросом: [(начало, конец)]
+MatchSpansRole = Qt.ItemDataRole.UserRole + 2
+
+# Сколько лучших шаблонов показывать при поиске
+TEMPLATE_SEARCH_LIMIT = 200
+# Минимальная доля триграмм запроса, найденных в шаблоне
+FUZZY_MIN_SCORE = 0.5
+# Слово подсвечивается, если в запросе есть эта доля его триграмм
+HIGHLIGHT_MIN_SCORE = 0.5
+
+_WORD = re.compile(r"\w+")
+_WHITESPACE = re.compile(r"\s*")
+
+# Размер порции при чтении файла шаблонов, символов
+READ_CHUNK_SIZE = 1 << 16
+
+
+class Variant:
+    """Вариант окончания шаблона; placeholder - позиция "{}" или -1"""
+
+    __slots__ = ("text", "custom_input", "placeholder")
+
+    def __init__(self, text, custom_input=False):
+        self.text = text
+        self.custom_input = bool(custom_input)
+        self.placeholder = text.find("{}")
+
+    @classmethod
+    def from_json(cls, data):
+        if isinstance(data, dict):
+            return cls(str(data.get("text", "")), data.get("custom_input", False))
+        # Старый формат: вариант - строка
+        return cls(str(data))
+
+    def to_json(self):
+        return {"text": self.text, "custom_input": self.custom_input}
+
+    def fill(self, value):
+        """Текст варианта с value на месте "{}" """
+        if self.placeholder < 0:
+            return self.text
+        return self.text[: self.placeholder] + value + self.text[self.placeholder + 2 :]
+
+
+def template_search_key(text, variants):
+    return normalize_tt_text("\n".join([text] + [variant.text for variant in variants]))
+
+
+class Template:
+    """Шаблон ТТ с вариантами.
+
+    search_key - нормализованный текст для поиска, id - номер записи в базе
+    шаблонов (kompas_template_store) или None. Шаблон не изменяется после
+    создания: редактор заменяет его новым с тем же id.
+    """
+
+    __slots__ = ("category", "text", "variants", "search_key", "id")
+
+    def __init__(self, category, text, variants=(), search_key=None, id=None):
+        self.category = sys.intern(category)
+        self.text = text
+        self.variants = tuple(variants)
+        if search_key is None:
+            search_key = template_search_key(text, self.variants)
+        self.search_key = search_key
+        self.id = id
+
+    @classmethod
+    def from_json(cls, category, data, strings=None):
+        """Шаблон из записи templates.json (словарь или строка старого формата).
+
+        strings - словарь для хранения одинаковых текстов вариантов одним
+        объектом.
+        """
+        if not isinstance(data, dict):
+            return cls(category, str(data))
+        variants = []
+        for variant_data in data.get("variants") or ():
+            variant = Variant.from_json(variant_data)
+            if strings is not None:
+                variant.text = strings.setdefault(variant.text, variant.text)
+            variants.append(variant)
+        return cls(category, str(data.get("text", "")), variants)
+
+    def to_json(self):
+        return {
+            "text": self.text,
+            "variants": [variant.to_json() for variant in self.variants],
+        }
+
+
+def copy_templates(templates):
+    """Копия {категория: [Template]} для правки без влияния на оригинал"""
+    return {category: list(items) for category, items in templates.items()}
+
+
+def templates_from_json(data):
+    """{категория: [Template]} из разобранного templates.json"""
+    strings = {}
+    return {
+        sys.intern(category): [
+            Template.from_json(category, item, strings) for item in items
+        ]
+        for category, items in data.items()
+    }
+
+
+def templates_to_json(templates):
+    return {
+        category: [template.to_json() for template in category_templates]
+        for category, category_templates in templates.items()
+    }
+
+
+def read_templates(file, chunk_size=READ_CHUNK_SIZE):
+    """{категория: [Template]} из открытого templates.json.
+
+    Файл читается порциями, и в памяти одновременно находится только одна
+    запись шаблона в виде JSON, а не весь разобранный файл.
+    """
+    reader = _JsonReader(file, chunk_size)
+    strings = {}
+    templates = {}
+    reader.expect("{")
+    if reader.take("}"):
+        return templates
+    while True:
+        category = reader.value()
+        if not isinstance(category, str):
+            reader.fail("ожидалось имя категории")
+        category = sys.intern(category)
+        category_templates = templates.setdefault(category, [])
+        reader.expect(":")
+        reader.expect("[")
+        if not reader.take("]"):
+            while True:
+                category_templates.append(
+                    Template.from_json(category, reader.value(), strings)
+                )
+                if reader.take("]"):
+                    break
+                reader.expect(",")
+        if reader.take("}"):
+            break
+        reader.expect(",")
+    if reader.peek():
+        reader.fail("лишние данные после шаблонов")
+    return templates
+
+
+def load_templates_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return read_templates(f)
+
+
+def save_templates_file(path, templates):
+    """Запись через временный файл и переименование: читающий файл (в том
+    числе по сигналу QFileSystemWatcher) не увидит его недописанным"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(templates_to_json(templates), f, ensure_ascii=False, indent=4)
+    os.replace(temp_path, path)
+
+
+def template_keys(rows):
+    """Ключи шаблонов для сравнения списков: категория и номер записи в базе,
+    а без него - текст и номер повтора одинакового текста в категории"""
+    seen = defaultdict(int)
+    keys = []
+    for row in rows:
+        if row.id is not None:
+            keys.append((row.category, row.id))
+        else:
+            occurrence = seen[row.category, row.text]
+            seen[row.category, row.text] += 1
+            keys.append((row.category, row.text, occurrence))
+    return keys
+
+
+def same_template(left, right):
+    if left is right:
+        return True
+    # Ключ поиска включает тексты вариантов и отличается чаще всего
+    if left.search_key != right.search_key or len(left.variants) != len(right.variants):
+        return False
+    return left.text == right.text and all(
+        a.text == b.text and a.custom_input == b.custom_input
+        for a, b in zip(left.variants, right.variants)
+    )
+
+
+class _JsonReader:
+    """Разбор JSON по частям: структура верхних уровней - вручную, записи -
+    json.JSONDecoder.raw_decode по буферу, который дочитывается по мере нужды"""
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.offset = 0  # позиция начала буфера в файле
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _read(self):
+        """Дочитывание порции; прочитанная часть буфера отбрасывается"""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Следующий значимый символ ("" в конце файла)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._read():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def take(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.take(char):
+            self.fail(f"ожидался символ '{char}'")
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self._read():
+                    continue
+                self.pos = e.pos
+                self.fail(e.msg)
+            # Число на границе порции могло быть прочитано не полностью
+            if end == len(self.buffer) and self._read():
+                continue
+            self.pos = end
+            return value
+
+    def fail(self, message):
+        raise ValueError(
+            f"Неверный формат файла шаблонов (символ {self.offset + self.pos}): "
+            f"{message}"
+        )
+
+
+def word_trigrams(word):
+    padded = f" {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def text_trigrams(text, normalized=False):
+    """Триграммы слов нормализованного текста"""
+    words = _WORD.findall(text if normalized else normalize_tt_text(text))
+    if not words:
+        return set()
+    # Слова через два пробела: триграммы на стыке ("х  ", "  с") не связывают
+    # соседние слова, поэтому порядок слов не влияет на сходство
+    padded = f" {'  '.join(words)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def match_spans(text, query):
+    """Участки text, совпавшие с запросом: вхождения запроса и похожие слова"""
+    query_trigrams = text_trigrams(query)
+    query = normalize_tt_text(query)
+    spans = []
+    for match in _WORD.finditer(text):
+        trigrams = word_trigrams(normalize_tt_text(match.group()))
+        if len(trigrams & query_trigrams) >= HIGHLIGHT_MIN_SCORE * len(trigrams):
+            spans.append(match.span())
+    # Поиск подстроки в тексте без NFKC, чтобы не сбить позиции
+    lowered = text.lower().replace("ё", "е")
+    start = lowered.find(query) if query else -1
+    while start >= 0:
+        spans.append((start, start + len(query)))
+        start = lowered.find(query, start + 1)
+    return merge_spans(spans)
+
+
+def merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class TemplateSearchIndex:
+    """Индекс триграмм шаблонов для нечеткого поиска.
+
+    Вхождения триграммы хранятся битовой маской по номерам строк (int), и
+    число совпавших триграмм запроса для всех строк сразу считается сложением
+    масок по разрядам. Строки выбираются от большего числа совпадений к
+    меньшему, пока не наберется нужное количество.
+
+    Запрос из одного-двух символов может быть частью слова. Маска строк,
+    содержащих его, - объединение масок триграмм, в которые он входит: для
+    отдельных букв она строится вместе с индексом, для пар букв - при первом
+    таком запросе (short_bits).
+
+    Номер строки в индексе (слот) не меняется при добавлении и удалении
+    других строк: новые строки занимают слоты в конце, слоты удаленных
+    остаются пустыми.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.keys = [row.search_key for row in rows]
+        self.sizes = []  # число триграмм строки
+        postings = defaultdict(list)
+        categories = defaultdict(list)
+        for row_id, row in enumerate(rows):
+            trigrams = text_trigrams(row.search_key, normalized=True)
+            self.sizes.append(len(trigrams))
+            for trigram in trigrams:
+                postings[trigram].append(row_id)
+            categories[row.category].append(row_id)
+        self.bits = {trigram: _bitmask(ids) for trigram, ids in postings.items()}
+        self.category_bits = {
+            category: _bitmask(ids) for category, ids in categories.items()
+        }
+        self.all_bits = (1 << len(rows)) - 1
+        self.free = 0  # пустых слотов
+        self.short_bits = {}  # короткий запрос -> маска строк
+        for trigram, bits in self.bits.items():
+            for char in set(trigram) - {" "}:
+                self.short_bits[char] = self.short_bits.get(char, 0) | bits
+
+    def add(self, row):
+        """Добавление строки; номер ее слота"""
+        slot = len(self.rows)
+        bit = 1 << slot
+        trigrams = text_trigrams(row.search_key, normalized=True)
+        self.rows.append(row)
+        self.keys.append(row.search_key)
+        self.sizes.append(len(trigrams))
+        for trigram in trigrams:
+            self.bits[trigram] = self.bits.get(trigram, 0) | bit
+        for query in self.short_bits:
+            if query in row.search_key:
+                self.short_bits[query] |= bit
+        self.category_bits[row.category] = self.category_bits.get(row.category, 0) | bit
+        self.all_bits |= bit
+        return slot
+
+    def remove(self, slot):
+        row = self.rows[slot]
+        mask = ~(1 << slot)
+        for trigram in text_trigrams(row.search_key, normalized=True):
+            self.bits[trigram] &= mask
+        for query in self.short_bits:
+            self.short_bits[query] &= mask
+        self.category_bits[row.category] &= mask
+        self.all_bits &= mask
+        self.rows[slot] = None
+        self.keys[slot] = ""
+        self.free += 1
+
+    def short_mask(self, query):
+        """Маска строк, ключ которых содержит query (один-два символа)"""
+        mask = self.short_bits.get(query)
+        if mask is not None:
+            return mask
+        if _WORD.fullmatch(query):
+            # Часть слова входит хотя бы в одну его триграмму
+            mask = 0
+            for trigram, bits in self.bits.items():
+                if query in trigram:
+                    mask |= bits
+        else:
+            # Знаки препинания в триграммы не входят - просмотр ключей
+            mask = _bitmask(
+                [row_id for row_id, key in enumerate(self.keys) if query in key]
+            )
+        self.short_bits[query] = mask
+        return mask
+
+    def search(self, query, category=None, limit=TEMPLATE_SEARCH_LIMIT):
+        """Номера строк модели, лучшие первыми; category=None - все категории"""
+        normalized = normalize_tt_text(query)
+        query_trigrams = text_trigrams(normalized, normalized=True)
+        if not query_trigrams:
+            return []
+        allowed = (
+            self.all_bits if category is None else self.category_bits.get(category, 0)
+        )
+        # Разряды числа совпавших триграмм запроса для каждой строки
+        counter = _bit_counter(self.bits.get(t, 0) for t in query_trigrams)
+        size = len(query_trigrams)
+        needed = max(1, math.ceil(FUZZY_MIN_SCORE * size))
+        found = []
+        seen = 0
+        for count in range(size, needed - 1, -1):
+            mask = _at_least(counter, count, allowed)
+            found.extend((count, row_id) for row_id in _bit_ids(mask & ~seen))
+            seen |= mask
+            if len(found) >= limit:
+                break
+        if len(normalized) < 3 and len(found) < limit:
+            # Короткий запрос может быть частью слова
+            mask = self.short_mask(normalized) & allowed & ~seen
+            found.extend((0, row_id) for row_id in _bit_ids(mask, limit - len(found)))
+
+        def rank(item):
+            count, row_id = item
+            exact = normalized in self.keys[row_id]
+            # Доля триграмм запроса, запрос целиком, краткость шаблона
+            return (count, exact, count / (self.sizes[row_id] or 1))
+
+        return [row_id for _, row_id in heapq.nlargest(limit, found, key=rank)]
+
+
+def _bitmask(ids):
+    mask = bytearray(max(ids) // 8 + 1 if ids else 0)
+    for i in ids:
+        mask[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(mask, "little")
+
+
+_BYTE_BITS = [tuple(i for i in range(8) if value >> i & 1) for value in range(256)]
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def _bit_ids(mask, limit=None):
+    """Номера установленных битов маски (первые limit, если задано)"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    if limit is None:
+        return [
+            match.start() * 8 + bit
+            for match in _NONZERO_BYTE.finditer(data)
+            for bit in _BYTE_BITS[data[match.start()]]
+        ]
+    ids = []
+    for match in _NONZERO_BYTE.finditer(data):
+        ids.extend(match.start() * 8 + bit for bit in _BYTE_BITS[data[match.start()]])
+        if len(ids) >= limit:
+            return ids[:limit]
+    return ids
+
+
+def _bit_counter(masks):
+    """Сложение масок по разрядам: planes[k] - k-й бит счетчика каждой строки"""
+    planes = []
+    for carry in masks:
+        k = 0
+        while carry:
+            if k == len(planes):
+                planes.append(carry)
+                break
+            planes[k], carry = planes[k] ^ carry, planes[k] & carry
+            k += 1
+    return planes
+
+
+def _at_least(planes, value, allowed):
+    """Маска строк из allowed, у которых счетчик не меньше value"""
+    greater = 0
+    equal = allowed
+    for k in reversed(range(max(len(planes), value.bit_length()))):
+        plane = planes[k] if k < len(planes) else 0
+        if value >> k & 1:
+            equal &= plane
+        else:
+            greater |= equal & plane
+            equal &= ~plane
+    return greater | equal
+
+
+class TemplateListModel(QAbstractListModel):
+    """Все шаблоны (Template) всех категорий одним списком"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.set_search_index()
+
+    def set_search_index(self):
+        self.search_index = TemplateSearchIndex(list(self.rows))
+        # Слот индекса каждой строки; None - слоты совпадают с номерами строк
+        self.slots = list(range(len(self.rows)))
+        self._slot_rows = None
+
+    def set_templates(self, templates):
+        """templates - {категория: [Template]}"""
+        self.beginResetModel()
+        self.rows = [
+            template
+            for category_templates in templates.values()
+            for template in category_templates
+        ]
+        self.set_search_index()
+        self.endResetModel()
+
+    def apply_templates(self, templates):
+        """Замена шаблонов с изменением только отличающихся строк.
+
+        Списки шаблонов сравниваются по ключам (template_keys): удаленные и
+        добавленные шаблоны удаляются и вставляются строками, измененные
+        заменяются на месте, поэтому списки сохраняют прокрутку и выделение.
+        Возвращает (добавлено, удалено, изменено).
+        """
+        new_rows = [
+            template
+            for category_templates in templates.values()
+            for template in category_templates
+        ]
+        matcher = difflib.SequenceMatcher(
+            None, template_keys(self.rows), template_keys(new_rows), autojunk=False
+        )
+        added = removed = changed = 0
+        # С конца: номера строк еще не обработанных участков не сдвигаются
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == "equal":
+                for row, template in zip(range(i1, i2), new_rows[j1:j2]):
+                    if not same_template(self.rows[row], template):
+                        changed += 1
+                        self.search_index.remove(self.slots[row])
+                        self.slots[row] = self.search_index.add(template)
+                        self.rows[row] = template
+                        index = self.index(row)
+                        self.dataChanged.emit(index, index)
+                    else:
+                        self.rows[row] = template
+                continue
+            if i2 > i1:
+                self.beginRemoveRows(QModelIndex(), i1, i2 - 1)
+                for slot in self.slots[i1:i2]:
+                    self.search_index.remove(slot)
+                del self.rows[i1:i2]
+                del self.slots[i1:i2]
+                self.endRemoveRows()
+                removed += i2 - i1
+            if j2 > j1:
+                self.beginInsertRows(QModelIndex(), i1, i1 + j2 - j1 - 1)
+                self.rows[i1:i1] = new_rows[j1:j2]
+                self.slots[i1:i1] = [
+                    self.search_index.add(template) for template in new_rows[j1:j2]
+                ]
+                self.endInsertRows()
+                added += j2 - j1
+
+        if added or removed or changed:
+            if self.search_index.free > len(self.rows):
+                # Пустых слотов больше, чем строк - индекс строится заново
+                self.set_search_index()
+            else:
+                self._slot_rows = {slot: row for row, slot in enumerate(self.slots)}
+        return added, removed, changed
+
+    def search(self, query, category=None, limit=TEMPLATE_SEARCH_LIMIT):
+        """Номера строк модели, лучшие первыми"""
+        slots = self.search_index.search(query, category, limit)
+        if self._slot_rows is None:
+            return slots
+        return [self._slot_rows[slot] for slot in slots]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return row.text
+        if role == Qt.ItemDataRole.UserRole:
+            return row
+        if role == CategoryRole:
+            return row.category
+        return None
+
+
+class TemplateFilterProxy(QSortFilterProxyModel):
+    """Шаблоны одной категории (category=None - всех) с нечетким поиском.
+
+    При поиске показываются только найденные шаблоны в порядке убывания
+    сходства, без поиска - все в порядке файла.
+    """
+
+    def __init__(self, category=None, parent=None):
+        super().__init__(parent)
+        self.category = category
+        self.search_term = ""
+        self.ranks = {}  # номер строки модели -> место в выдаче
+        self._spans = {}
+
+    def set_search_term(self, search_term):
+        search_term = search_term or ""
+        if search_term == self.search_term:
+            return
+        self.search_term = search_term
+        found = self.sourceModel().search(search_term, self.category)
+        self.ranks = {row_id: rank for rank, row_id in enumerate(found)}
+        self._spans = {}
+        self.invalidate()
+        self.sort(0 if search_term else -1)
+
+    def refresh(self):
+        """Повтор поиска после изменения строк модели (номера строк сдвигаются)"""
+        if not self.search_term:
+            return
+        found = self.sourceModel().search(self.search_term, self.category)
+        self.ranks = {row_id: rank for rank, row_id in enumerate(found)}
+        self._spans = {}
+        self.invalidate()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.search_term:
+            return source_row in self.ranks
+        row = self.sourceModel().rows[source_row]
+        return self.category is None or row.category == self.category
+
+    def lessThan(self, left, right):
+        return self.ranks.get(left.row(), 0) < self.ranks.get(right.row(), 0)
+
+    def display_text(self, source_row):
+        row = self.sourceModel().rows[source_row]
+        if self.category is None:
+            return f"[{row.category}] {row.text}"
+        return row.text
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.display_text(self.mapToSource(index).row())
+        if role == MatchSpansRole:
+            if not self.search_term:
+                return []
+            # Подсветка считается только для показанных строк
+            source_row = self.mapToSource(index).row()
+            spans = self._spans.get(source_row)
+            if spans is None:
+                spans = match_spans(self.display_text(source_row), self.search_term)
+                self._spans[source_row] = spans
+            return spans
+        return super().data(index, role)
+
+
+class TemplateItemDelegate(QStyledItemDelegate):
+    """Строка шаблона с подсветкой совпавших с запросом участков"""
+
+    def paint(self, painter, option, index):
+        spans = index.data(MatchSpansRole)
+        if not spans:
+            super().paint(painter, option, index)
+            return
+        self.initStyleOption(option, index)
+        text = option.text
+        option.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_ItemViewItem, option, painter)
+
+        parts = []
+        position = 0
+        for start, end in spans:
+            parts.append(html.escape(text[position:start]))
+            parts.append(f"<b><u>{html.escape(text[start:end])}</u></b>")
+            position = end
+        parts.append(html.escape(text[position:]))
+        document = QTextDocument()
+        document.setDefaultFont(option.font)
+        document.setDocumentMargin(0)
+        document.setHtml("".join(parts).replace("\n", "<br>"))
+
+        text_rect = style.subElementRect(
+            QStyle.SubElement.SE_ItemViewItemText, option, option.widget
+        )
+        context = QAbstractTextDocumentLayout.PaintContext()
+        selected = option.state & QStyle.StateFlag.State_Selected
+        context.palette.setColor(
+            QPalette.ColorRole.Text,
+            option.palette.color(
+                QPalette.ColorRole.HighlightedText
+                if selected
+                else QPalette.ColorRole.Text
+            ),
+        )
+        painter.save()
+        painter.translate(
+            QPointF(
+                text_rect.left(),
+                text_rect.top() + (text_rect.height() - document.size().height()) / 2,
+            )
+        )
+        painter.setClipRect(text_rect.translated(-text_rect.topLeft()))
+        document.documentLayout().draw(painter, context)
+        painter.restore()
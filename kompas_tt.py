@@ -0,0 +1,267 @@
+"""Чтение и запись текста технических требований KOMPAS-3D.
+
+ТТ представлены списком строк (текст, нумерация), где нумерация - значение
+ITextLine.Numbering (1 - нумерованный пункт, 0 - продолжение пункта).
+
+Запись идет по разнице: текущие строки читаются один раз, по ним строится
+минимальный сценарий правок (оставить, заменить текст, переключить нумерацию,
+удалить, добавить), и в KOMPAS уходит только он. Если содержимое совпадает,
+в документ ничего не пишется.
+"""
+
+import hashlib
+import logging
+import re
+from collections import namedtuple
+
+logger = logging.getLogger("kompas")
+
+OP_KEEP = "keep"
+OP_TEXT = "text"
+OP_NUMBERING = "numbering"
+OP_REPLACE = "replace"
+OP_DELETE = "delete"
+OP_INSERT = "insert"
+
+# index - номер строки в текущем тексте (для OP_INSERT - None: строка
+# добавляется в конец, других способов вставки у IText нет)
+TTEdit = namedtuple("TTEdit", ["op", "index", "text", "numbering"])
+
+# Цена правок в обращениях к COM: получение строки + запись свойств
+_COST_SET = 2
+_COST_REPLACE = 3
+_COST_DELETE = 2
+_COST_INSERT = 3
+
+
+def editor_text_to_lines(text_content, auto_numbering=False):
+    """Строки ТТ из текста редактора: [(текст, нумерация)]"""
+    lines = [line.strip() for line in text_content.split("\n") if line.strip()]
+    processed_lines = []
+
+    if auto_numbering:
+        for i, line in enumerate(lines):
+            clean_line = re.sub(r"^\d+\.\s*", "", line).lstrip()
+            is_continuation = i > 0 and (
+                (len(clean_line) > 0 and clean_line[0].islower())
+                or clean_line.startswith("-")
+                or clean_line.startswith("–")
+            )
+            processed_lines.append((clean_line, 0 if is_continuation else 1))
+    else:
+        for line in lines:
+            num_match = re.match(r"^(\d+)\.\s*(.*)", line)
+            if num_match:
+                processed_lines.append((num_match.group(2).strip(), 1))
+                continue
+            indent_match = re.match(r"^\s+(.+)", line)
+            if indent_match:
+                processed_lines.append((indent_match.group(1).strip(), 0))
+            else:
+                processed_lines.append((line, 1))
+
+    if len(processed_lines) == 1:
+        # Для единственного пункта отключаем нумерацию
+        processed_lines[0] = (processed_lines[0][0], 0)
+    return processed_lines
+
+
+def read_tt_lines(text_obj):
+    """Текущие строки ТТ одним проходом: ([(текст, нумерация)], [ITextLine]).
+
+    Количество строк и коллекция TextLines запрашиваются один раз. Текст всех
+    строк по возможности берется одним чтением IText.Str, тогда у строк
+    читается только нумерация.
+    """
+    count = text_obj.Count
+    if not count:
+        return [], []
+    texts = _read_bulk_text(text_obj, count)
+    text_lines = text_obj.TextLines
+    values = []
+    objects = []
+    for i in range(count):
+        line = text_lines[i]
+        line_text = texts[i] if texts is not None else line.Str
+        values.append((line_text, line.Numbering))
+        objects.append(line)
+    return values, objects
+
+
+def _read_bulk_text(text_obj, count):
+    """Текст всех строк одним обращением или None, если так прочитать нельзя"""
+    try:
+        bulk = text_obj.Str
+    except Exception:
+        return None
+    if not isinstance(bulk, str):
+        return None
+    texts = bulk.splitlines()
+    # Разбиение должно совпадать со строками TextLines, иначе читаем построчно
+    if len(texts) != count:
+        return None
+    return texts
+
+
+def format_tt_lines(lines):
+    """Текст ТТ для редактора из строк [(текст, нумерация)].
+
+    Нумерованная строка начинает новый пункт, ненумерованная продолжает
+    текущий (пробелы вокруг тире сохраняются). Пустые строки пропускаются.
+    """
+    items = []  # части текста каждого пункта
+    for line_text, numbering in lines:
+        if not line_text.strip():  # Пропускаем пустые строки
+            continue
+        if numbering == 1 or not items:
+            # Новый нумерованный пункт (или первая строка без нумерации)
+            items.append([line_text])
+            continue
+        parts = items[-1]
+        last_char = parts[-1][-1]
+        first_char = line_text[0]
+        # Проверяем, нужно ли добавить пробел
+        if (
+            last_char not in (" ", "-")  # Последний символ не пробел и не тире
+            and first_char != "-"  # Новая строка не начинается с тире
+            and not line_text.startswith(" -")  # и не начинается с " -"
+        ):
+            parts.append(" ")
+        # Если строка начинается с тире без пробела перед ним, добавляем пробел
+        elif first_char == "-" and last_char != " ":
+            parts.append(" ")
+        parts.append(line_text)
+    return "\n".join(
+        f"{number}. {''.join(parts).rstrip()}" for number, parts in enumerate(items, 1)
+    )
+
+
+def tt_hash(lines):
+    """Хеш содержания ТТ [(текст, нумерация)]: пункты и их порядок.
+
+    Строки продолжения склеиваются с пунктом, пробелы не учитываются, поэтому
+    ТТ из чертежа и тот же текст из редактора дают одинаковый хеш.
+    """
+    return formatted_tt_hash(format_tt_lines(lines))
+
+
+def formatted_tt_hash(text):
+    """tt_hash() по тексту, уже собранному format_tt_lines()"""
+    normalized = "\n".join(" ".join(item.split()) for item in text.split("\n"))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _edit_cost(old, new):
+    if old[0] != new[0]:
+        return _COST_SET if old[1] == new[1] else _COST_REPLACE
+    return 0 if old[1] == new[1] else _COST_SET
+
+
+def diff_tt_lines(old_lines, new_lines):
+    """Минимальный по числу обращений к COM сценарий правок old -> new.
+
+    Строки старого текста либо остаются на месте (с правкой текста и/или
+    нумерации), либо удаляются; недостающие строки добавляются в конец.
+    """
+    old_lines = [(text, int(numbering or 0)) for text, numbering in old_lines]
+    n, m = len(old_lines), len(new_lines)
+    # cost[i][j] - цена превращения old[i:] в new[j:]
+    cost = [[0] * (m + 1) for _ in range(n + 1)]
+    for j in range(m - 1, -1, -1):
+        cost[n][j] = cost[n][j + 1] + _COST_INSERT
+    for i in range(n - 1, -1, -1):
+        cost[i][m] = cost[i + 1][m] + _COST_DELETE
+        for j in range(m - 1, -1, -1):
+            cost[i][j] = min(
+                cost[i + 1][j] + _COST_DELETE,
+                cost[i + 1][j + 1] + _edit_cost(old_lines[i], new_lines[j]),
+            )
+
+    edits = []
+    i = j = 0
+    while i < n and j < m:
+        pair_cost = _edit_cost(old_lines[i], new_lines[j])
+        if cost[i][j] == cost[i + 1][j + 1] + pair_cost:
+            text, numbering = new_lines[j]
+            old_text, old_numbering = old_lines[i]
+            if not pair_cost:
+                op = OP_KEEP
+            elif old_text != text and old_numbering != numbering:
+                op = OP_REPLACE
+            elif old_text != text:
+                op = OP_TEXT
+            else:
+                op = OP_NUMBERING
+            edits.append(TTEdit(op, i, text, numbering))
+            i += 1
+            j += 1
+        else:
+            edits.append(TTEdit(OP_DELETE, i, None, None))
+            i += 1
+    for k in range(i, n):
+        edits.append(TTEdit(OP_DELETE, k, None, None))
+    for k in range(j, m):
+        text, numbering = new_lines[k]
+        edits.append(TTEdit(OP_INSERT, None, text, numbering))
+    return edits
+
+
+def apply_tt_edits(text_obj, edits, line_objects):
+    """Применение сценария правок; line_objects - строки ITextLine до правок"""
+    applied = 0
+    # Объект строки KOMPAS может быть привязан к номеру строки, а не к ней
+    # самой. Поэтому правки и удаления идут с конца: удаление сдвигает только
+    # строки после удаленной, а они уже обработаны. Добавление - в конец.
+    changes = [edit for edit in edits if edit.op not in (OP_KEEP, OP_INSERT)]
+    changes.sort(key=lambda edit: edit.index, reverse=True)
+    for edit in changes:
+        line = line_objects[edit.index]
+        if edit.op == OP_DELETE:
+            line.Delete()
+        elif edit.op == OP_TEXT:
+            line.Str = edit.text
+        elif edit.op == OP_NUMBERING:
+            line.Numbering = edit.numbering
+        else:
+            line.Str = edit.text
+            line.Numbering = edit.numbering
+        applied += 1
+    for edit in edits:
+        if edit.op == OP_INSERT:
+            line = text_obj.Add()
+            line.Str = edit.text
+            line.Numbering = edit.numbering
+            applied += 1
+    return applied
+
+
+def rewrite_tt_lines(text_obj, new_lines):
+    """Полная перезапись ТТ: удаление всех строк и добавление новых"""
+    while text_obj.Count > 0:
+        text_obj.TextLines[0].Delete()
+    for line_text, numbering in new_lines:
+        try:
+            text_line = text_obj.Add()
+            text_line.Str = line_text
+            text_line.Numbering = numbering
+        except Exception as line_error:
+            logger.error("Ошибка при добавлении строки '%s': %s", line_text, line_error)
+    return len(new_lines)
+
+
+def write_tt_lines(text_obj, new_lines, current=None):
+    """Запись строк ТТ по разнице с текущими; возвращает число правок.
+
+    current - уже прочитанный read_tt_lines(text_obj), чтобы не читать снова.
+    Если правка по разнице не удалась (например, версия KOMPAS не дает
+    записывать Str существующей строки), ТТ перезаписываются целиком.
+    """
+    old_lines, line_objects = (
+        current if current is not None else read_tt_lines(text_obj)
+    )
+    edits = diff_tt_lines(old_lines, new_lines)
+    try:
+        return apply_tt_edits(text_obj, edits, line_objects)
+    except Exception as e:
+        logger.warning("Правка ТТ по разнице не удалась, полная перезапись: %s", e)
+        return rewrite_tt_lines(text_obj, new_lines)
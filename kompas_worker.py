@@ -0,0 +1,343 @@
+"""Фоновый поток для обращений к KOMPAS-3D.
+
+Поток инициализирует COM как STA и владеет своей сессией KOMPAS: подключение
+(включая запуск KOMPAS) выполняется в нем, а объект приложения передается
+потоку окна через CoMarshalInterThreadInterfaceInStream. Окно ставит задания в
+очередь с приоритетом и получает результат, прогресс и ошибки сигналами Qt -
+цикл событий окна не ждет KOMPAS.
+
+Интерактивные задания (загрузка ТТ активного документа, подключение) идут
+раньше пакетных, фоновые (чтение ТТ впрок) - после всех. Пакетное задание вызывает ctx.checkpoint() между документами:
+ожидающие задания с более высоким приоритетом выполняются сразу, не дожидаясь
+конца пакета.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+from collections import namedtuple
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from kompas_buffers import TT_NO_DOCUMENT, DocumentTT, read_document_tt
+from kompas_batch import BATCH_ISSUES, BATCH_OK
+from kompas_checks import issue_messages, validate_tt_texts
+from kompas_ready import call_when_ready
+from kompas_session import DRAWING_TYPE, KompasSession
+from kompas_tt import format_tt_lines, read_tt_lines
+
+logger = logging.getLogger("kompas")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BATCH = 20
+# Подготовка данных впрок (буферы ТТ): после всех остальных заданий
+PRIORITY_BACKGROUND = 30
+
+# issues - {имя: [TTIssue]}, cancelled - проверены не все чертежи
+TTCheckResult = namedtuple("TTCheckResult", ["issues", "cancelled"])
+
+
+class JobCancelled(Exception):
+    """Задание отменено до завершения"""
+
+
+class Job:
+    __slots__ = ("job_id", "name", "priority", "func", "args", "cancelled", "batch")
+
+    def __init__(self, job_id, name, priority, func, args, batch=None):
+        self.job_id = job_id
+        self.name = name
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.cancelled = False
+        self.batch = batch  # BatchRun пакетной операции
+
+
+class JobContext:
+    """То, что задание получает первым аргументом: сессия, прогресс, отмена"""
+
+    def __init__(self, worker, job):
+        self.worker = worker
+        self.job = job
+        self.session = worker.session
+
+    @property
+    def cancelled(self):
+        return self.job.cancelled
+
+    def check_cancelled(self):
+        if self.job.cancelled:
+            raise JobCancelled(self.job.name)
+
+    def progress(self, done, total, message=""):
+        self.worker.job_progress.emit(self.job.job_id, done, total, message)
+
+    def report(self, name, status, detail=""):
+        """Результат по документу - в BatchRun задания (BATCH_* из kompas_batch)"""
+        if self.job.batch is not None:
+            self.job.batch.record(name, status, detail)
+
+    def checkpoint(self):
+        """Точка прерывания пакета: выполнить срочные задания, проверить отмену"""
+        self.worker.run_pending(self.job.priority)
+        self.check_cancelled()
+
+
+class ComWorker(QObject):
+    """Поток STA с очередью заданий к KOMPAS.
+
+    Задание - функция func(ctx, *args), выполняемая в потоке; ее результат
+    передается в on_result в потоке окна, исключение - в on_error.
+    """
+
+    job_started = pyqtSignal(int, str)
+    job_progress = pyqtSignal(int, int, int, str)
+    job_finished = pyqtSignal(int, object)
+    job_failed = pyqtSignal(int, object)
+
+    def __init__(self, backend, parent=None):
+        super().__init__(parent)
+        self.session = KompasSession(backend)
+        self._queue = []
+        self._condition = threading.Condition()
+        self._ids = itertools.count(1)
+        self._callbacks = {}  # job_id -> (on_result, on_error, on_progress)
+        self._jobs = {}
+        self._stopping = False
+        self._thread = None
+        # Сигналы из потока заданий доставляются в поток окна (queued)
+        self.job_progress.connect(self._deliver_progress)
+        self.job_finished.connect(self._deliver_result)
+        self.job_failed.connect(self._deliver_error)
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="kompas-com", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Остановка потока: текущее задание дорабатывает, очередь отменяется"""
+        with self._condition:
+            self._stopping = True
+            for _, _, job in self._queue:
+                job.cancelled = True
+            self._queue = []
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(
+        self,
+        func,
+        *args,
+        priority=PRIORITY_NORMAL,
+        name=None,
+        on_result=None,
+        on_error=None,
+        on_progress=None,
+        batch=None,
+    ):
+        """Постановка задания в очередь; возвращает номер задания.
+
+        batch - BatchRun, куда задание пишет результаты (ctx.report).
+        """
+        job = Job(next(self._ids), name or func.__name__, priority, func, args, batch)
+        self._callbacks[job.job_id] = (on_result, on_error, on_progress)
+        with self._condition:
+            self._jobs[job.job_id] = job
+            heapq.heappush(self._queue, (priority, job.job_id, job))
+            self._condition.notify()
+        return job.job_id
+
+    def cancel(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.cancelled = True
+
+    def pending_count(self):
+        with self._condition:
+            return len(self._queue)
+
+    def _run(self):
+        self.session.backend.initialize()
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    break
+                self._execute(job)
+        finally:
+            self.session.disconnect()
+            self.session.backend.uninitialize()
+
+    def _next_job(self, below=None):
+        """Следующее задание; below - только с приоритетом выше заданного"""
+        with self._condition:
+            while below is None and not self._queue and not self._stopping:
+                self._condition.wait()
+            if self._stopping or not self._queue:
+                return None
+            if below is not None and self._queue[0][0] >= below:
+                return None
+            return heapq.heappop(self._queue)[2]
+
+    def run_pending(self, priority):
+        """Выполнение ожидающих заданий с приоритетом выше priority"""
+        while True:
+            job = self._next_job(below=priority)
+            if job is None:
+                return
+            self._execute(job)
+
+    def _execute(self, job):
+        try:
+            if job.cancelled:
+                raise JobCancelled(job.name)
+            self.job_started.emit(job.job_id, job.name)
+            with self.session.counter.action(job.name):
+                result = job.func(JobContext(self, job), *job.args)
+        except Exception as e:
+            logger.debug("Задание %s завершилось ошибкой: %s", job.name, e)
+            self.job_failed.emit(job.job_id, e)
+        else:
+            self.job_finished.emit(job.job_id, result)
+        finally:
+            with self._condition:
+                self._jobs.pop(job.job_id, None)
+
+    def _deliver_progress(self, job_id, done, total, message):
+        on_progress = self._callbacks.get(job_id, (None, None, None))[2]
+        if on_progress is not None:
+            on_progress(done, total, message)
+
+    def _deliver_result(self, job_id, result):
+        on_result = self._callbacks.pop(job_id, (None, None, None))[0]
+        if on_result is not None:
+            on_result(result)
+
+    def _deliver_error(self, job_id, error):
+        on_error = self._callbacks.pop(job_id, (None, None, None))[1]
+        if on_error is not None:
+            on_error(error)
+        elif not isinstance(error, JobCancelled):
+            logger.warning("Ошибка фонового задания: %s", error)
+
+
+# Задания. Выполняются в потоке ComWorker и не обращаются к виджетам.
+
+
+def connect_job(ctx):
+    """Подключение к запущенному KOMPAS, при неудаче - запуск.
+
+    Возвращает (упакованный объект приложения, был ли KOMPAS запущен).
+    """
+    session = ctx.session
+    try:
+        session.connect()
+        session.application_name()
+        launched = False
+    except Exception:
+        ctx.progress(0, 0, "Попытка запуска KOMPAS-3D...")
+        session.disconnect()
+        session.connect(launch=True)
+        session.application_name()
+        launched = True
+    return session.marshal_application(), launched
+
+
+def disconnect_job(ctx):
+    ctx.session.disconnect()
+
+
+def read_active_tt_job(ctx, create=True):
+    """ТТ активного документа: DocumentTT.
+
+    Состояние: TT_NO_DOCUMENT, TT_CREATED (ТТ не было - созданы пустые,
+    только при create), TT_MISSING, TT_EMPTY или TT_LOADED.
+    """
+    doc = ctx.session.active_document()
+    if not doc:
+        return DocumentTT(None, None, None, TT_NO_DOCUMENT, "")
+    return read_document_tt(ctx.session, doc, create=create)
+
+
+def read_document_lines(session, doc):
+    """Строки ТТ чертежа; [] - ТТ нет"""
+    tech_demand = session.technical_demand(doc)
+    return read_tt_lines(tech_demand.Text)[0] if tech_demand.IsCreated else []
+
+
+def read_drawings_tt_job(ctx, index=None, texts=None):
+    """ТТ всех открытых чертежей: {имя: текст или None, если ТТ нет}.
+
+    Документы не активируются: IDrawingDocument доступен и у неактивного.
+    index - TTIndex: у сохраненных и не измененных в KOMPAS чертежей ТТ
+    берутся из него, если файл не менялся; прочитанные ТТ записываются в него.
+    texts - словарь для результата: при отмене в нем остается прочитанное.
+    """
+    drawings = [
+        doc for doc in ctx.session.documents() if doc.DocumentType == DRAWING_TYPE
+    ]
+    texts = {} if texts is None else texts
+    try:
+        for i, doc in enumerate(drawings):
+            ctx.checkpoint()
+            name = doc.Name
+            ctx.progress(i, len(drawings), f"Проверка ТТ: {name}")
+            path = doc.PathName if index is not None and not doc.Changed else ""
+            entry = index.lookup(path) if path else None
+            if entry is not None:
+                lines = entry.lines
+            else:
+                signature = index.signature(path) if path else None
+                # Занятому KOMPAS чтение повторяется
+                lines = call_when_ready(read_document_lines, ctx.session, doc)
+                if signature is not None:
+                    index.store(path, signature, DRAWING_TYPE, lines)
+            texts[name] = format_tt_lines(lines) if lines else None
+    finally:
+        if index is not None:
+            index.close()
+    return texts
+
+
+def check_drawings_tt_job(ctx, classifier, index=None, processes=None):
+    """ТТ всех открытых чертежей с проверкой: TTCheckResult.
+
+    Проверяются прочитанные тексты, без KOMPAS; большой пакет - в пуле
+    процессов (kompas_checks.validate_tt_texts). При отмене или ошибке чтения
+    проверяется то, что успели прочитать: результаты попадают в BatchRun, а
+    ошибка затем передается окну.
+    """
+    texts = {}
+    cancelled = False
+    failure = None
+    try:
+        read_drawings_tt_job(ctx, index, texts)
+    except JobCancelled:
+        cancelled = True
+    except Exception as e:
+        failure = e
+    ctx.progress(len(texts), len(texts), f"Проверка ТТ {len(texts)} чертежей...")
+    issues = validate_tt_texts(texts, classifier, processes=processes)
+    for name, found in issues.items():
+        if found:
+            ctx.report(name, BATCH_ISSUES, "; ".join(issue_messages(found)))
+        else:
+            ctx.report(name, BATCH_OK)
+    if failure is not None:
+        raise failure
+    return TTCheckResult(issues, cancelled)
@@ -2,12 +2,14 @@ import os
 import sys
 import json
 import logging
+import multiprocessing
+import time
 from datetime import datetime
 from PyQt6.QtWidgets import (
     QApplication,
     QDialogButtonBox,
     QHeaderView,
-    QListWidgetItem,
+    QListView,
     QMainWindow,
     QRadioButton,
     QStyle,
@@ -24,7 +26,6 @@ from PyQt6.QtWidgets import (
     QPushButton,
     QTextEdit,
     QTabWidget,
-    QListWidget,
     QLabel,
     QStatusBar,
     QToolBar,
@@ -44,50 +45,175 @@ from PyQt6.QtWidgets import (
     QLabel,
     QMessageBox,
     QAbstractItemView,
+    QProgressBar,
+    QFileDialog,
 )
 
 from PyQt6.QtGui import QIcon, QFont, QTextCharFormat, QTextCursor, QAction, QClipboard
-from PyQt6.QtCore import Qt, QTimer
-import pythoncom
-import win32com.client
-from win32com.client import Dispatch, gencache
+from PyQt6.QtCore import Qt, QTimer, QEvent, QFileSystemWatcher, pyqtSignal
 import re
 import gc
 
-
-TT_CATEGORIES = [
-    "Требования к материалу, заготовке, термической обработке и свойствам",
-    "Требования к соединениям изделия",
-    "Размеры, предельные отклонения, геометрические допуски",
-    "Зазоры, расположение элементов конструкции",
-    "Требования к настройке и регулированию",
-    "Другие требования к качеству изделий",
-    "Условия и методы испытаний",
-    "Требования к качеству поверхностей, отделке, покрытию",
-    "Указания о маркировании и клеймении",
-    "Правила транспортирования и хранения",
-    "Особые условия эксплуатации",
-    "Принятые сокращения с расшифровкой",
-    "Ссылки на другие КД",
-    "Ссылки на другие документы с ТТ",
-]
+from kompas_audit import AUDIT_STATUS_NAMES, audit_folder_job
+from kompas_batch import BatchDock, BatchRun
+from kompas_profiler import ComProfiler, ComProfilerDock
+from kompas_buffers import (
+    TT_CREATED,
+    TT_EMPTY,
+    TT_LOADED,
+    TT_NO_DOCUMENT,
+    DocumentTT,
+    TTBufferCache,
+    buffer_key,
+    document_stamp,
+    prefetch_tt_job,
+    write_document_tt,
+)
+from kompas_checks import (
+    TT_CATEGORIES,
+    TTClassifier,
+    classify_tt_lines,
+    issue_messages,
+    split_tt_text,
+    suggest_tt_lines,
+    validate_categorized_lines,
+)
+from kompas_documents import DocumentRegistry
+from kompas_editor import TTEditor, TTLiveValidator
+from kompas_events import (
+    DOCUMENT_SET_EVENTS,
+    EVENT_DESTROYED,
+    AdaptivePollInterval,
+    DocumentChangeTracker,
+)
+from kompas_export import (
+    default_pool_size,
+    export_drawings_pdf_job,
+    export_drawings_pdf_pool_job,
+    sheets_per_minute,
+)
+from kompas_index import INDEX_FILE_NAME, TTIndex, compact_index_job
+from kompas_library import (
+    CACHE_FOLDER_NAME,
+    SYNC_UNAVAILABLE,
+    SYNC_UPDATED,
+    SharedLibrary,
+    layer_templates,
+    sync_in_background,
+)
+from kompas_ready import (
+    ReadinessScheduler,
+    document_active,
+    document_closed,
+    file_written,
+)
+from kompas_search import SEARCH_MODE_NAMES, TTSearchIndex
+from kompas_session import KompasSession, com_action
+from kompas_template_store import (
+    CHANGE_NAMES,
+    TEMPLATE_STORE_FILE_NAME,
+    TemplateStore,
+)
+from kompas_templates import (
+    Template,
+    TemplateFilterProxy,
+    TemplateItemDelegate,
+    TemplateListModel,
+    Variant,
+    copy_templates,
+    load_templates_file,
+    save_templates_file,
+)
+from kompas_tt import (
+    editor_text_to_lines,
+    format_tt_lines,
+    read_tt_lines,
+)
+from kompas_worker import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    ComWorker,
+    JobCancelled,
+    connect_job,
+    disconnect_job,
+    read_active_tt_job,
+    check_drawings_tt_job,
+)
 
 
 class KompasApp(QMainWindow):
-    def __init__(self):
+    # События KOMPAS могут прийти из любого потока; сигнал доставляет их в окно
+    document_event_received = pyqtSignal()
+    # Итог сверки общей библиотеки шаблонов (из фонового потока)
+    shared_library_synced = pyqtSignal(object)
+
+    def __init__(self, backend=None):
         super().__init__()
+        self.session = KompasSession(backend)
+        # Долгие обращения к KOMPAS выполняются в отдельном потоке
+        self.worker = ComWorker(self.session.backend, self)
+        self.worker.start()
+        self.connecting = False
+        self.batch_job_id = None
+        self.batch_run = None
+        # Профилировщик COM (None - выключен, обращения не замеряются)
+        self.com_profiler = None
+        self.document_registry = DocumentRegistry()
+        # Буферы ТТ открытых чертежей: переключение без чтения ТТ через COM
+        self.tt_buffers = TTBufferCache()
+        self.tt_buffer_key = None  # чей буфер сейчас в редакторе
+        self.tt_prefetch_job = None
+        self.last_active_doc_name = None
+        self.last_doc_count = 0
+        # События KOMPAS копятся и обрабатываются одним обновлением
+        self.document_tracker = DocumentChangeTracker(
+            self.session, self.on_document_event
+        )
+        # Операции, ждущие готовности KOMPAS (активации, закрытия, записи)
+        self.ready = ReadinessScheduler(self)
+        self.document_events_timer = QTimer()
+        self.document_events_timer.setSingleShot(True)
+        self.document_events_timer.setInterval(50)
+        self.document_events_timer.timeout.connect(self.apply_document_events)
+        self.document_event_received.connect(self.document_events_timer.start)
+        # Резервный опрос с адаптивным интервалом
+        self.poll_interval = AdaptivePollInterval()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.periodic_update)
         user_home = os.path.expanduser("~")
         app_folder = os.path.join(user_home, "KOMPAS-TR")
         if not os.path.exists(app_folder):
             os.makedirs(app_folder)
         self.settings_file = os.path.join(app_folder, "settings.json")
+        # Журнал пакетного экспорта PDF (для пропуска актуальных и продолжения)
+        self.export_manifest_file = os.path.join(app_folder, "pdf_export.json")
+        # Журнал результатов последней пакетной операции (переживает сбой)
+        self.batch_journal_file = os.path.join(app_folder, "batch_results.csv")
+        # Индекс ТТ чертежей: неизменившиеся файлы не читаются через KOMPAS
+        self.tt_index = TTIndex(os.path.join(app_folder, INDEX_FILE_NAME))
+        # Поиск по ТТ: дополняется из индекса ТТ перед каждым запросом
+        self.tt_search = TTSearchIndex()
+        self.tt_search_folder = None
+        self.tt_search_timer = QTimer()
+        self.tt_search_timer.setSingleShot(True)
+        self.tt_search_timer.setInterval(250)
+        self.tt_search_timer.timeout.connect(self.search_tt)
 
         self.status_bar = self.statusBar()
         self.default_status_style = self.status_bar.styleSheet()
         self.status_bar.showMessage("Приложение запущено", 2000)
 
         # Загружаем настройки (добавляем classification_rules)
-        self.dark_mode, self.shortcuts, self.classification_rules = self.load_settings()
+        (
+            self.dark_mode,
+            self.shortcuts,
+            self.classification_rules,
+            self.shared_templates_folder,
+        ) = self.load_settings()
+        # Правила собираются в автомат один раз и пересобираются при их изменении
+        self.tt_classifier = TTClassifier(self.classification_rules)
 
         self.setWindowTitle("Редактор технических требований KOMPAS-3D")
         self.setGeometry(100, 100, 1400, 900)
@@ -100,26 +226,66 @@ class KompasApp(QMainWindow):
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
 
+        # Личные шаблоны (редактируются) и они же поверх общей библиотеки
+        self.personal_templates = {}
         self.templates = {}
+        # Общая библиотека читается из локальной копии, сверяется в фоне
+        self.shared_templates_cache = os.path.join(app_folder, CACHE_FOLDER_NAME)
+        self.shared_library = None
+        self.shared_library_syncing = False
+        self.shared_library_synced.connect(self.on_shared_library_synced)
+        self.set_shared_library(self.shared_templates_folder)
+        # База шаблонов SQLite; None - шаблоны в templates.json
+        self.template_store = None
+        # Шаблоны - одна модель, вкладки - фильтрующие прокси над ней
+        self.template_model = TemplateListModel(self)
+        self.template_proxies = []
+        self.template_delegate = TemplateItemDelegate(self)
+        self.template_search_term = ""
+        self.template_search_timer = QTimer()
+        self.template_search_timer.setSingleShot(True)
+        self.template_search_timer.setInterval(200)
+        self.template_search_timer.timeout.connect(
+            lambda: self.filter_templates(self.template_search_edit.text())
+        )
         self.template_search_var = ""
+        # Правки templates.json другими программами применяются без F5;
+        # сигналы приходят сериями, файл читается после паузы
+        self.templates_watcher = QFileSystemWatcher(self)
+        self.templates_watcher.fileChanged.connect(
+            lambda path: self.templates_file_timer.start()
+        )
+        self.templates_file_timer = QTimer()
+        self.templates_file_timer.setSingleShot(True)
+        self.templates_file_timer.setInterval(300)
+        self.templates_file_timer.timeout.connect(self.on_templates_file_changed)
         self.auto_numbering_var = False
 
         self.load_templates()
         ThemeManager.apply_theme(self, self.dark_mode)  # Применяем загруженную тему
         self.create_ui()
 
-        self.module7 = None
-        self.api7 = None
-        self.const7 = None
-        self.app7 = None
         self.connect_to_kompas()
 
         self.update_active_document_info()
         self.update_documents_tree()
-        self.last_doc_count = 0
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.periodic_update)
-        self.timer.start(1000)
+        self.timer.start(self.poll_interval.reset())
+
+    @property
+    def app7(self):
+        return self.session.app7
+
+    @property
+    def module7(self):
+        return self.session.module7
+
+    @property
+    def api7(self):
+        return self.session.api7
+
+    @property
+    def const7(self):
+        return self.session.const7
 
     def open_settings(self):
         dialog = SettingsDialog(self)
@@ -146,13 +312,14 @@ class KompasApp(QMainWindow):
             "dark_mode": False,
             "shortcuts": default_shortcuts,
             "classification_rules": default_classification_rules,
+            "shared_templates_folder": "",
         }
 
         try:
             if not os.path.exists(self.settings_file):
                 with open(self.settings_file, "w", encoding="utf-8") as f:
                     json.dump(default_settings, f, ensure_ascii=False, indent=4)
-                return False, default_shortcuts, default_classification_rules
+                return False, default_shortcuts, default_classification_rules, ""
 
             with open(self.settings_file, "r", encoding="utf-8") as f:
                 settings = json.load(f)
@@ -163,13 +330,14 @@ class KompasApp(QMainWindow):
                 )
                 with open(self.settings_file, "w", encoding="utf-8") as f:
                     json.dump(default_settings, f, ensure_ascii=False, indent=4)
-                return False, default_shortcuts, default_classification_rules
+                return False, default_shortcuts, default_classification_rules, ""
 
             dark_mode = settings.get("dark_mode", False)
             shortcuts = settings.get("shortcuts", default_shortcuts)
             classification_rules = settings.get(
                 "classification_rules", default_classification_rules
             )
+            shared_templates_folder = settings.get("shared_templates_folder", "")
 
             # Дополняем недостающие горячие клавиши
             for key in default_shortcuts:
@@ -180,7 +348,7 @@ class KompasApp(QMainWindow):
                 if cat not in classification_rules:
                     classification_rules[cat] = []
 
-            return dark_mode, shortcuts, classification_rules
+            return dark_mode, shortcuts, classification_rules, shared_templates_folder
 
         except Exception as e:
             self.status_bar.showMessage(
@@ -188,7 +356,7 @@ class KompasApp(QMainWindow):
             )
             with open(self.settings_file, "w", encoding="utf-8") as f:
                 json.dump(default_settings, f, ensure_ascii=False, indent=4)
-            return False, default_shortcuts, default_classification_rules
+            return False, default_shortcuts, default_classification_rules, ""
 
     def apply_theme(self):
         ThemeManager.apply_theme(self, self.dark_mode)
@@ -217,6 +385,7 @@ class KompasApp(QMainWindow):
                 "dark_mode": self.dark_mode,
                 "shortcuts": self.shortcuts,
                 "classification_rules": self.classification_rules,
+                "shared_templates_folder": self.shared_templates_folder,
             }
             with open(self.settings_file, "w", encoding="utf-8") as f:
                 json.dump(settings, f, ensure_ascii=False, indent=4)
@@ -236,17 +405,22 @@ class KompasApp(QMainWindow):
         self.reload_templates_action.setShortcut(self.shortcuts["reload_templates"])
 
     def save_theme_setting(self):
-        """Сохранение настройки темы в файл"""
-        try:
-            settings = {"dark_mode": self.dark_mode}
-            with open(self.settings_file, "w", encoding="utf-8") as f:
-                json.dump(settings, f, ensure_ascii=False, indent=4)
-            self.status_bar.showMessage("Настройки темы сохранены")
-        except Exception as e:
-            self.status_bar.showMessage(f"Ошибка сохранения настроек темы: {str(e)}")
+        """Сохранение настройки темы в файл (вместе с остальными настройками)"""
+        self.save_settings()
 
     def create_ui(self):
         """Создание пользовательского интерфейса"""
+        # Панель пакетных операций (до меню: в меню - ее переключатель)
+        self.batch_dock = BatchDock(self)
+        self.batch_dock.cancel_requested.connect(self.cancel_batch_job)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.batch_dock)
+        self.batch_dock.hide()
+        self.com_profiler_dock = ComProfilerDock(self)
+        self.addDockWidget(
+            Qt.DockWidgetArea.BottomDockWidgetArea, self.com_profiler_dock
+        )
+        self.com_profiler_dock.hide()
+
         # Создание меню
         self.create_menu()
 
@@ -298,6 +472,14 @@ class KompasApp(QMainWindow):
         self.save_pdf_action.triggered.connect(self.save_to_pdf)
         file_menu.addAction(self.save_pdf_action)
 
+        self.save_all_pdf_parallel_action = QAction(
+            "Сохранить все чертежи в PDF (параллельно)", self
+        )
+        self.save_all_pdf_parallel_action.triggered.connect(
+            self.save_all_drawings_to_pdf_parallel
+        )
+        file_menu.addAction(self.save_all_pdf_parallel_action)
+
         file_menu.addSeparator()
 
         self.disconnect_action = QAction("Отключиться от KOMPAS-3D", self)
@@ -320,12 +502,48 @@ class KompasApp(QMainWindow):
         self.reload_templates_action.triggered.connect(self.reload_templates)
         tools_menu.addAction(self.reload_templates_action)
 
+        templates_menu = tools_menu.addMenu("База шаблонов")
+        self.migrate_templates_action = QAction("Перенести шаблоны в базу SQLite", self)
+        self.migrate_templates_action.triggered.connect(self.migrate_templates_to_store)
+        templates_menu.addAction(self.migrate_templates_action)
+        self.import_templates_action = QAction("Импорт шаблонов из JSON...", self)
+        self.import_templates_action.triggered.connect(self.import_templates_json)
+        templates_menu.addAction(self.import_templates_action)
+        self.export_templates_action = QAction("Экспорт шаблонов в JSON...", self)
+        self.export_templates_action.triggered.connect(self.export_templates_json)
+        templates_menu.addAction(self.export_templates_action)
+        self.template_changes_action = QAction("Журнал изменений шаблонов", self)
+        self.template_changes_action.triggered.connect(self.show_template_changes)
+        templates_menu.addAction(self.template_changes_action)
+        self.update_template_store_actions()
+
         tools_menu.addSeparator()
 
         self.refresh_docs_action = QAction("Обновить список документов", self)
         self.refresh_docs_action.triggered.connect(self.update_documents_tree)
         tools_menu.addAction(self.refresh_docs_action)
 
+        self.audit_folder_action = QAction("Проверить ТТ чертежей в папке...", self)
+        self.audit_folder_action.triggered.connect(self.audit_folder_tt)
+        tools_menu.addAction(self.audit_folder_action)
+
+        self.compact_index_action = QAction("Сжать индекс ТТ", self)
+        self.compact_index_action.triggered.connect(self.compact_tt_index)
+        tools_menu.addAction(self.compact_index_action)
+
+        tools_menu.addSeparator()
+        self.batch_dock_action = self.batch_dock.toggleViewAction()
+        self.batch_dock_action.setText("Панель пакетной операции")
+        tools_menu.addAction(self.batch_dock_action)
+
+        self.com_profiling_action = QAction("Профилирование COM", self)
+        self.com_profiling_action.setCheckable(True)
+        self.com_profiling_action.toggled.connect(self.set_com_profiling)
+        tools_menu.addAction(self.com_profiling_action)
+        self.com_profiler_dock_action = self.com_profiler_dock.toggleViewAction()
+        self.com_profiler_dock_action.setText("Панель профилирования COM")
+        tools_menu.addAction(self.com_profiler_dock_action)
+
         # Меню "Помощь"
         help_menu = menu_bar.addMenu("Помощь")
         self.about_action = QAction("О программе", self)
@@ -397,7 +615,7 @@ class KompasApp(QMainWindow):
         # Кнопка сохранения всех чертежей в PDF
         save_all_pdf_btn = QAction("📚", self)
         save_all_pdf_btn.setToolTip("Сохранить все чертежи в PDF")
-        save_all_pdf_btn.triggered.connect(self.save_all_drawings_to_pdf)
+        save_all_pdf_btn.triggered.connect(lambda: self.save_all_drawings_to_pdf())
         toolbar.addAction(save_all_pdf_btn)
 
         toolbar.addSeparator()
@@ -454,9 +672,13 @@ class KompasApp(QMainWindow):
         splitter = QSplitter(Qt.Orientation.Horizontal)
         main_layout.addWidget(splitter)
 
-        # Левая панель - дерево документов
-        left_panel = self.create_left_panel()
-        splitter.addWidget(left_panel)
+        # Левая панель - дерево документов и поиск по ТТ под ним
+        left_splitter = QSplitter(Qt.Orientation.Vertical)
+        left_splitter.addWidget(self.create_left_panel())
+        left_splitter.addWidget(self.create_search_panel())
+        left_splitter.setStretchFactor(0, 3)
+        left_splitter.setStretchFactor(1, 2)
+        splitter.addWidget(left_splitter)
 
         # Правая панель - шаблоны и редактор
         right_panel = self.create_right_panel()
@@ -488,6 +710,7 @@ class KompasApp(QMainWindow):
 
         # Дерево документов с новым столбцом "Статус"
         self.doc_tree = QTreeWidget()
+        self.doc_tree_items = {}  # ключ записи реестра -> строка дерева
         self.doc_tree.setHeaderLabels(["Статус", "Имя", "Тип", "Путь"])
         self.doc_tree.setColumnWidth(0, 50)  # Ширина столбца "Статус"
         self.doc_tree.setColumnWidth(1, 150)
@@ -504,6 +727,52 @@ class KompasApp(QMainWindow):
 
         return left_panel
 
+    def create_search_panel(self):
+        """Панель поиска по ТТ чертежей из индекса ТТ"""
+        search_panel = QGroupBox("Поиск по ТТ чертежей")
+        search_layout = QVBoxLayout(search_panel)
+
+        query_layout = QHBoxLayout()
+        self.tt_search_edit = QLineEdit()
+        self.tt_search_edit.setPlaceholderText("Текст ТТ, ГОСТ, HRC...")
+        self.tt_search_edit.textChanged.connect(self.tt_search_timer.start)
+        self.tt_search_edit.returnPressed.connect(self.search_tt)
+        query_layout.addWidget(self.tt_search_edit)
+
+        self.tt_search_mode = QComboBox()
+        for mode, mode_name in SEARCH_MODE_NAMES.items():
+            self.tt_search_mode.addItem(mode_name, mode)
+        self.tt_search_mode.currentIndexChanged.connect(self.search_tt)
+        query_layout.addWidget(self.tt_search_mode)
+
+        index_folder_btn = QPushButton("📁")
+        index_folder_btn.setFixedWidth(30)
+        index_folder_btn.setToolTip("Проиндексировать папку и искать только в ней")
+        index_folder_btn.clicked.connect(self.index_search_folder)
+        query_layout.addWidget(index_folder_btn)
+        search_layout.addLayout(query_layout)
+
+        scope_layout = QHBoxLayout()
+        self.tt_search_scope_label = QLabel("Все проиндексированные чертежи")
+        scope_layout.addWidget(self.tt_search_scope_label, 1)
+        reset_scope_btn = QPushButton("✖")
+        reset_scope_btn.setFixedWidth(30)
+        reset_scope_btn.setToolTip("Искать во всех проиндексированных чертежах")
+        reset_scope_btn.clicked.connect(lambda: self.set_search_folder(None))
+        scope_layout.addWidget(reset_scope_btn)
+        search_layout.addLayout(scope_layout)
+
+        self.tt_search_results = QTreeWidget()
+        self.tt_search_results.setHeaderLabels(["Чертеж", "Строка", "Текст"])
+        self.tt_search_results.setColumnWidth(0, 180)
+        self.tt_search_results.setColumnWidth(1, 50)
+        self.tt_search_results.setRootIsDecorated(False)
+        self.tt_search_results.itemDoubleClicked.connect(
+            self.on_search_hit_double_click
+        )
+        search_layout.addWidget(self.tt_search_results)
+        return search_panel
+
     def show_document_context_menu(self, pos):
         """Показ контекстного меню для документа в дереве"""
         item = self.doc_tree.itemAt(pos)
@@ -560,21 +829,11 @@ class KompasApp(QMainWindow):
                 self.status_bar.showMessage("Нет подключения к KOMPAS-3D")
                 return
 
-            documents = self.app7.Documents
-            doc_to_close = None
-            for i in range(documents.Count):
-                try:
-                    doc = documents.Item(i)
-                    if doc is None:
-                        continue  # Пропускаем, если документ не существует
-                    if doc.Name == doc_name:
-                        doc_to_close = doc
-                        break
-                except Exception as e:
-                    self.status_bar.showMessage(
-                        f"Ошибка при доступе к документу: {str(e)}"
-                    )
-                    continue
+            try:
+                doc_to_close = self.session.find_document(doc_name)
+            except Exception as e:
+                self.status_bar.showMessage(f"Ошибка при доступе к документу: {str(e)}")
+                doc_to_close = None
 
             if doc_to_close:
                 try:
@@ -582,9 +841,13 @@ class KompasApp(QMainWindow):
                     self.status_bar.showMessage(
                         f"Документ {doc_name} сохранен и закрыт"
                     )
-                    # Даем небольшую задержку перед обновлением дерева
-                    QTimer.singleShot(100, self.update_documents_tree)
-                    QTimer.singleShot(150, self.update_active_document_info)
+                    # Дерево обновляется, когда KOMPAS закроет документ
+                    self.ready.when(
+                        document_closed(self.session, doc_name),
+                        self.after_document_closed,
+                        on_timeout=self.after_document_closed,
+                        name=f"close:{doc_name}",
+                    )
                 except Exception as e:
                     self.status_bar.showMessage(
                         f"Ошибка при закрытии документа: {str(e)}"
@@ -616,13 +879,14 @@ class KompasApp(QMainWindow):
         search_label = QLabel("🔍")
         self.template_search_edit = QLineEdit()
         self.template_search_edit.setPlaceholderText("Поиск шаблонов...")
-        self.template_search_edit.textChanged.connect(self.filter_templates)
+        self.template_search_edit.textChanged.connect(self.template_search_timer.start)
         search_layout.addWidget(search_label)
         search_layout.addWidget(self.template_search_edit)
         templates_layout.addLayout(search_layout)
 
         # Вкладки шаблонов
         self.template_tabs = QTabWidget()
+        self.template_tabs.currentChanged.connect(self.on_template_tab_changed)
         self.populate_template_tabs()
         templates_layout.addWidget(self.template_tabs)
         right_layout.addWidget(templates_frame)
@@ -631,14 +895,28 @@ class KompasApp(QMainWindow):
         editor_frame = QGroupBox("Текущие технические требования")
         editor_layout = QVBoxLayout(editor_frame)
 
-        self.current_reqs_text = QTextEdit()
+        self.current_reqs_text = TTEditor()
         self.current_reqs_text.setAcceptRichText(True)
         editor_layout.addWidget(self.current_reqs_text)
 
+        # Проверка ТТ по мере ввода: подсветка, маркеры и итог под редактором
+        self.tt_validator = TTLiveValidator(self.current_reqs_text, self.tt_classifier)
+        self.tt_live_status = QLabel()
+        self.tt_validator.issues_changed.connect(self.show_live_issue_count)
+        editor_layout.addWidget(self.tt_live_status)
+
         right_layout.addWidget(editor_frame)
 
         return right_panel
 
+    def show_live_issue_count(self, count):
+        if not self.current_reqs_text.toPlainText().strip():
+            self.tt_live_status.setText("")
+        elif count:
+            self.tt_live_status.setText(f"⚠ Замечаний в ТТ: {count}")
+        else:
+            self.tt_live_status.setText("✔ Замечаний нет")
+
     def create_status_bar(self):
         """Создание строки статуса"""
         self.status_bar = QStatusBar()
@@ -664,6 +942,16 @@ class KompasApp(QMainWindow):
         self.docs_count_label = QLabel("Документов: 0")
         self.status_bar.addPermanentWidget(self.docs_count_label)
 
+        # Прогресс и отмена пакетных операций (скрыты, пока операция не идет)
+        self.batch_progress = QProgressBar()
+        self.batch_progress.setMaximumWidth(200)
+        self.batch_progress.setVisible(False)
+        self.status_bar.addPermanentWidget(self.batch_progress)
+        self.batch_cancel_button = QPushButton("Отменить")
+        self.batch_cancel_button.setVisible(False)
+        self.batch_cancel_button.clicked.connect(self.cancel_batch_job)
+        self.status_bar.addPermanentWidget(self.batch_cancel_button)
+
         version_label = QLabel("v1.2.0 (2025)")
         self.status_bar.addPermanentWidget(version_label)
 
@@ -674,85 +962,303 @@ class KompasApp(QMainWindow):
             if not os.path.exists(app_folder):
                 os.makedirs(app_folder)
             self.templates_file = os.path.join(app_folder, "templates.json")
+            self.template_store_file = os.path.join(
+                app_folder, TEMPLATE_STORE_FILE_NAME
+            )
 
-            if not os.path.exists(self.templates_file):
-                self.status_bar.showMessage("Файл шаблонов не найден, создаем новый")
-                with open(self.templates_file, "w", encoding="utf-8") as f:
-                    json.dump({"Общие": []}, f, ensure_ascii=False, indent=4)
-
-            with open(self.templates_file, "r", encoding="utf-8") as f:
-                self.templates = json.load(f)
-            self.status_bar.showMessage(
-                f"Загружено {sum(len(templates) for templates in self.templates.values())} шаблонов"
+            if os.path.exists(self.template_store_file):
+                # Шаблоны перенесены в базу (Инструменты -> Перенести шаблоны в базу)
+                if self.template_store is None:
+                    self.template_store = TemplateStore(self.template_store_file)
+                self.personal_templates = self.template_store.load()
+            else:
+                if not os.path.exists(self.templates_file):
+                    self.status_bar.showMessage(
+                        "Файл шаблонов не найден, создаем новый"
+                    )
+                    save_templates_file(self.templates_file, {"Общие": []})
+                self.personal_templates = load_templates_file(self.templates_file)
+            # Сетевая папка здесь не читается: только локальная копия
+            shared = (
+                self.shared_library.cached_templates()
+                if self.shared_library is not None
+                else {}
             )
+            self.shared_templates = shared
+            self.templates = layer_templates(shared, self.personal_templates)
+            message = f"Загружено {sum(len(templates) for templates in self.templates.values())} шаблонов"
+            if shared:
+                message += (
+                    f" (общих: {sum(len(templates) for templates in shared.values())})"
+                )
+            self.status_bar.showMessage(message)
         except Exception as e:
             self.status_bar.showMessage(f"Ошибка загрузки шаблонов: {str(e)}")
             QMessageBox.critical(
                 self, "Ошибка", f"Не удалось загрузить шаблоны: {str(e)}"
             )
+            self.personal_templates = {"Общие": []}
+            self.shared_templates = {}
             self.templates = {"Общие": []}
+        # Ключи поиска строятся здесь один раз на загрузку
+        self.template_model.set_templates(self.templates)
+        self.watch_templates_file()
+        self.sync_shared_library()
+
+    def watch_templates_file(self):
+        """Слежение за templates.json (с базой шаблонов файл не используется)"""
+        watched = self.templates_watcher.files()
+        if watched:
+            self.templates_watcher.removePaths(watched)
+        if self.template_store is None and os.path.exists(self.templates_file):
+            self.templates_watcher.addPath(self.templates_file)
+
+    def on_templates_file_changed(self):
+        """templates.json изменен: в списках меняются только другие шаблоны"""
+        # Файл, замененный переименованием, выпадает из наблюдения
+        self.watch_templates_file()
+        if self.template_store is not None or not os.path.exists(self.templates_file):
+            return
+        try:
+            personal = load_templates_file(self.templates_file)
+        except (OSError, ValueError) as e:
+            self.set_status_message(f"Файл шаблонов не прочитан: {str(e)}", False)
+            return
+        added, removed, changed = self.apply_templates(personal=personal)
+        if added or removed or changed:
+            self.status_bar.showMessage(
+                f"Шаблоны обновлены из файла: добавлено {added}, удалено {removed}, "
+                f"изменено {changed}"
+            )
+
+    def apply_templates(self, personal=None, shared=None):
+        """Новые личные и (или) общие шаблоны без перезагрузки вкладок.
+
+        Модель меняет только отличающиеся строки, поэтому текст поиска,
+        прокрутка и выделение в списках сохраняются. Возвращает
+        (добавлено, удалено, изменено).
+        """
+        if personal is not None:
+            self.personal_templates = personal
+        if shared is not None:
+            self.shared_templates = shared
+        self.templates = layer_templates(self.shared_templates, self.personal_templates)
+        counts = self.template_model.apply_templates(self.templates)
+        self.update_template_tabs()
+        for proxy in self.template_proxies:
+            proxy.refresh()
+        return counts
+
+    def set_shared_library(self, folder):
+        """Папка общей библиотеки шаблонов ("" - без общей библиотеки)"""
+        self.shared_templates_folder = folder
+        self.shared_library = (
+            SharedLibrary(folder, self.shared_templates_cache) if folder else None
+        )
+
+    def sync_shared_library(self):
+        """Сверка копии общей библиотеки в фоне; окно не ждет сетевую папку"""
+        if self.shared_library is None or self.shared_library_syncing:
+            return
+        self.shared_library_syncing = True
+        sync_in_background(self.shared_library, self.shared_library_synced.emit)
+
+    def on_shared_library_synced(self, result):
+        self.shared_library_syncing = False
+        if self.shared_library is None or result.folder != self.shared_library.folder:
+            # Папку сменили во время сверки - сверяется новая
+            self.sync_shared_library()
+            return
+        if result.status == SYNC_UPDATED:
+            self.apply_templates(shared=self.shared_library.cached_templates())
+            self.set_status_message(result.message)
+        elif result.status == SYNC_UNAVAILABLE:
+            logging.getLogger("kompas").warning(result.message)
+            self.set_status_message(result.message, False)
 
     def connect_to_kompas(self):
-        """Подключение к KOMPAS-3D"""
+        """Подключение к KOMPAS-3D.
+
+        Если подключения нет, оно выполняется в фоновом потоке, а метод
+        возвращает False сразу; окно обновляется в on_kompas_connected.
+        """
         try:
-            if hasattr(self, "app7") and self.app7:
+            if self.session.is_connected:
                 try:
-                    app_name = self.app7.ApplicationName(FullName=False)
+                    app_name = self.session.application_name()
                     self.connect_status.setText("🟢 Подключено")
                     self.connect_status.setStyleSheet("color: green;")
                     self.status_bar.showMessage(f"Уже подключено к {app_name}")
                     return True
                 except Exception:
-                    self.app7 = None
+                    self.session.disconnect()
                     self.status_bar.showMessage(
                         "Ошибка подключения, пробуем переподключиться..."
                     )
 
-            try:
-                self.status_bar.showMessage(
-                    "Попытка подключения к запущенному KOMPAS-3D..."
-                )
-                self.app7 = win32com.client.Dispatch("Kompas.Application.7")
-                app_name = self.app7.ApplicationName(FullName=False)
-                self.module7, self.api7, self.const7 = self.get_kompas_api7()
-                self.connect_status.setText("🟢 Подключено")
-                self.connect_status.setStyleSheet("color: green;")
-                self.status_bar.showMessage(f"Подключено к запущенному {app_name}")
-                self.update_documents_tree()
-                return True
-            except Exception:
-                try:
-                    self.status_bar.showMessage("Попытка запуска KOMPAS-3D...")
-                    self.app7 = win32com.client.Dispatch("Kompas.Application.7")
-                    self.app7.Visible = True
-                    self.app7.HideMessage = True
-                    self.module7, self.api7, self.const7 = self.get_kompas_api7()
-                    app_name = self.app7.ApplicationName(FullName=False)
-                    self.connect_status.setText("🟢 Подключено")
-                    self.connect_status.setStyleSheet("color: green;")
-                    self.status_bar.showMessage(f"Запущен и подключен {app_name}")
-                    self.update_documents_tree()
-                    return True
-                except Exception as e:
-                    self.connect_status.setText("🔴 Нет подключения")
-                    self.connect_status.setStyleSheet("color: red;")
-                    error_message = self.handle_kompas_error(e, "подключения")
-                    self.status_bar.showMessage("Не удалось подключиться к KOMPAS-3D")
-                    QMessageBox.critical(self, "Ошибка подключения", error_message)
-                    return False
+            if self.connecting:
+                return False
+            self.connecting = True
+            self.connect_status.setText("🟡 Подключение...")
+            self.connect_status.setStyleSheet("color: orange;")
+            self.status_bar.showMessage(
+                "Попытка подключения к запущенному KOMPAS-3D..."
+            )
+            self.worker.submit(
+                connect_job,
+                priority=PRIORITY_INTERACTIVE,
+                name="connect_to_kompas",
+                on_result=self.on_kompas_connected,
+                on_error=self.on_kompas_connect_failed,
+                on_progress=self.show_job_progress,
+            )
+            return False
         except Exception as e:
-            self.connect_status.setText("🔴 Нет подключения")
-            self.connect_status.setStyleSheet("color: red;")
-            error_message = self.handle_kompas_error(e, "подключения")
-            self.status_bar.showMessage("Ошибка при подключении к KOMPAS-3D")
-            QMessageBox.critical(self, "Ошибка подключения", error_message)
+            self.on_kompas_connect_failed(e)
             return False
 
+    def on_kompas_connected(self, result):
+        """Подключение из фонового потока завершено"""
+        stream, launched = result
+        self.connecting = False
+        try:
+            self.session.attach_marshalled(stream)
+            app_name = self.session.application_name()
+        except Exception as e:
+            self.on_kompas_connect_failed(e)
+            return
+        self.connect_status.setText("🟢 Подключено")
+        self.connect_status.setStyleSheet("color: green;")
+        if launched:
+            self.status_bar.showMessage(f"Запущен и подключен {app_name}")
+        else:
+            self.status_bar.showMessage(f"Подключено к запущенному {app_name}")
+        self.start_document_tracking()
+        self.update_documents_tree()
+        self.update_active_document_info()
+        self.prefetch_tt_buffers()
+
+    def on_kompas_connect_failed(self, error):
+        self.connecting = False
+        self.session.disconnect()
+        self.connect_status.setText("🔴 Нет подключения")
+        self.connect_status.setStyleSheet("color: red;")
+        error_message = self.handle_kompas_error(error, "подключения")
+        self.status_bar.showMessage("Не удалось подключиться к KOMPAS-3D")
+        QMessageBox.critical(self, "Ошибка подключения", error_message)
+
+    def show_job_progress(self, done, total, message):
+        """Прогресс фонового задания в строке состояния"""
+        if total:
+            self.status_bar.showMessage(f"{message} ({done + 1}/{total})")
+        elif message:
+            self.status_bar.showMessage(message)
+        if self.batch_job_id is not None and total:
+            self.batch_progress.setRange(0, total)
+            self.batch_progress.setValue(done)
+
+    def run_batch_job(self, title, func, *args, name, on_result, on_error):
+        """Пакетная операция: задание ComWorker с ходом, отменой и результатами.
+
+        Обработчики результата и ошибки должны вызвать finish_batch_job().
+        """
+        self.batch_run = BatchRun(title, self.batch_journal_file)
+        job_id = self.worker.submit(
+            func,
+            *args,
+            priority=PRIORITY_BATCH,
+            name=name,
+            on_result=on_result,
+            on_error=on_error,
+            on_progress=self.show_batch_progress,
+            batch=self.batch_run,
+        )
+        self.start_batch_job(job_id)
+        return job_id
+
+    def show_batch_progress(self, done, total, message):
+        if self.batch_run is not None:
+            self.batch_run.progress(done, total, message)
+        self.show_job_progress(done, total, message)
+
+    def start_batch_job(self, job_id):
+        """Показ прогресса и кнопки отмены для пакетного задания"""
+        self.batch_job_id = job_id
+        self.batch_progress.setRange(0, 0)
+        self.batch_progress.setVisible(True)
+        self.batch_cancel_button.setEnabled(True)
+        self.batch_cancel_button.setVisible(True)
+        if self.batch_run is not None:
+            self.batch_dock.start(self.batch_run)
+
+    def finish_batch_job(self, cancelled=False, error=None):
+        """Конец пакетной операции; собранные результаты остаются в панели"""
+        self.batch_job_id = None
+        self.batch_progress.setVisible(False)
+        self.batch_cancel_button.setVisible(False)
+        if isinstance(error, JobCancelled):
+            cancelled, error = True, None
+        if self.batch_run is not None and self.batch_run.running:
+            self.batch_run.finish(cancelled, error)
+            self.batch_dock.finish()
+
+    def cancel_batch_job(self):
+        """Отмена текущего пакетного задания (после текущего документа)"""
+        if self.batch_job_id is not None:
+            self.worker.cancel(self.batch_job_id)
+            self.batch_cancel_button.setEnabled(False)
+            self.batch_dock.cancel_button.setEnabled(False)
+            self.status_bar.showMessage("Отмена после текущего документа...")
+
+    def set_com_profiling(self, enabled):
+        """Включение замера обращений к COM в потоке окна и фоновом потоке.
+
+        Выключение только отключает замер: собранное остается в панели.
+        Процессы параллельного экспорта PDF не профилируются.
+        """
+        if enabled and self.com_profiler is None:
+            self.com_profiler = ComProfiler()
+            self.com_profiler_dock.set_profiler(self.com_profiler)
+        profiler = self.com_profiler if enabled else None
+        self.session.counter.profiler = profiler
+        self.worker.session.counter.profiler = profiler
+        if self.com_profiling_action.isChecked() != enabled:
+            self.com_profiling_action.setChecked(enabled)
+        if enabled:
+            self.com_profiler_dock.show()
+            self.com_profiler_dock.raise_()
+            self.status_bar.showMessage("Профилирование COM включено")
+        else:
+            self.status_bar.showMessage("Профилирование COM выключено")
+
+    def start_document_tracking(self):
+        """Подписка на события KOMPAS; без событий опрос остается частым"""
+        self.poll_interval.events_active = self.document_tracker.start()
+        self.timer.start(self.poll_interval.reset())
+
+    def on_document_event(self, event, doc_name=None):
+        """Событие KOMPAS: откладываем обработку, чтобы слить серию событий"""
+        self.document_event_received.emit()
+
+    def apply_document_events(self):
+        """Обновление реестра и дерева по накопленным событиям KOMPAS"""
+        events = self.document_tracker.take_pending()
+        if not events or not self.is_kompas_running():
+            return
+        if EVENT_DESTROYED in events:
+            self.disconnect_from_kompas()
+            return
+        if events & DOCUMENT_SET_EVENTS:
+            self.update_documents_tree()
+            self.last_doc_count = len(self.document_registry)
+        self.update_active_document_info()
+        self.timer.start(self.poll_interval.next(changed=True))
+
     def check_kompas_connection(self):
         """Проверка подключения к KOMPAS-3D с выводом сообщения"""
         if self.is_kompas_running():
-            app_name = self.app7.ApplicationName(FullName=True)
-            version = self.app7.ApplicationVersion()
+            app_name = self.session.application_name(full_name=True)
+            version = self.session.application_version()
             QMessageBox.information(
                 self,
                 "Информация о подключении",
@@ -771,35 +1277,30 @@ class KompasApp(QMainWindow):
                 return self.connect_to_kompas()
             return False
 
-    def get_kompas_api7(self):
-        """Получение объектов API Kompas 3D версии 7"""
-        module = gencache.EnsureModule(
-            "{69AC2981-37C0-4379-84FD-5DD2F3C0A520}", 0, 1, 0
-        )
-        api = module.IKompasAPIObject(
-            Dispatch("Kompas.Application.7")._oleobj_.QueryInterface(
-                module.IKompasAPIObject.CLSID, pythoncom.IID_IDispatch
-            )
-        )
-        const = gencache.EnsureModule(
-            "{75C9F5D0-B5B8-4526-8681-9903C567D2ED}", 0, 1, 0
-        ).constants
-        return module, api, const
-
     def is_kompas_running(self):
         """Проверка подключения к KOMPAS-3D"""
-        try:
-            return hasattr(self, "app7") and self.app7 is not None
-        except:
-            return False
+        return self.session.is_connected
 
     def filter_documents_tree(self, text):
-        """Фильтрация дерева документов по поисковому запросу"""
-        self.update_documents_tree(text)
+        """Фильтрация дерева документов по поисковому запросу (без обращений к KOMPAS)"""
+        doc_count = self.apply_documents_filter(text)
+        self.status_bar.showMessage(f"Найдено документов: {doc_count}")
 
     def filter_templates(self, text):
-        """Фильтрация шаблонов по поисковому запросу"""
-        self.populate_template_tabs(text)
+        """Фильтрация шаблонов по поисковому запросу (вкладки не пересоздаются)"""
+        self.template_search_timer.stop()
+        self.template_search_term = text
+        if text:
+            self.template_tabs.setCurrentIndex(0)
+        # Фильтруется только видимая вкладка, остальные - при переключении
+        self.on_template_tab_changed(self.template_tabs.currentIndex())
+        if text:
+            self.status_bar.showMessage(
+                f"Найдено шаблонов: {self.template_proxies[0].rowCount()} "
+                f"по запросу '{text}'"
+            )
+        else:
+            self.status_bar.showMessage("Показаны все шаблоны")
 
     def activate_selected_document(self):
         """Активация выбранного документа в дереве"""
@@ -815,14 +1316,12 @@ class KompasApp(QMainWindow):
                     return False
 
             doc_name = selected_items[0].text(1)  # Имя теперь в столбце 1
-            documents = self.app7.Documents
-            for i in range(documents.Count):
-                doc = documents.Item(i)
-                if doc.Name == doc_name:
-                    doc.Active = True
-                    self.update_active_document_info()
-                    self.status_bar.showMessage(f"Документ {doc_name} активирован")
-                    return True
+            doc = self.session.find_document(doc_name)
+            if doc is not None:
+                doc.Active = True
+                self.update_active_document_info()
+                self.status_bar.showMessage(f"Документ {doc_name} активирован")
+                return True
             self.status_bar.showMessage(
                 f"Документ {doc_name} не найден в списке открытых документов"
             )
@@ -849,6 +1348,93 @@ class KompasApp(QMainWindow):
         dialog = TemplateEditorDialog(self, self.templates_file)
         dialog.exec()
 
+    def save_templates(self, templates):
+        """Сохранение правок редактора: в базе - только измененные шаблоны"""
+        if self.template_store is not None:
+            added, updated, deleted = self.template_store.save_changes(
+                self.personal_templates, templates
+            )
+            message = (
+                f"Шаблоны сохранены в базе: добавлено {added}, изменено {updated}, "
+                f"удалено {deleted}"
+            )
+            # Новые шаблоны получают номера записей в базе
+            templates = self.template_store.load()
+        else:
+            save_templates_file(self.templates_file, templates)
+            message = "Шаблоны сохранены"
+        self.apply_templates(personal=templates)
+        self.status_bar.showMessage(message)
+
+    def update_template_store_actions(self):
+        has_store = self.template_store is not None
+        self.migrate_templates_action.setEnabled(not has_store)
+        self.import_templates_action.setEnabled(has_store)
+        self.template_changes_action.setEnabled(has_store)
+
+    def migrate_templates_to_store(self):
+        """Перенос шаблонов из templates.json в базу SQLite"""
+        reply = QMessageBox.question(
+            self,
+            "База шаблонов",
+            "Перенести шаблоны в базу SQLite? Файл templates.json останется "
+            "без изменений как резервная копия.",
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            store = TemplateStore(self.template_store_file)
+            count = store.import_templates(self.personal_templates)
+            self.template_store = store
+            self.update_template_store_actions()
+            self.reload_templates()
+            self.status_bar.showMessage(f"В базу перенесено шаблонов: {count}")
+        except Exception as e:
+            self.status_bar.showMessage(f"Ошибка переноса шаблонов: {str(e)}")
+            QMessageBox.critical(
+                self, "Ошибка", f"Не удалось перенести шаблоны: {str(e)}"
+            )
+
+    def import_templates_json(self):
+        """Замена шаблонов в базе шаблонами из файла JSON"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Импорт шаблонов", "", "Шаблоны (*.json)"
+        )
+        if not path:
+            return
+        reply = QMessageBox.question(
+            self,
+            "Импорт шаблонов",
+            "Все шаблоны в базе будут заменены шаблонами из файла. Продолжить?",
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            count = self.template_store.import_json(path)
+            self.reload_templates()
+            self.status_bar.showMessage(f"Импортировано шаблонов: {count}")
+        except Exception as e:
+            self.status_bar.showMessage(f"Ошибка импорта шаблонов: {str(e)}")
+            QMessageBox.critical(
+                self, "Ошибка", f"Не удалось импортировать шаблоны: {str(e)}"
+            )
+
+    def export_templates_json(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт шаблонов", "templates.json", "Шаблоны (*.json)"
+        )
+        if not path:
+            return
+        try:
+            save_templates_file(path, self.personal_templates)
+            self.status_bar.showMessage(f"Шаблоны сохранены в {path}")
+        except Exception as e:
+            self.status_bar.showMessage(f"Ошибка экспорта шаблонов: {str(e)}")
+
+    def show_template_changes(self):
+        dialog = TemplateChangesDialog(self, self.template_store.changes())
+        dialog.exec()
+
     def reload_templates(self):
         """Перезагрузка шаблонов из файла"""
         try:
@@ -891,150 +1477,105 @@ class KompasApp(QMainWindow):
         """
         QMessageBox.information(self, "Горячие клавиши", shortcuts_text)
 
-    def populate_template_tabs(self, search_term=None):
-        self.template_tabs.clear()
+    def on_template_tab_changed(self, index):
+        if 0 <= index < len(self.template_proxies):
+            self.template_proxies[index].set_search_term(self.template_search_term)
 
-        # Вкладка "Все"
-        all_tab = QWidget()
-        all_layout = QVBoxLayout(all_tab)
-        all_list = QListWidget()
-        all_layout.addWidget(all_list)
-        self.template_tabs.addTab(all_tab, "Все")
-        all_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        all_list.customContextMenuRequested.connect(
-            lambda pos: self.show_template_context_menu(pos, all_list)
+    def populate_template_tabs(self):
+        """Вкладки шаблонов: "Все" и по одной на категорию (создаются при загрузке)"""
+        for index in range(self.template_tabs.count()):
+            self.template_tabs.widget(index).deleteLater()
+        self.template_tabs.clear()
+        for proxy in self.template_proxies:
+            proxy.deleteLater()
+        self.template_proxies = []
+
+        for category in [None] + list(self.templates.keys()):
+            self.add_template_tab(category)
+
+    def add_template_tab(self, category):
+        proxy = TemplateFilterProxy(category, self.template_tabs)
+        proxy.setSourceModel(self.template_model)
+        self.template_proxies.append(proxy)
+
+        tab = QWidget()
+        tab_layout = QVBoxLayout(tab)
+        list_view = QListView()
+        list_view.setModel(proxy)
+        list_view.setUniformItemSizes(True)
+        list_view.setItemDelegate(self.template_delegate)
+        tab_layout.addWidget(list_view)
+        self.template_tabs.addTab(tab, "Все" if category is None else category)
+        list_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        list_view.customContextMenuRequested.connect(
+            lambda pos, lv=list_view: self.show_template_context_menu(pos, lv)
         )
-        all_list.itemDoubleClicked.connect(self.insert_template)
-
-        found_count = 0
-
-        for category, templates in self.templates.items():
-            tab = QWidget()
-            tab_layout = QVBoxLayout(tab)
-            list_widget = QListWidget()
-            tab_layout.addWidget(list_widget)
-            self.template_tabs.addTab(tab, category)
-            list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-            list_widget.customContextMenuRequested.connect(
-                lambda pos, lw=list_widget: self.show_template_context_menu(pos, lw)
-            )
-            list_widget.itemDoubleClicked.connect(self.insert_template)
-
-            for template in templates:
-                if isinstance(template, dict):
-                    text = template.get("text", "")
-                    variants = template.get("variants", [])
-                    if (
-                        search_term is None
-                        or not search_term
-                        or search_term.lower() in text.lower()
-                        or any(
-                            search_term.lower()
-                            in (
-                                variant.get("text", "")
-                                if isinstance(variant, dict)
-                                else variant
-                            ).lower()
-                            for variant in variants
-                        )
-                    ):
-                        # Для категорийных вкладок
-                        item = QListWidgetItem(text)
-                        item.setData(Qt.ItemDataRole.UserRole, template)
-                        list_widget.addItem(item)
-
-                        # Для вкладки "Все"
-                        all_item = QListWidgetItem(f"[{category}] {text}")
-                        all_item.setData(Qt.ItemDataRole.UserRole, template)
-                        all_list.addItem(all_item)
-
-                        found_count += 1
-                else:
-                    # Обратная совместимость со старым форматом
-                    if (
-                        search_term is None
-                        or not search_term
-                        or search_term.lower() in template.lower()
-                    ):
-                        item = QListWidgetItem(template)
-                        item.setData(
-                            Qt.ItemDataRole.UserRole, {"text": template, "variants": []}
-                        )
-                        list_widget.addItem(item)
-                        all_item = QListWidgetItem(f"[{category}] {template}")
-                        all_item.setData(
-                            Qt.ItemDataRole.UserRole, {"text": template, "variants": []}
-                        )
-                        all_list.addItem(all_item)
-                        found_count += 1
-
-        if search_term:
-            self.template_tabs.setCurrentIndex(0)
-            self.status_bar.showMessage(
-                f"Найдено шаблонов: {found_count} по запросу '{search_term}'"
-            )
-        else:
-            self.status_bar.showMessage("Показаны все шаблоны")
-
-    def show_template_context_menu(self, pos, list_widget):
-        item = list_widget.itemAt(pos)
-        if not item:
+        list_view.doubleClicked.connect(self.insert_template)
+
+    def update_template_tabs(self):
+        """Вкладки исчезнувших категорий удаляются, новых - добавляются"""
+        categories = set(self.templates)
+        for index in reversed(range(1, len(self.template_proxies))):
+            proxy = self.template_proxies[index]
+            if proxy.category not in categories:
+                # Прокси убирается из списка до удаления вкладки: смена
+                # текущей вкладки сразу ищет прокси по номеру
+                del self.template_proxies[index]
+                tab = self.template_tabs.widget(index)
+                self.template_tabs.removeTab(index)
+                tab.deleteLater()
+                proxy.deleteLater()
+        shown = {proxy.category for proxy in self.template_proxies}
+        for category in self.templates:
+            if category not in shown:
+                self.add_template_tab(category)
+
+    def show_template_context_menu(self, pos, list_view):
+        index = list_view.indexAt(pos)
+        if not index.isValid():
             return
 
-        template = item.data(Qt.ItemDataRole.UserRole)
-        if (
-            not isinstance(template, dict)
-            or "variants" not in template
-            or not template["variants"]
-        ):
+        template = index.data(Qt.ItemDataRole.UserRole)
+        if not template.variants:
             return
 
         menu = QMenu(self)
         style = self.style()
 
-        for variant in template["variants"]:
-            if isinstance(variant, dict):
-                variant_text = variant.get("text", "")
-                custom_input = variant.get("custom_input", False)
-            else:
-                variant_text = variant
-                custom_input = False
-
-            action = QAction(variant_text, self)
-            if custom_input:
+        for variant in template.variants:
+            action = QAction(variant.text, self)
+            if variant.custom_input:
                 icon = style.standardIcon(
                     QStyle.StandardPixmap.SP_FileDialogDetailedView
                 )
                 action.setIcon(icon)
-
-            if custom_input:
                 action.triggered.connect(
-                    lambda checked, t=template[
-                        "text"
-                    ], v=variant_text: self.insert_custom_variant(t, v)
+                    lambda checked, v=variant: self.insert_custom_variant(
+                        template.text, v
+                    )
                 )
             else:
                 action.triggered.connect(
-                    lambda checked, t=template[
-                        "text"
-                    ], v=variant_text: self.insert_template_variant(t, v)
+                    lambda checked, v=variant.text: self.insert_template_variant(
+                        template.text, v
+                    )
                 )
             menu.addAction(action)
 
-        menu.exec(list_widget.mapToGlobal(pos))
+        menu.exec(list_view.mapToGlobal(pos))
 
-    def insert_custom_variant(self, base_text, variant_text):
+    def insert_custom_variant(self, base_text, variant):
         custom_value, ok = QInputDialog.getText(
-            self, "Ввод значения", f"Введите значение для {variant_text}:"
+            self, "Ввод значения", f"Введите значение для {variant.text}:"
         )
         if ok and custom_value:
-            # Проверяем, есть ли в variant_text маркер {}
-            if "{}" in variant_text:
+            # Проверяем, есть ли в варианте маркер {}
+            if variant.placeholder >= 0:
                 # Вставляем значение в место, указанное маркером
-                full_text = f"{base_text} {variant_text.format(custom_value)}"
+                full_text = f"{base_text} {variant.fill(custom_value)}"
             else:
                 # Запасной вариант: старый порядок
-                full_text = f"{base_text} {custom_value} {variant_text}"
+                full_text = f"{base_text} {custom_value} {variant.text}"
             self.current_reqs_text.insertPlainText(full_text + "\n")
             self.status_bar.showMessage(f"Вставлен шаблон: {full_text[:30]}...")
 
@@ -1047,23 +1588,29 @@ class KompasApp(QMainWindow):
         """Обновление информации об активном документе."""
         try:
             if not hasattr(self, "app7") or not self.app7:
-                self.connect_status.setText("🔴 Нет подключения")
-                self.connect_status.setStyleSheet("color: red;")
+                if not self.connecting:
+                    self.connect_status.setText("🔴 Нет подключения")
+                    self.connect_status.setStyleSheet("color: red;")
                 self.active_doc_label.setText("Нет активного документа")
                 return
 
-            active_doc = self.app7.ActiveDocument
+            active_doc = self.session.active_document()
             if active_doc:
                 doc_name = active_doc.Name
                 if not doc_name:  # Проверка на пустое имя
                     self.active_doc_label.setText("Нет активного документа")
                     return
-                doc_type = self.get_document_type(active_doc)
-                doc_path = active_doc.Path or "Документ не сохранен"
+                record = self.document_registry.find_by_name(doc_name)
+                doc_type = (
+                    record.type_name if record else self.get_document_type(active_doc)
+                )
                 self.active_doc_label.setText(f"Документ: {doc_name} ({doc_type})")
                 self.connect_status.setText("🟢 Подключено")
                 self.connect_status.setStyleSheet("color: green;")
-                self.select_document_in_tree(active_doc)
+                if doc_name != self.last_active_doc_name:
+                    # Не перебиваем выбор пользователя, пока активный документ тот же
+                    self.last_active_doc_name = doc_name
+                    self.select_document_in_tree(active_doc)
             else:
                 self.active_doc_label.setText("Нет активного документа")
         except Exception as e:
@@ -1072,14 +1619,216 @@ class KompasApp(QMainWindow):
                 f"Ошибка при обновлении активного документа: {str(e)}"
             )
 
+    def after_document_closed(self):
+        self.update_documents_tree()
+        self.update_active_document_info()
+
+    def load_tt_when_active(self, doc_name):
+        """Чтение ТТ, как только doc_name станет активным в KOMPAS"""
+        self.ready.when(
+            document_active(self.session, doc_name),
+            self.get_technical_requirements,
+            on_timeout=lambda: self.set_status_message(
+                f"Документ {doc_name} не стал активным", False
+            ),
+            name="load_tt",
+        )
+
     def on_document_double_click(self, item, column):
         """Обработка двойного клика на документе в дереве"""
         doc_name = item.text(1)  # Имя теперь в столбце 1
         doc_type = item.text(2)  # Тип теперь в столбце 2
         if self.activate_document_by_name(doc_name):
-            if doc_type == "Чертеж":
-                QTimer.singleShot(100, self.get_technical_requirements)
+            if doc_type == "Чертеж" and not self.show_tt_buffer(doc_name):
                 self.status_bar.showMessage("Загрузка технических требований...")
+                self.load_tt_when_active(doc_name)
+
+    def show_tt_buffer(self, doc_name):
+        """ТТ чертежа из буфера, без чтения через KOMPAS; False - буфера нет"""
+        try:
+            doc = self.session.find_document(doc_name)
+            if doc is None:
+                return False
+            key = buffer_key(doc_name, doc.PathName)
+            stamp = document_stamp(doc)
+        except Exception:
+            return False
+        # Повторный выбор того же чертежа не должен терять набранный текст
+        self.stash_tt_buffer()
+        buffer = self.tt_buffers.lookup(key, stamp)
+        if buffer is None:
+            return False
+        self.show_tt_text(key, buffer.display_text, buffer.cursor)
+        if buffer.stamp is None:
+            # Чертеж изменился, а в буфере несохраненные правки: правки
+            # остаются в редакторе, ТТ чертежа перечитываются в буфер (без
+            # создания пустых ТТ: показ буфера чертеж не меняет)
+            self.read_active_tt(self.on_tt_buffer_refreshed, create=False)
+            self.status_bar.showMessage(
+                f"{doc_name}: несохраненные правки ТТ (чертеж изменен в KOMPAS)"
+            )
+        elif buffer.dirty:
+            self.status_bar.showMessage(f"{doc_name}: несохраненные правки ТТ")
+        else:
+            self.status_bar.showMessage(f"Технические требования {doc_name}")
+        return True
+
+    def show_tt_text(self, key, text, cursor=None):
+        """Текст ТТ документа key в редакторе; правки прежнего - в его буфер"""
+        if self.tt_buffer_key is not None and key != self.tt_buffer_key:
+            self.stash_tt_buffer()
+        self.tt_buffer_key = key
+        self.current_reqs_text.setPlainText(text)
+        if cursor:
+            text_cursor = self.current_reqs_text.textCursor()
+            text_cursor.setPosition(min(cursor, len(text)))
+            self.current_reqs_text.setTextCursor(text_cursor)
+
+    def stash_tt_buffer(self):
+        """Текст редактора и курсор - в буфер текущего документа"""
+        if self.tt_buffer_key is None:
+            return
+        self.tt_buffers.remember_edit(
+            self.tt_buffer_key,
+            self.current_reqs_text.toPlainText(),
+            self.current_reqs_text.textCursor().position(),
+        )
+
+    def prefetch_tt_buffers(self):
+        """Чтение ТТ открытых чертежей в буферы после всех других заданий"""
+        if self.tt_prefetch_job is not None or not self.session.is_connected:
+            return
+        self.tt_prefetch_job = self.worker.submit(
+            prefetch_tt_job,
+            self.tt_buffers.stamps(),
+            self.tt_index,
+            priority=PRIORITY_BACKGROUND,
+            name="prefetch_tt_buffers",
+            on_result=self.on_tt_buffers_prefetched,
+            on_error=self.on_tt_buffers_prefetch_failed,
+        )
+
+    def on_tt_buffers_prefetched(self, results):
+        self.tt_prefetch_job = None
+        keys = {
+            buffer_key(record.name, record.path_name)
+            for record in self.document_registry
+        }
+        for document_tt in results:
+            # Документ могли закрыть, пока задание ждало очереди
+            if document_tt.key in keys:
+                self.tt_buffers.store(document_tt)
+
+    def on_tt_buffers_prefetch_failed(self, error):
+        self.tt_prefetch_job = None
+        logging.getLogger("kompas").debug("Буферы ТТ не прочитаны: %s", error)
+
+    def on_tt_buffer_refreshed(self, result):
+        """ТТ перечитаны в буфер; несохраненные правки в редакторе не трогаются"""
+        if result.key is not None:
+            self.tt_buffers.store(result)
+
+    def search_tt(self):
+        """Поиск по ТТ проиндексированных чертежей"""
+        self.tt_search_timer.stop()
+        query = self.tt_search_edit.text()
+        self.tt_search_results.clear()
+        if not query.strip():
+            return
+        mode = self.tt_search_mode.currentData()
+        try:
+            self.tt_search.sync(self.tt_index)
+            hits = self.tt_search.search(query, mode, self.tt_search_folder)
+        except re.error as e:
+            self.status_bar.showMessage(f"Ошибка в регулярном выражении: {str(e)}")
+            return
+        except Exception as e:
+            self.set_status_message(f"Ошибка поиска по ТТ: {str(e)}", False)
+            return
+        items = []
+        for hit in hits:
+            item = QTreeWidgetItem(
+                [os.path.basename(hit.path), str(hit.line), hit.text]
+            )
+            item.setToolTip(0, hit.path)
+            item.setToolTip(2, hit.text)
+            item.setData(0, Qt.ItemDataRole.UserRole, hit.path)
+            items.append(item)
+        self.tt_search_results.addTopLevelItems(items)
+        drawings = len({hit.path for hit in hits})
+        self.status_bar.showMessage(
+            f"Поиск по ТТ: {len(hits)} строк в {drawings} чертежах "
+            f"(в индексе {len(self.tt_search)})"
+        )
+
+    def set_search_folder(self, folder):
+        self.tt_search_folder = folder
+        self.tt_search_scope_label.setText(
+            f"Папка: {folder}" if folder else "Все проиндексированные чертежи"
+        )
+        self.search_tt()
+
+    def index_search_folder(self):
+        """Индексация ТТ чертежей папки (только изменившихся) для поиска"""
+        if self.batch_job_id is not None:
+            self.set_status_message("Пакетная операция уже выполняется", False)
+            return
+        folder = QFileDialog.getExistingDirectory(
+            self, "Папка проекта для поиска по ТТ"
+        )
+        if not folder:
+            return
+        self.run_batch_job(
+            f"Индексация ТТ: {folder}",
+            audit_folder_job,
+            folder,
+            self.tt_classifier,
+            self.tt_index,
+            name="index_search_folder",
+            on_result=self.on_search_folder_indexed,
+            on_error=self.on_folder_audit_failed,
+        )
+
+    def on_search_folder_indexed(self, result):
+        self.finish_batch_job(cancelled=result.cancelled)
+        message = (
+            f"Проиндексировано чертежей: {len(result.rows)}, "
+            f"без изменений: {result.cached}"
+        )
+        if result.cancelled:
+            message = "Индексация прервана. " + message
+        self.set_status_message(message, not result.cancelled)
+        self.set_search_folder(result.folder)
+
+    def on_search_hit_double_click(self, item, column):
+        """Открытие (или активация) чертежа из результатов поиска"""
+        path = item.data(0, Qt.ItemDataRole.UserRole)
+        try:
+            if not hasattr(self, "app7") or not self.app7:
+                self.status_bar.showMessage("Нет подключения к KOMPAS-3D")
+                return
+            key = os.path.normcase(os.path.abspath(path))
+            doc = None
+            for record in self.document_registry:
+                if (
+                    record.is_saved
+                    and os.path.normcase(os.path.abspath(record.path_name)) == key
+                ):
+                    doc = self.session.find_document(record.name)
+                    break
+            if doc is None:
+                doc = self.session.open_document(path, visible=True, read_only=False)
+                if not doc:
+                    raise RuntimeError(f"KOMPAS не открыл файл {path}")
+            doc.Active = True
+            self.update_documents_tree()
+            self.update_active_document_info()
+            self.status_bar.showMessage(f"Открыт чертеж: {os.path.basename(path)}")
+            self.load_tt_when_active(doc.Name)
+        except Exception as e:
+            error_message = self.handle_kompas_error(e, "открытия чертежа")
+            self.status_bar.showMessage("Ошибка при открытии чертежа")
+            QMessageBox.critical(self, "Ошибка", error_message)
 
     def activate_document_by_name(self, doc_name):
         """Активация документа по имени"""
@@ -1088,14 +1837,12 @@ class KompasApp(QMainWindow):
                 self.connect_to_kompas()
                 if not hasattr(self, "app7") or not self.app7:
                     return False
-            documents = self.app7.Documents
-            for i in range(documents.Count):
-                doc = documents.Item(i)
-                if doc.Name == doc_name:
-                    doc.Active = True
-                    self.update_active_document_info()
-                    self.status_bar.showMessage(f"Документ {doc_name} активирован")
-                    return True
+            doc = self.session.find_document(doc_name)
+            if doc is not None:
+                doc.Active = True
+                self.update_active_document_info()
+                self.status_bar.showMessage(f"Документ {doc_name} активирован")
+                return True
             self.status_bar.showMessage(f"Документ {doc_name} не найден")
             return False
         except Exception as e:
@@ -1106,22 +1853,22 @@ class KompasApp(QMainWindow):
 
     def insert_template(self, item):
         template = item.data(Qt.ItemDataRole.UserRole)
-        if isinstance(template, dict):
-            text = template.get("text", "")
-            variants = template.get("variants", [])
-            if variants:
-                # Вставляем первую вариацию по умолчанию при двойном клике
-                self.insert_template_variant(text, variants[0])
-            else:
-                self.current_reqs_text.insertPlainText(text + "\n")
-                self.status_bar.showMessage(f"Вставлен шаблон: {text[:30]}...")
+        if template.variants:
+            # Вставляем первую вариацию по умолчанию при двойном клике
+            self.insert_template_variant(template.text, template.variants[0].text)
         else:
-            # Обратная совместимость со старым форматом
-            self.current_reqs_text.insertPlainText(template + "\n")
-            self.status_bar.showMessage(f"Вставлен шаблон: {template[:30]}...")
+            self.current_reqs_text.insertPlainText(template.text + "\n")
+            self.status_bar.showMessage(f"Вставлен шаблон: {template.text[:30]}...")
 
     def get_technical_requirements(self):
-        """Получение технических требований из активного документа"""
+        """Получение технических требований из активного документа (в фоне)"""
+        self.read_active_tt(self.on_technical_requirements_loaded)
+
+    def read_active_tt(self, on_result, create=True):
+        """Чтение ТТ активного документа в фоне; on_result(DocumentTT).
+
+        create - создать пустые ТТ, если их нет.
+        """
         try:
             # Проверка подключения к KOMPAS-3D
             if not hasattr(self, "module7") or not self.module7:
@@ -1129,64 +1876,50 @@ class KompasApp(QMainWindow):
                 if not hasattr(self, "module7") or not self.module7:
                     return
 
-            # Проверка наличия активного документа
-            active_doc = self.app7.ActiveDocument
-            if not active_doc:
-                self.status_bar.showMessage("Нет активного документа")
-                QMessageBox.warning(
-                    self, "Внимание", "Нет активного документа в КОМПАС-3D"
-                )
-                return
-
-            try:
-                # Получение интерфейса чертежа и технических требований
-                drawing_document = self.module7.IDrawingDocument(active_doc)
-                tech_demand = drawing_document.TechnicalDemand
-
-                # Проверка, созданы ли технические требования
-                if not tech_demand.IsCreated:
-                    # Создание новых пустых технических требований
-                    tt = tech_demand.Text
-                    stroka = tt.Add().Add()
-                    stroka.Str = "  "
-                    # tech_demand.Create()
-                    self.status_bar.showMessage(
-                        "Созданы новые пустые технические требования"
-                    )
-                    self.current_reqs_text.setPlainText("")
-                    return
-
-                # Получение текста технических требований
-                text = tech_demand.Text
-                if text.Count == 0:
-                    self.status_bar.showMessage("Технические требования пусты")
-                    self.current_reqs_text.setPlainText("")
-                    return
-
-                # Парсинг и отображение существующих требований
-                formatted_text = self.parse_tech_req(text)
-                self.current_reqs_text.setPlainText(formatted_text)
-                doc_name = active_doc.Name
-                self.status_bar.showMessage(
-                    f"Технические требования загружены из {doc_name}"
-                )
-            except Exception as e:
-                error_message = self.handle_kompas_error(
-                    e, "получения технических требований"
-                )
-                print(error_message)
-                self.status_bar.showMessage("Ошибка при получении тех. требований")
-                QMessageBox.critical(self, "Ошибка", error_message)
-
+            self.worker.submit(
+                read_active_tt_job,
+                create,
+                priority=PRIORITY_INTERACTIVE,
+                name="get_technical_requirements",
+                on_result=on_result,
+                on_error=self.on_technical_requirements_failed,
+            )
         except Exception as e:
             error_message = self.handle_kompas_error(e, "работы с документом")
             self.status_bar.showMessage("Ошибка при работе с документом")
             QMessageBox.critical(self, "Ошибка", error_message)
 
+    def on_technical_requirements_loaded(self, result):
+        """Отображение ТТ, прочитанных фоновым заданием"""
+        if result.state == TT_NO_DOCUMENT:
+            self.status_bar.showMessage("Нет активного документа")
+            QMessageBox.warning(self, "Внимание", "Нет активного документа в КОМПАС-3D")
+            return
+        # Явное чтение: в буфере и редакторе - ТТ из чертежа
+        self.tt_buffers.store(result, keep_edits=False)
+        self.show_tt_text(result.key, result.text)
+        if result.state == TT_CREATED:
+            self.status_bar.showMessage("Созданы новые пустые технические требования")
+        elif result.state == TT_EMPTY:
+            self.status_bar.showMessage("Технические требования пусты")
+        else:
+            self.status_bar.showMessage(
+                f"Технические требования загружены из {result.name}"
+            )
+
+    def on_technical_requirements_failed(self, error):
+        error_message = self.handle_kompas_error(
+            error, "получения технических требований"
+        )
+        print(error_message)
+        self.status_bar.showMessage("Ошибка при получении тех. требований")
+        QMessageBox.critical(self, "Ошибка", error_message)
+
     def save_technical_requirements(self):
         """Сохранение технических требований в активный документ"""
         self.apply_technical_requirements(save_document=True)
 
+    @com_action("apply_technical_requirements")
     def apply_technical_requirements(self, save_document=False):
         """Применение технических требований к активному документу"""
         try:
@@ -1196,121 +1929,109 @@ class KompasApp(QMainWindow):
                     self.set_status_message("Нет подключения к KOMPAS-3D", False)
                     return
 
-            active_doc = self.app7.ActiveDocument
+            active_doc = self.session.active_document()
             if not active_doc:
                 self.set_status_message("Нет активного документа", False)
                 return
 
             text_content = self.current_reqs_text.toPlainText().strip()
+            processed_lines = (
+                editor_text_to_lines(text_content, self.auto_numbering_var)
+                if text_content
+                else []
+            )
 
             try:
-                drawing_document = self.module7.IDrawingDocument(active_doc)
-                tech_demand = drawing_document.TechnicalDemand
-
-                if not text_content:
-                    if tech_demand.IsCreated:
-                        text_obj = tech_demand.Text
-                        while text_obj.Count > 0:
-                            line = text_obj.TextLines[0]
-                            line.Delete()
-                        if hasattr(tech_demand, "Update"):
-                            tech_demand.Update()
-                        if hasattr(drawing_document, "Update"):
-                            drawing_document.Update()
-                        elif hasattr(active_doc, "Update"):
-                            active_doc.Update()
-                        self.set_status_message("Технические требования очищены")
-                    else:
+                doc_name = active_doc.Name
+                key = buffer_key(doc_name, active_doc.PathName)
+                buffer = self.tt_buffers.get(key)
+                # ТТ чертежа читаются всегда: правку ТТ в KOMPAS отметка
+                # документа не отражает, сверка идет по хешу содержания
+                loaded_hash = buffer.tt_hash if buffer is not None else None
+                result = write_document_tt(
+                    self.session, active_doc, processed_lines, loaded_hash
+                )
+                if result.conflict:
+                    reply = QMessageBox.question(
+                        self,
+                        "ТТ изменены в KOMPAS",
+                        f"Технические требования {doc_name} изменены в KOMPAS "
+                        "после загрузки в редактор.\n"
+                        "Заменить их текстом из редактора?",
+                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                    )
+                    if reply != QMessageBox.StandardButton.Yes:
                         self.set_status_message(
-                            "Нет технических требований для применения"
+                            "Применение отменено: ТТ чертежа изменены в KOMPAS",
+                            False,
                         )
-                    return
-
-                if not tech_demand.IsCreated:
-                    tt = tech_demand.Text
-                    stroka = tt.Add().Add()
-                    stroka.Str = "  "
-
-                text_obj = tech_demand.Text
-                while text_obj.Count > 0:
-                    line = text_obj.TextLines[0]
-                    line.Delete()
-
-                lines = text_content.split("\n")
-                lines = [line.strip() for line in lines if line.strip()]
-                processed_lines = []
-
-                if self.auto_numbering_var:
-                    cleaned_lines = []
-                    should_number = []
-                    for i, line in enumerate(lines):
-                        clean_line = re.sub(r"^\d+\.\s*", "", line).lstrip()
-                        cleaned_lines.append(clean_line)
-                        if i > 0 and (
-                            (len(clean_line) > 0 and clean_line[0].islower())
-                            or clean_line.startswith("-")
-                            or clean_line.startswith("–")
-                        ):
-                            should_number.append(False)
-                        else:
-                            should_number.append(True)
-                    for i, (line, should_num) in enumerate(
-                        zip(cleaned_lines, should_number)
-                    ):
-                        processed_lines.append((line, should_num))
-                else:
-                    for line in lines:
-                        num_match = re.match(r"^(\d+)\.\s*(.*)", line)
-                        if num_match:
-                            req_text = num_match.group(2).strip()
-                            processed_lines.append((req_text, True))
-                        else:
-                            indent_match = re.match(r"^\s+(.+)", line)
-                            if indent_match:
-                                req_text = indent_match.group(1).strip()
-                                processed_lines.append((req_text, False))
-                            else:
-                                processed_lines.append((line, True))
-                if len(processed_lines) == 1:
-                    # Для единственного пункта отключаем нумерацию
-                    processed_lines[0] = (processed_lines[0][0], False)
-
-                for line_text, is_numbered in processed_lines:
-                    try:
-                        text_line = text_obj.Add()
-                        text_line.Str = line_text
-                        text_line.Numbering = 1 if is_numbered else 0
-                    except Exception as line_error:
-                        print(
-                            f"Ошибка при добавлении строки '{line_text}': {str(line_error)}"
-                        )
-
-                if hasattr(tech_demand, "Update"):
-                    tech_demand.Update()
-                if hasattr(drawing_document, "Update"):
-                    drawing_document.Update()
-                elif hasattr(active_doc, "Update"):
-                    active_doc.Update()
+                        return
+                    result = write_document_tt(
+                        self.session,
+                        active_doc,
+                        processed_lines,
+                        loaded_hash,
+                        force=True,
+                    )
 
+                saved_since = None
                 if save_document:
-                    try:
-                        active_doc.Save()
-                        # Устанавливаем требуемое сообщение
+                    # Сохраняется только измененный чертеж
+                    if result.edits or active_doc.Changed:
+                        try:
+                            saved_since = time.time_ns()
+                            active_doc.Save()
+                            self.set_status_message(
+                                "Файл сохранен, технические требования обновлены",
+                                success=True,
+                            )
+                        except Exception as e:
+                            error_msg = self.handle_kompas_error(
+                                e, "сохранения документа"
+                            )
+                            self.set_status_message(
+                                "Не удалось сохранить документ", False
+                            )
+                            return
+                    else:
                         self.set_status_message(
-                            "Файл сохранен, технические требования обновлены",
-                            success=True,
+                            "Чертеж не изменен, сохранение не требуется"
                         )
-                        # Откладываем вызов get_technical_requirements, чтобы сообщение успело отобразиться
-                        QTimer.singleShot(2000, self.get_technical_requirements)
-                    except Exception as e:
-                        error_msg = self.handle_kompas_error(e, "сохранения документа")
-                        self.set_status_message("Не удалось сохранить документ", False)
+                elif not result.edits:
+                    self.set_status_message("Технические требования не изменились")
+                elif not processed_lines:
+                    self.set_status_message("Технические требования очищены")
                 else:
-                    doc_name = active_doc.Name
                     self.set_status_message(
                         f"Технические требования применены к {doc_name}"
                     )
-                    self.get_technical_requirements()
+
+                # В чертеже теперь ТТ из редактора: буфер обновляется без
+                # повторного чтения ТТ из KOMPAS
+                text = format_tt_lines(processed_lines)
+                self.tt_buffers.store(
+                    DocumentTT(
+                        doc_name,
+                        key,
+                        document_stamp(active_doc),
+                        TT_LOADED if text else TT_EMPTY,
+                        text,
+                    ),
+                    keep_edits=False,
+                )
+                self.show_tt_text(
+                    key, text, self.current_reqs_text.textCursor().position()
+                )
+                if saved_since is not None and active_doc.PathName:
+                    # Отметка буфера (время файла) - когда файл записан на диск
+                    self.ready.when(
+                        file_written(active_doc.PathName, saved_since),
+                        lambda: self.restamp_tt_buffer(key, active_doc),
+                        on_timeout=lambda: self.set_status_message(
+                            f"Файл {doc_name} не записан на диск", False
+                        ),
+                        name=f"saved:{key}",
+                    )
 
             except Exception as e:
                 error_message = self.handle_kompas_error(
@@ -1321,28 +2042,31 @@ class KompasApp(QMainWindow):
             error_message = self.handle_kompas_error(e, "работы с документом")
             self.set_status_message("Ошибка при работе с документом", False)
 
+    def restamp_tt_buffer(self, key, doc):
+        try:
+            self.tt_buffers.restamp(key, document_stamp(doc))
+        except Exception:
+            # Документ уже закрыт - буфер удалится при обновлении дерева
+            pass
+
     def select_document_in_tree(self, document):
         """Выбор документа в дереве документов"""
         try:
             if not document:
                 return
             doc_name = document.Name
-            for i in range(self.doc_tree.topLevelItemCount()):
-                item = self.doc_tree.topLevelItem(i)
-                if item.text(1) == doc_name:  # Имя теперь в столбце 1
-                    self.doc_tree.setCurrentItem(item)
-                    self.doc_tree.scrollToItem(item)
-                    return
-            self.update_documents_tree()
-            for i in range(self.doc_tree.topLevelItemCount()):
-                item = self.doc_tree.topLevelItem(i)
-                if item.text(1) == doc_name:  # Имя теперь в столбце 1
-                    self.doc_tree.setCurrentItem(item)
-                    self.doc_tree.scrollToItem(item)
-                    return
+            record = self.document_registry.find_by_name(doc_name)
+            if record is None:
+                self.update_documents_tree()
+                record = self.document_registry.find_by_name(doc_name)
+            item = self.doc_tree_items.get(record.key) if record else None
+            if item is not None and self.doc_tree.currentItem() is not item:
+                self.doc_tree.setCurrentItem(item)
+                self.doc_tree.scrollToItem(item)
         except Exception:
             pass
 
+    @com_action("update_documents_tree")
     def update_documents_tree(self, search_term=None):
         """Обновление дерева документов с учетом поиска"""
         try:
@@ -1350,44 +2074,11 @@ class KompasApp(QMainWindow):
                 self.status_bar.showMessage("Нет подключения к KOMPAS-3D")
                 return
 
-            self.doc_tree.clear()
-            documents = self.app7.Documents
-            doc_count = 0
-
-            for i in range(documents.Count):
-                try:
-                    doc = documents.Item(i)
-                    if doc is None:
-                        continue
-                    doc_name = doc.Name
-                    if not doc_name:
-                        continue
-                    if search_term and search_term.lower() not in doc_name.lower():
-                        continue
-
-                    doc_type = self.get_document_type(doc)
-                    doc_path = doc.Path or "Документ не сохранен"
-                    item = QTreeWidgetItem(self.doc_tree)
-
-                    # Устанавливаем индикатор по умолчанию (без проверки)
-                    item.setText(0, "⚪")  # Статус (индекс 0)
-                    item.setText(1, doc_name)  # Имя (индекс 1)
-                    item.setText(2, doc_type)  # Тип (индекс 2)
-                    item.setText(3, doc_path)  # Путь (индекс 3)
-
-                    if (
-                        self.app7.ActiveDocument
-                        and self.app7.ActiveDocument.Name == doc_name
-                    ):
-                        self.doc_tree.setCurrentItem(item)
-                        self.doc_tree.scrollToItem(item)
-
-                    doc_count += 1
-                except Exception as e:
-                    self.status_bar.showMessage(
-                        f"Ошибка при обработке документа: {str(e)}"
-                    )
-                    continue
+            changes = self.refresh_document_registry()
+            self.patch_documents_tree(changes)
+            doc_count = self.apply_documents_filter(
+                search_term or self.doc_search_edit.text()
+            )
 
             self.status_bar.showMessage(f"Найдено документов: {doc_count}")
             self.docs_count_label.setText(f"Документов: {doc_count}")
@@ -1396,80 +2087,129 @@ class KompasApp(QMainWindow):
                 f"Ошибка при обновлении дерева документов: {str(e)}"
             )
 
+    def refresh_document_registry(self):
+        """Перечитывание реестра документов с подпиской на события новых"""
+        changes = self.document_registry.refresh(self.session)
+        self.document_tracker.sync_documents(changes)
+        if changes.removed:
+            # Буферы закрытых документов больше не нужны
+            keys = {
+                buffer_key(record.name, record.path_name)
+                for record in self.document_registry
+            }
+            self.tt_buffers.retain(keys)
+            if self.tt_buffer_key not in keys:
+                self.tt_buffer_key = None
+        if changes.added:
+            self.prefetch_tt_buffers()
+        return changes
+
+    def patch_documents_tree(self, changes):
+        """Точечная правка дерева по изменениям реестра (без clear())"""
+        for record in changes.removed:
+            item = self.doc_tree_items.pop(record.key, None)
+            if item is not None:
+                self.doc_tree.takeTopLevelItem(self.doc_tree.indexOfTopLevelItem(item))
+
+        for record in changes.changed:
+            self.fill_document_item(self.doc_tree_items[record.key], record)
+
+        if changes.added:
+            self.apply_index_statuses(changes.added)
+            for index, record in enumerate(self.document_registry):
+                if record.key in self.doc_tree_items:
+                    continue
+                item = QTreeWidgetItem()
+                self.fill_document_item(item, record)
+                self.doc_tree.insertTopLevelItem(index, item)
+                self.doc_tree_items[record.key] = item
+
+        # Выделение переводим на активный документ, только если он сменился
+        active = self.document_registry.active_record
+        if changes.active_changed and active is not None:
+            item = self.doc_tree_items[active.key]
+            self.doc_tree.setCurrentItem(item)
+            self.doc_tree.scrollToItem(item)
+
+    def apply_index_statuses(self, records):
+        """Статус ТТ новых чертежей из индекса, если их файлы не менялись"""
+        for record in records:
+            if not record.is_drawing or not record.is_saved:
+                continue
+            try:
+                entry = self.tt_index.lookup(record.path_name, check_hash=False)
+                if entry is not None:
+                    issues = self.tt_index.issues(entry, self.tt_classifier)
+                    record.set_status(issues, "по индексу ТТ")
+            except Exception as e:
+                logging.getLogger("kompas").debug("Индекс ТТ недоступен: %s", e)
+                return
+
+    def fill_document_item(self, item, record):
+        """Заполнение строки дерева по записи реестра"""
+        item.setText(0, record.status)  # Статус (индекс 0)
+        item.setToolTip(0, record.status_tip)
+        item.setText(1, record.name)  # Имя (индекс 1)
+        item.setText(2, record.type_name)  # Тип (индекс 2)
+        item.setText(3, record.path)  # Путь (индекс 3)
+
+    def apply_documents_filter(self, search_term):
+        """Скрытие строк, не подходящих под поиск; возвращает число видимых"""
+        search_term = (search_term or "").lower()
+        visible = 0
+        for record in self.document_registry:
+            hidden = bool(search_term) and search_term not in record.name.lower()
+            self.doc_tree_items[record.key].setHidden(hidden)
+            visible += not hidden
+        return visible
+
+    def clear_documents_tree(self):
+        self.doc_tree.clear()
+        self.doc_tree_items = {}
+        self.document_registry.clear()
+        self.tt_buffers.clear()
+        self.tt_buffer_key = None
+        self.ready.clear()
+
     def get_document_type(self, doc):
         """Определение типа документа по DocumentType с уточнением через интерфейсы."""
-        try:
-            doc_type_value = doc.DocumentType
-            if doc_type_value == 1:
-                return "Чертеж"
-            elif doc_type_value == 3:
-                return "Спецификация"
-            elif doc_type_value == 2:
-                return "Фрагмент"
-            elif doc_type_value == 4:
-                return "Модель"
-            elif doc_type_value == 5:
-                return "Сборка"
-
-            else:
-                # Дополнительная проверка через интерфейсы для неизвестных типов
-                try:
-                    doc._oleobj_.QueryInterface(
-                        self.module7.NamesToIIDMap["IDrawingDocument"],
-                        pythoncom.IID_IDispatch,
-                    )
-                    return "Чертеж"
-                except:
-                    try:
-                        doc3d = doc._oleobj_.QueryInterface(
-                            self.module7.NamesToIIDMap["IDocument3D"],
-                            pythoncom.IID_IDispatch,
-                        )
-                        try:
-                            doc3d._oleobj_.QueryInterface(
-                                self.module7.NamesToIIDMap["IPart7"],
-                                pythoncom.IID_IDispatch,
-                            )
-                            return "Деталь (3D-модель)"
-                        except:
-                            try:
-                                doc3d._oleobj_.QueryInterface(
-                                    self.module7.NamesToIIDMap["IAssembly7"],
-                                    pythoncom.IID_IDispatch,
-                                )
-                                return "Сборка (3D-модель)"
-                            except:
-                                return "3D-модель (неизвестный тип)"
-                    except:
-                        try:
-                            doc._oleobj_.QueryInterface(
-                                self.module7.NamesToIIDMap["ISpecificationDocument"],
-                                pythoncom.IID_IDispatch,
-                            )
-                            return "Спецификация"
-                        except:
-                            return f"Другой тип ({doc_type_value})"
-        except Exception:
-            return "Неизвестный тип"
+        return self.session.document_type(doc)
 
     def periodic_update(self):
-        """Периодическое обновление информации о документах"""
+        """Резервный опрос KOMPAS на случай пропущенных событий"""
+        changed = False
         try:
             if self.is_kompas_running():
-                self.update_active_document_info()  # Обновление информации об активном документе
-                documents = self.app7.Documents
-                current_doc_count = documents.Count  # Текущее количество документов
-                if (
+                current_doc_count = self.session.document_count()
+                active_doc = self.session.active_document()
+                active_name = active_doc.Name if active_doc else None
+                changed = (
                     current_doc_count != self.last_doc_count
-                ):  # Если количество изменилось
-                    self.update_documents_tree()  # Обновляем список документов
-                    self.last_doc_count = current_doc_count  # Сохраняем новое значение
+                    or active_name != self.last_active_doc_name
+                )
+                # Без событий изредка перечитываем реестр целиком: так видны
+                # переименования и замена одного документа другим
+                if changed or self.poll_interval.full_refresh_due():
+                    self.update_documents_tree()
+                    self.last_doc_count = current_doc_count
+                if changed:
+                    self.update_active_document_info()
             else:
                 self.connect_status.setText("🔴 Нет подключения")
                 self.connect_status.setStyleSheet("color: red;")
                 self.active_doc_label.setText("Нет активного документа")
         except Exception:
             pass
+        self.timer.start(self.poll_interval.next(changed, self.isMinimized()))
+
+    def changeEvent(self, event):
+        """Возврат к частому опросу, когда окно разворачивают или активируют"""
+        if event.type() in (
+            QEvent.Type.WindowStateChange,
+            QEvent.Type.ActivationChange,
+        ) and (self.isActiveWindow() and not self.isMinimized()):
+            self.timer.start(self.poll_interval.reset())
+        super().changeEvent(event)
 
     def format_text(self, format_type):
         """Форматирование выделенного текста"""
@@ -1537,16 +2277,16 @@ class KompasApp(QMainWindow):
     def disconnect_from_kompas(self):
         """Отключение от KOMPAS-3D"""
         try:
-            if hasattr(self, "app7") and self.app7:
-                self.app7 = None
-                self.module7 = None
-                self.api7 = None
-                self.const7 = None
+            if self.session.is_connected:
+                self.document_tracker.stop()
+                self.poll_interval.events_active = False
+                self.session.disconnect()
+                self.worker.submit(disconnect_job, priority=PRIORITY_INTERACTIVE)
                 gc.collect()
                 self.connect_status.setText("🔴 Нет подключения")
                 self.connect_status.setStyleSheet("color: red;")
                 self.status_bar.showMessage("Отключено от KOMPAS-3D")
-                self.doc_tree.clear()
+                self.clear_documents_tree()
                 return True
             else:
                 self.status_bar.showMessage("Нет активного подключения к KOMPAS-3D")
@@ -1560,7 +2300,10 @@ class KompasApp(QMainWindow):
         try:
             if hasattr(self, "app7") and self.app7:
                 self.disconnect_from_kompas()
-            pythoncom.CoUninitialize()
+            self.worker.stop()
+            self.tt_index.close()
+            if self.template_store is not None:
+                self.template_store.close()
             event.accept()
         except Exception as e:
             print(f"Ошибка при закрытии приложения: {str(e)}")
@@ -1794,60 +2537,8 @@ class KompasApp(QMainWindow):
             print(f"Error toggling auto numbering: {str(e)}")
 
     def parse_tech_req(self, text_lines):
-        """Парсинг технических требований из объекта TextLines с сохранением пробелов вокруг тире"""
-        formatted_text = ""
-        count = 0
-        current_req = ""
-        current_req_num = 0
-
-        i = 0
-        while i < text_lines.Count:
-            line = text_lines.TextLines[i]
-            # Берем оригинальный текст без изменений
-            line_text = line.Str
-            if not line_text.strip():  # Пропускаем пустые строки
-                i += 1
-                continue
-
-            if line.Numbering == 1:
-                # Если начинается новый нумерованный пункт
-                if current_req:
-                    formatted_text += f"{current_req_num}. {current_req.rstrip()}\n"
-                count += 1
-                current_req_num = count
-                current_req = line_text  # Начинаем новый пункт с оригинальным текстом
-            else:
-                # Если строка является продолжением текущего пункта
-                if current_req:
-                    last_char = current_req[-1] if current_req else ""
-                    first_char = line_text[0] if line_text else ""
-                    # Проверяем, нужно ли добавить пробел
-                    if (
-                        last_char
-                        not in (" ", "-")  # Последний символ не пробел и не тире
-                        and first_char != "-"  # Новая строка не начинается с тире
-                        and not line_text.startswith(
-                            " -"
-                        )  # Новая строка не начинается с " -"
-                    ):
-                        current_req += " "
-                    # Если строка начинается с тире без пробела перед ним, добавляем пробел
-                    elif first_char == "-" and last_char != " ":
-                        current_req += " "
-                    current_req += line_text
-                else:
-                    # Если это первая строка без нумерации, начинаем новый пункт
-                    count += 1
-                    current_req_num = count
-                    current_req = line_text
-
-            # Добавляем последний пункт, если он есть
-            if i == text_lines.Count - 1 and current_req:
-                formatted_text += f"{current_req_num}. {current_req.rstrip()}\n"
-
-            i += 1
-
-        return formatted_text.rstrip()  # Убираем лишний перенос в конце
+        """Парсинг технических требований из объекта Text с сохранением пробелов вокруг тире"""
+        return format_tt_lines(read_tt_lines(text_lines)[0])
 
     def clean_tech_req_line(self, line):
         """Очистка строки технических требований от нумерации и форматирования"""
@@ -1882,7 +2573,7 @@ class KompasApp(QMainWindow):
                     return
 
             # Проверка активного документа
-            active_doc = self.app7.ActiveDocument
+            active_doc = self.session.active_document()
             if not active_doc:
                 self.set_status_message("Нет активного документа", False)
                 return
@@ -1912,7 +2603,7 @@ class KompasApp(QMainWindow):
 
             # Получение 2D интерфейса документа
             try:
-                doc_2d = win32com.client.Dispatch(active_doc, "ksDocument2D")
+                doc_2d = self.session.document_2d(active_doc)
             except Exception as e:
                 self.set_status_message("Ошибка получения интерфейса документа", False)
                 return
@@ -1943,8 +2634,15 @@ class KompasApp(QMainWindow):
         """Возврат к стандартному стилю статус-бара"""
         self.status_bar.setStyleSheet(self.default_status_style)
 
-    def save_all_drawings_to_pdf(self):
-        """Сохранение всех открытых чертежей в PDF с активацией каждого документа"""
+    def save_all_drawings_to_pdf_parallel(self):
+        """Сохранение всех чертежей в PDF пулом невидимых экземпляров KOMPAS"""
+        self.save_all_drawings_to_pdf(processes=default_pool_size())
+
+    def save_all_drawings_to_pdf(self, processes=None):
+        """Сохранение всех открытых чертежей в PDF (актуальные PDF пропускаются).
+
+        processes - число экземпляров KOMPAS для параллельного экспорта.
+        """
         try:
             if not hasattr(self, "app7") or not self.app7:
                 self.connect_to_kompas()
@@ -1954,112 +2652,68 @@ class KompasApp(QMainWindow):
                     )
                     return
 
-            documents = self.app7.Documents
-            if documents.Count == 0:
-                self.set_status_message("Нет открытых документов", False)
+            if self.batch_job_id is not None:
+                self.set_status_message("Пакетная операция уже выполняется", False)
                 return
 
-            saved_count = 0
-            drawing_count = 0
-            original_active_doc = (
-                self.app7.ActiveDocument
-            )  # Сохраняем текущий активный документ
-
-            # Сначала собираем все чертежи в список
-            drawings = []
-            for i in range(documents.Count):
-                doc = documents.Item(i)
-                if doc.DocumentType == 1:  # 1 - это тип чертежа
-                    drawings.append(doc)
-                    drawing_count += 1
-
-            if drawing_count == 0:
-                self.set_status_message("Нет открытых чертежей для сохранения", False)
+            if self.session.document_count() == 0:
+                self.set_status_message("Нет открытых документов", False)
                 return
 
-            # Перебираем чертежи и сохраняем их
-            for doc in drawings:
-                doc_path = doc.PathName
-                if not doc_path:
-                    self.set_status_message(
-                        f"Документ '{doc.Name}' не сохранен, пропускается", False
-                    )
-                    continue
-
-                # Активируем документ
-                try:
-                    doc.Active = True
-                    # Даем небольшую паузу для завершения активации
-                    QTimer.singleShot(100, lambda: None)  # Минимальная задержка
-
-                    doc_dir = os.path.dirname(doc_path)
-                    doc_name_without_ext = os.path.splitext(os.path.basename(doc_path))[
-                        0
-                    ]
-                    pdf_folder = os.path.join(doc_dir, "Чертежи в pdf")
-                    if not os.path.exists(pdf_folder):
-                        os.makedirs(pdf_folder)
-
-                    pdf_path = os.path.join(pdf_folder, f"{doc_name_without_ext}.pdf")
-
-                    # Сохранение в PDF
-                    doc_2d = win32com.client.Dispatch(doc, "ksDocument2D")
-                    result = doc_2d.SaveAs(pdf_path)
-                    if result or result is None:
-                        saved_count += 1
-                        self.set_status_message(f"Сохранен чертеж: {doc.Name}", True)
-                    else:
-                        self.set_status_message(
-                            f"Не удалось сохранить {doc.Name} в PDF", False
-                        )
-                except Exception as e:
-                    self.set_status_message(
-                        f"Ошибка сохранения {doc.Name}: {str(e)}", False
-                    )
-                    continue
-
-            # Восстанавливаем исходный активный документ
-            if original_active_doc:
-                try:
-                    original_active_doc.Active = True
-                except:
-                    pass
-
-            self.set_status_message(
-                f"Сохранено {saved_count} из {drawing_count} чертежей в PDF",
-                saved_count > 0,
+            if processes:
+                job = export_drawings_pdf_pool_job
+                job_args = (self.export_manifest_file, processes)
+                self.status_bar.showMessage(
+                    f"Запуск {processes} экземпляров KOMPAS для экспорта..."
+                )
+            else:
+                job = export_drawings_pdf_job
+                job_args = (self.export_manifest_file,)
+            self.run_batch_job(
+                "Сохранение чертежей в PDF",
+                job,
+                *job_args,
+                name="save_all_drawings_to_pdf",
+                on_result=self.on_drawings_pdf_saved,
+                on_error=self.on_save_all_drawings_failed,
             )
-
         except Exception as e:
-            error_message = self.handle_kompas_error(
-                e, "сохранения всех чертежей в PDF"
-            )
-            self.set_status_message(
-                "Критическая ошибка при сохранении всех чертежей", False
-            )
+            self.on_save_all_drawings_failed(e)
+
+    def on_drawings_pdf_saved(self, result):
+        self.finish_batch_job(cancelled=result.cancelled)
+        if result.total == 0:
+            self.set_status_message("Нет открытых чертежей для сохранения", False)
+            return
+        for name, error in result.failed:
+            print(f"Ошибка сохранения {name}: {error}")
+        rate = sheets_per_minute(result.exported, result.elapsed)
+        message = (
+            f"Сохранено {result.exported} из {result.total} чертежей в PDF, "
+            f"пропущено актуальных: {result.skipped}"
+        )
+        if result.failed:
+            message += f", ошибок: {len(result.failed)}"
+        if result.exported:
+            message += f" ({rate:.0f} листов/мин)"
+        if result.processes > 1:
+            message += f", экземпляров KOMPAS: {result.processes}"
+        if result.cancelled:
+            message = "Экспорт прерван. " + message
+        self.set_status_message(message, not result.failed and not result.cancelled)
+
+    def on_save_all_drawings_failed(self, error):
+        self.finish_batch_job(error=error)
+        self.handle_kompas_error(error, "сохранения всех чертежей в PDF")
+        self.set_status_message(
+            "Критическая ошибка при сохранении всех чертежей", False
+        )
 
     def analyze_technical_requirements(self):
         text_content = self.current_reqs_text.toPlainText().strip()
         if not text_content:
             return []
-
-        lines = [line.strip() for line in text_content.split("\n") if line.strip()]
-        categorized_tt = []
-
-        for line in lines:
-            classified = False
-            for idx, category in enumerate(TT_CATEGORIES):
-                keywords = self.classification_rules.get(category, [])
-                if keywords and any(
-                    keyword.lower() in line.lower() for keyword in keywords
-                ):
-                    categorized_tt.append((line, idx))
-                    classified = True
-                    break
-            if not classified:
-                categorized_tt.append((line, 0))  # По умолчанию в первую категорию
-
-        return categorized_tt
+        return classify_tt_lines(split_tt_text(text_content), self.tt_classifier)
 
     def check_tt_sequence(self):
         text_content = self.current_reqs_text.toPlainText().strip()
@@ -2067,78 +2721,23 @@ class KompasApp(QMainWindow):
             self.set_status_message("Технические требования пусты", False)
             return
 
-        lines = [line.strip() for line in text_content.split("\n") if line.strip()]
+        lines = split_tt_text(text_content)
         if not lines:
             self.set_status_message("Технические требования пусты", False)
             return
 
-        # Определяем категорию каждой строки
-        categorized_lines = []
-        for line in lines:
-            classified = False
-            for idx, category in enumerate(TT_CATEGORIES):
-                keywords = self.classification_rules.get(category, [])
-                if keywords and any(
-                    keyword.lower() in line.lower() for keyword in keywords
-                ):
-                    categorized_lines.append((line, idx))
-                    classified = True
-                    break
-            if not classified:
-                categorized_lines.append((line, 0))  # По умолчанию в первую категорию
-
-        # Проверяем последовательность категорий и наличие точки в конце пунктов
-        last_category_idx = -1
-        issues = []
-        for i, (line, category_idx) in enumerate(categorized_lines):
-            # Проверка последовательности категорий
-            if category_idx < last_category_idx:
-                issues.append(
-                    f"Строка {i+1}: '{line}' (категория '{TT_CATEGORIES[category_idx]}') "
-                    f"должна идти перед категорией '{TT_CATEGORIES[last_category_idx]}'"
-                )
-            last_category_idx = category_idx
-
-            # Проверка наличия точки в конце пункта
-            # Учитываем, что строка может быть подчиненной (начинается с отступа, тире или продолжающего текста)
-            clean_line = re.sub(r"^\d+\.\s*", "", line).strip()
-            is_subitem = (
-                clean_line.startswith("-")
-                or clean_line.startswith("–")
-                or (i > 0 and len(clean_line) > 0 and clean_line[0].islower())
-                or re.match(r"^\s+", line)
-            )
-            if not is_subitem and not clean_line.endswith("."):
-                issues.append(f"Строка {i+1}: '{line}' должна заканчиваться точкой")
+        # Определяем категорию каждой строки и проверяем последовательность
+        # категорий и наличие точки в конце пунктов
+        categorized_lines = classify_tt_lines(lines, self.tt_classifier)
+        issues = validate_categorized_lines(categorized_lines)
 
         if issues:
-            # Формируем правильную последовательность
-            sorted_lines = sorted(categorized_lines, key=lambda x: x[1])
-            correct_sequence = []
-            for line, _ in sorted_lines:
-                clean_line = re.sub(r"^\d+\.\s*", "", line).strip()
-                is_subitem = (
-                    clean_line.startswith("-")
-                    or clean_line.startswith("–")
-                    or (
-                        len(correct_sequence) > 0
-                        and len(clean_line) > 0
-                        and clean_line[0].islower()
-                    )
-                    or re.match(r"^\s+", line)
-                )
-                # Добавляем точку, если это не подчиненный пункт и точки нет
-                if not is_subitem and not clean_line.endswith("."):
-                    correct_line = f"{line}."
-                else:
-                    correct_line = line
-                correct_sequence.append(correct_line)
-
-            correct_text = "\n".join(correct_sequence)
+            # Правильная последовательность - по тем же правилам
+            correct_text = "\n".join(suggest_tt_lines(categorized_lines))
 
             # Создаем сообщение с правильной последовательностью
             message = "Обнаружены нарушения последовательности ТТ или формата:\n\n"
-            message += "\n".join(issues)
+            message += "\n".join(issue_messages(issues))
             message += "\n\nПравильная последовательность:\n"
             message += correct_text
 
@@ -2190,92 +2789,50 @@ class KompasApp(QMainWindow):
                     )
                     return
 
-            documents = self.app7.Documents
-            if documents.Count == 0:
+            if self.session.document_count() == 0:
                 self.set_status_message("Нет открытых документов", False)
                 return
 
-            original_active_doc = (
-                self.app7.ActiveDocument
-            )  # Сохраняем текущий активный документ
-            drawing_count = 0
-            issues_dict = {}  # Словарь для хранения проблем по документам
-
-            # Собираем все чертежи
-            for i in range(documents.Count):
-                doc = documents.Item(i)
-                if doc.DocumentType == 1:  # 1 - это тип чертежа
-                    drawing_count += 1
-                    doc.Active = True  # Активируем документ
-                    QTimer.singleShot(
-                        100, lambda: None
-                    )  # Небольшая задержка для активации
-
-                    # Получаем ТТ
-                    drawing_document = self.module7.IDrawingDocument(doc)
-                    tech_demand = drawing_document.TechnicalDemand
-                    if not tech_demand.IsCreated or tech_demand.Text.Count == 0:
-                        issues_dict[doc.Name] = [
-                            "Технические требования отсутствуют или пусты"
-                        ]
-                        continue
-
-                    text = tech_demand.Text
-                    formatted_text = self.parse_tech_req(text)
-                    self.current_reqs_text.setPlainText(
-                        formatted_text
-                    )  # Временная загрузка для проверки
-                    QTimer.singleShot(
-                        50, lambda: None
-                    )  # Небольшая задержка для обработки
-
-                    # Проверяем последовательность и формат
-                    lines = [
-                        line.strip()
-                        for line in formatted_text.split("\n")
-                        if line.strip()
-                    ]
-                    categorized_lines = self.analyze_technical_requirements()
-                    last_category_idx = -1
-                    issues = []
-
-                    for i, (line, category_idx) in enumerate(categorized_lines):
-                        # Проверка последовательности категорий
-                        if category_idx < last_category_idx:
-                            issues.append(
-                                f"Строка {i+1}: '{line}' (категория '{TT_CATEGORIES[category_idx]}') "
-                                f"должна идти перед категорией '{TT_CATEGORIES[last_category_idx]}'"
-                            )
-                        last_category_idx = category_idx
-
-                        # Проверка наличия точки в конце пункта
-                        clean_line = re.sub(r"^\d+\.\s*", "", line).strip()
-                        is_subitem = (
-                            clean_line.startswith("-")
-                            or clean_line.startswith("–")
-                            or (
-                                i > 0
-                                and len(clean_line) > 0
-                                and clean_line[0].islower()
-                            )
-                            or re.match(r"^\s+", line)
-                        )
-                        if not is_subitem and not clean_line.endswith("."):
-                            issues.append(
-                                f"Строка {i+1}: '{line}' должна заканчиваться точкой"
-                            )
+            if self.batch_job_id is not None:
+                self.set_status_message("Пакетная операция уже выполняется", False)
+                return
 
-                    if issues:
-                        issues_dict[doc.Name] = issues
+            # ТТ читаются в фоновом потоке, проверка - по готовым текстам
+            self.run_batch_job(
+                "Проверка ТТ всех чертежей",
+                check_drawings_tt_job,
+                self.tt_classifier,
+                self.tt_index,
+                name="check_all_drawings_tt",
+                on_result=self.on_drawings_tt_loaded,
+                on_error=self.on_check_all_drawings_failed,
+            )
+        except Exception as e:
+            self.on_check_all_drawings_failed(e)
 
-            # Обновляем дерево с индикаторами
-            self.update_documents_tree_with_status(issues_dict)
+    def on_drawings_tt_loaded(self, result):
+        """Вывод замечаний по ТТ чертежей, проверенных фоновым заданием"""
+        self.finish_batch_job(cancelled=result.cancelled)
+        try:
+            drawing_count = len(result.issues)
+            issues_dict = {
+                doc_name: issue_messages(issues)
+                for doc_name, issues in result.issues.items()
+                if issues
+            }
 
-            # Восстанавливаем исходный активный документ
-            if original_active_doc:
-                original_active_doc.Active = True
+            # Обновляем дерево с индикаторами; при прерванной проверке в
+            # result.issues только прочитанные чертежи
+            self.update_documents_tree_with_status(issues_dict, set(result.issues))
 
-            if issues_dict:
+            if result.cancelled:
+                # Окно не показывается: результаты - в панели пакетной операции
+                self.set_status_message(
+                    f"Проверка прервана: проверено {drawing_count} чертежей, "
+                    f"с проблемами: {len(issues_dict)}",
+                    False,
+                )
+            elif issues_dict:
                 # Формируем сообщение с результатами
                 message = "Результаты проверки ТТ:\n\n"
                 for doc_name, issues in issues_dict.items():
@@ -2289,69 +2846,98 @@ class KompasApp(QMainWindow):
                 self.set_status_message(f"Все {drawing_count} чертежей корректны", True)
 
         except Exception as e:
-            error_message = self.handle_kompas_error(e, "проверки всех чертежей")
-            self.set_status_message("Ошибка при проверке всех чертежей", False)
-            QMessageBox.critical(self, "Ошибка", error_message)
+            self.on_check_all_drawings_failed(e)
+
+    def on_check_all_drawings_failed(self, error):
+        self.finish_batch_job(error=error)
+        if isinstance(error, JobCancelled):
+            self.set_status_message("Проверка чертежей прервана", False)
+            return
+        error_message = self.handle_kompas_error(error, "проверки всех чертежей")
+        self.set_status_message("Ошибка при проверке всех чертежей", False)
+        QMessageBox.critical(self, "Ошибка", error_message)
+
+    def audit_folder_tt(self):
+        """Проверка ТТ всех чертежей папки (чертежи открываются невидимо)"""
+        if self.batch_job_id is not None:
+            self.set_status_message("Пакетная операция уже выполняется", False)
+            return
+        folder = QFileDialog.getExistingDirectory(
+            self, "Папка с чертежами для проверки ТТ"
+        )
+        if not folder:
+            return
+        self.run_batch_job(
+            f"Проверка ТТ папки: {folder}",
+            audit_folder_job,
+            folder,
+            self.tt_classifier,
+            self.tt_index,
+            name="audit_folder_tt",
+            on_result=self.on_folder_audited,
+            on_error=self.on_folder_audit_failed,
+        )
+
+    def on_folder_audited(self, result):
+        self.finish_batch_job(cancelled=result.cancelled)
+        with_issues = sum(1 for row in result.rows if row.issues)
+        message = (
+            f"Проверено чертежей: {len(result.rows)}, с замечаниями: {with_issues}"
+        )
+        if result.cached:
+            message += f", без изменений (из индекса): {result.cached}"
+        if result.cancelled:
+            message = "Проверка прервана. " + message
+        self.set_status_message(message, not with_issues and not result.cancelled)
+        if result.rows:
+            AuditReportDialog(self, result).exec()
+
+    def on_folder_audit_failed(self, error):
+        self.finish_batch_job(error=error)
+        error_message = self.handle_kompas_error(error, "проверки папки")
+        self.set_status_message("Ошибка при проверке папки", False)
+        QMessageBox.critical(self, "Ошибка", error_message)
+
+    def compact_tt_index(self):
+        """Удаление из индекса ТТ записей об исчезнувших файлах и сжатие базы"""
+        self.worker.submit(
+            compact_index_job,
+            self.tt_index,
+            name="compact_tt_index",
+            on_result=self.on_tt_index_compacted,
+            on_error=lambda e: self.set_status_message(
+                f"Ошибка сжатия индекса ТТ: {str(e)}", False
+            ),
+            on_progress=self.show_job_progress,
+        )
 
-    def update_documents_tree_with_status(self, issues_dict=None):
-        """Обновление дерева документов с индикаторами статуса"""
+    def on_tt_index_compacted(self, result):
+        removed, remaining = result
+        # Удаленные записи не видны при синхронизации - поиск строится заново
+        self.tt_search.clear()
+        self.set_status_message(
+            f"Индекс ТТ сжат: удалено записей {removed}, осталось {remaining}", True
+        )
+
+    @com_action("update_documents_tree_with_status")
+    def update_documents_tree_with_status(self, issues_dict=None, checked=None):
+        """Обновление дерева документов с индикаторами статуса.
+
+        checked - имена проверенных чертежей (None - все).
+        """
         try:
             if not hasattr(self, "app7") or not self.app7:
                 self.status_bar.showMessage("Нет подключения к KOMPAS-3D")
                 return
 
-            self.doc_tree.clear()
-            documents = self.app7.Documents
-            doc_count = 0
-            issues_dict = issues_dict or {}
-
-            for i in range(documents.Count):
-                try:
-                    doc = documents.Item(i)
-                    if doc is None:
-                        continue
-                    doc_name = doc.Name
-                    if not doc_name:
-                        continue
-
-                    doc_type = self.get_document_type(doc)
-                    doc_path = doc.Path or "Документ не сохранен"
-                    item = QTreeWidgetItem(self.doc_tree)
-
-                    # Устанавливаем индикатор статуса
-                    if doc_type == "Чертеж":
-                        if doc_name in issues_dict:
-                            item.setText(
-                                0, "🟡"
-                            )  # Желтый индикатор для проблем (индекс 0)
-                            item.setToolTip(0, "\n".join(issues_dict[doc_name]))
-                        else:
-                            item.setText(
-                                0, "🟢"
-                            )  # Зеленый индикатор для корректных ТТ (индекс 0)
-                            item.setToolTip(0, "Технические требования корректны")
-                    else:
-                        item.setText(
-                            0, "⚪"
-                        )  # Белый индикатор для нечертежей (индекс 0)
-
-                    item.setText(1, doc_name)  # Имя (индекс 1)
-                    item.setText(2, doc_type)  # Тип (индекс 2)
-                    item.setText(3, doc_path)  # Путь (индекс 3)
-
-                    if (
-                        self.app7.ActiveDocument
-                        and self.app7.ActiveDocument.Name == doc_name
-                    ):
-                        self.doc_tree.setCurrentItem(item)
-                        self.doc_tree.scrollToItem(item)
-
-                    doc_count += 1
-                except Exception as e:
-                    self.status_bar.showMessage(
-                        f"Ошибка при обработке документа: {str(e)}"
-                    )
-                    continue
+            changes = self.refresh_document_registry()
+            self.document_registry.set_statuses(issues_dict or {}, checked)
+            self.patch_documents_tree(changes)
+            for record in self.document_registry:
+                item = self.doc_tree_items[record.key]
+                item.setText(0, record.status)
+                item.setToolTip(0, record.status_tip)
+            doc_count = self.apply_documents_filter(self.doc_search_edit.text())
 
             self.status_bar.showMessage(f"Найдено документов: {doc_count}")
             self.docs_count_label.setText(f"Документов: {doc_count}")
@@ -2368,7 +2954,10 @@ class TemplateEditorDialog(QDialog):
         self.setGeometry(200, 200, 1200, 700)
         self.setMinimumSize(800, 600)
         self.templates_file = templates_file
-        self.templates = parent.templates.copy()
+        # Шаблоны не изменяются, поэтому правки в копии списков не затрагивают
+        # шаблоны окна до сохранения
+        # Редактируются только личные шаблоны, общие - в общей библиотеке
+        self.templates = copy_templates(parent.personal_templates)
         self.selected_template = None
         self.dark_mode = parent.dark_mode  # Синхронизация с родительской темой
         ThemeManager.apply_theme(self, self.dark_mode)  # Применяем тему
@@ -2505,39 +3094,22 @@ class TemplateEditorDialog(QDialog):
         self.template_tree.clear()
         for category, templates in self.templates.items():
             for template in templates:
-                if isinstance(template, dict):
-                    text = template.get("text", "")
-                    item = QTreeWidgetItem(self.template_tree)
-                    item.setText(0, category)
-                    item.setText(1, text)
-                    item.setData(0, Qt.ItemDataRole.UserRole, (category, template))
-                else:
-                    item = QTreeWidgetItem(self.template_tree)
-                    item.setText(0, category)
-                    item.setText(1, template)
-                    item.setData(
-                        0,
-                        Qt.ItemDataRole.UserRole,
-                        (category, {"text": template, "variants": []}),
-                    )
+                item = QTreeWidgetItem(self.template_tree)
+                item.setText(0, category)
+                item.setText(1, template.text)
+                item.setData(0, Qt.ItemDataRole.UserRole, (category, template))
 
     def load_template_to_editor(self, item):
         category, template = item.data(0, Qt.ItemDataRole.UserRole)
         self.selected_template = (category, template)
         self.category_combo.setCurrentText(category)
-        self.template_text.setText(template.get("text", ""))
+        self.template_text.setText(template.text)
         self.variants_table.setRowCount(0)
-        variants = template.get("variants", [])
-        for variant in variants:
+        for variant in template.variants:
             row = self.variants_table.rowCount()
             self.variants_table.insertRow(row)
-            text = variant.get("text", "") if isinstance(variant, dict) else variant
-            custom = (
-                variant.get("custom_input", False)
-                if isinstance(variant, dict)
-                else False
-            )
-            text_item = QTableWidgetItem(text)
+            custom = variant.custom_input
+            text_item = QTableWidgetItem(variant.text)
             text_item.setFlags(
                 text_item.flags() | Qt.ItemFlag.ItemIsEditable
             )  # Редактируемая
@@ -2550,8 +3122,8 @@ class TemplateEditorDialog(QDialog):
     def load_variant_details(self, item):
         """Загрузка деталей варианта в поля редактирования"""
         variant = item.data(Qt.ItemDataRole.UserRole)
-        self.variant_text.setText(variant.get("text", ""))
-        self.custom_input_check.setChecked(variant.get("custom_input", False))
+        self.variant_text.setText(variant.text)
+        self.custom_input_check.setChecked(variant.custom_input)
 
     def add_variant(self):
         """Добавление нового варианта"""
@@ -2621,12 +3193,9 @@ class TemplateEditorDialog(QDialog):
                 row, 0
             ).text()  # Исправлено: variant_text вместо text
             custom_input = self.variants_table.item(row, 1).text() == "Да"
-            variants.append({"text": variant_text, "custom_input": custom_input})
+            variants.append(Variant(variant_text, custom_input))
 
-        new_template = {
-            "text": text,
-            "variants": variants,
-        }  # Основной текст сохраняется корректно
+        new_template = Template(category, text, variants)
 
         if category not in self.templates:
             self.templates[category] = []
@@ -2653,9 +3222,9 @@ class TemplateEditorDialog(QDialog):
         for row in range(self.variants_table.rowCount()):
             text = self.variants_table.item(row, 0).text()
             custom_input = self.variants_table.item(row, 1).text() == "Да"
-            variants.append({"text": text, "custom_input": custom_input})
+            variants.append(Variant(text, custom_input))
 
-        new_template = {"text": new_text, "variants": variants}
+        new_template = Template(new_category, new_text, variants, id=old_template.id)
 
         # Удаляем старый шаблон
         self.templates[old_category].remove(old_template)
@@ -2697,11 +3266,7 @@ class TemplateEditorDialog(QDialog):
     def save_and_close(self):
         """Сохранение изменений и закрытие"""
         try:
-            with open(self.templates_file, "w", encoding="utf-8") as f:
-                json.dump(self.templates, f, ensure_ascii=False, indent=4)
-            self.parent().templates = self.templates.copy()
-            self.parent().reload_templates()
-            self.parent().status_bar.showMessage("Шаблоны сохранены")
+            self.parent().save_templates(self.templates)
             self.accept()
         except Exception as e:
             QMessageBox.critical(
@@ -2822,6 +3387,29 @@ class SettingsDialog(QDialog):
         classification_layout.addWidget(self.classification_table)
         tabs.addTab(classification_tab, "Классификация ТТ")
 
+        # Вкладка "Шаблоны": общая библиотека шаблонов
+        templates_tab = QWidget()
+        templates_layout = QVBoxLayout(templates_tab)
+        shared_group = QGroupBox("Общая библиотека шаблонов")
+        shared_layout = QVBoxLayout(shared_group)
+        shared_layout.addWidget(
+            QLabel(
+                "Папка с файлом templates.json (например, на сетевом диске).\n"
+                "Личные шаблоны показываются после общих."
+            )
+        )
+        folder_layout = QHBoxLayout()
+        self.shared_folder_edit = QLineEdit(self.parent.shared_templates_folder)
+        self.shared_folder_edit.setPlaceholderText("Не используется")
+        folder_layout.addWidget(self.shared_folder_edit)
+        browse_btn = QPushButton("Обзор...")
+        browse_btn.clicked.connect(self.browse_shared_folder)
+        folder_layout.addWidget(browse_btn)
+        shared_layout.addLayout(folder_layout)
+        templates_layout.addWidget(shared_group)
+        templates_layout.addStretch()
+        tabs.addTab(templates_tab, "Шаблоны")
+
         # Кнопки
         btn_box = QDialogButtonBox(
             QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
@@ -2838,6 +3426,13 @@ class SettingsDialog(QDialog):
                 row, 1, QTableWidgetItem(", ".join(keywords))
             )
 
+    def browse_shared_folder(self):
+        folder = QFileDialog.getExistingDirectory(
+            self, "Папка общей библиотеки шаблонов", self.shared_folder_edit.text()
+        )
+        if folder:
+            self.shared_folder_edit.setText(folder)
+
     def edit_classification_rule(self, row, column):
         if column != 1:
             return
@@ -2936,14 +3531,145 @@ class SettingsDialog(QDialog):
             self.apply_theme()
 
         self.parent.shortcuts = self.shortcuts.copy()
-        self.parent.classification_rules = (
-            self.classification_rules.copy()
-        )  # Сохраняем правила классификации
+        if self.classification_rules != self.parent.classification_rules:
+            # Сохраняем правила классификации и пересобираем автомат
+            self.parent.classification_rules = self.classification_rules.copy()
+            self.parent.tt_classifier = TTClassifier(self.classification_rules)
+            self.parent.tt_validator.set_classifier(self.parent.tt_classifier)
         self.parent.apply_shortcuts()
+        shared_folder = self.shared_folder_edit.text().strip()
+        if shared_folder != self.parent.shared_templates_folder:
+            self.parent.set_shared_library(shared_folder)
+            self.parent.reload_templates()
         self.parent.save_settings()
         self.accept()
 
 
+class TemplateChangesDialog(QDialog):
+    """Журнал изменений базы шаблонов"""
+
+    COLUMNS = ["Время", "Пользователь", "Действие", "Категория", "Шаблон"]
+
+    def __init__(self, parent, changes):
+        super().__init__(parent)
+        self.setWindowTitle("Журнал изменений шаблонов")
+        self.setMinimumSize(800, 400)
+        ThemeManager.apply_theme(self, parent.dark_mode)
+
+        layout = QVBoxLayout(self)
+        table = QTableWidget(len(changes), len(self.COLUMNS))
+        table.setHorizontalHeaderLabels(self.COLUMNS)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        table.verticalHeader().setVisible(False)
+        for row, change in enumerate(changes):
+            values = (
+                datetime.fromtimestamp(change.changed_at).strftime("%d.%m.%Y %H:%M"),
+                change.user or "",
+                CHANGE_NAMES.get(change.action, change.action),
+                change.category or "",
+                change.text or "",
+            )
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(value))
+        table.resizeColumnsToContents()
+        table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(table)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+
+class AuditReportDialog(QDialog):
+    """Отчет проверки ТТ папки: таблица с сортировкой и фильтрами"""
+
+    COLUMNS = ["Статус", "Файл", "Замечаний", "Замечания", "Папка"]
+
+    def __init__(self, parent, result):
+        super().__init__(parent)
+        self.parent = parent
+        self.result = result
+        self.setWindowTitle(f"Проверка ТТ: {result.folder}")
+        self.setMinimumSize(900, 500)
+        self.init_ui()
+        self.apply_theme()
+
+    def apply_theme(self):
+        """Применение темы для диалога"""
+        ThemeManager.apply_theme(self, self.parent.dark_mode)
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        filter_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Фильтр по имени файла или замечанию...")
+        self.search_edit.textChanged.connect(self.apply_filter)
+        filter_layout.addWidget(self.search_edit)
+        self.status_combo = QComboBox()
+        self.status_combo.addItem("Все", None)
+        for status, name in AUDIT_STATUS_NAMES.items():
+            self.status_combo.addItem(name, status)
+        self.status_combo.currentIndexChanged.connect(self.apply_filter)
+        filter_layout.addWidget(self.status_combo)
+        layout.addLayout(filter_layout)
+
+        self.table = QTableWidget(len(self.result.rows), len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        for row, audit in enumerate(self.result.rows):
+            status_item = QTableWidgetItem(AUDIT_STATUS_NAMES[audit.status])
+            status_item.setData(Qt.ItemDataRole.UserRole, audit.status)
+            self.table.setItem(row, 0, status_item)
+            self.table.setItem(row, 1, QTableWidgetItem(os.path.basename(audit.path)))
+            count_item = QTableWidgetItem()
+            count_item.setData(Qt.ItemDataRole.DisplayRole, len(audit.issues))
+            self.table.setItem(row, 2, count_item)
+            issues_item = QTableWidgetItem(audit.issues[0] if audit.issues else "")
+            issues_item.setToolTip("\n".join(audit.issues))
+            issues_item.setData(Qt.ItemDataRole.UserRole, "\n".join(audit.issues))
+            self.table.setItem(row, 3, issues_item)
+            self.table.setItem(row, 4, QTableWidgetItem(os.path.dirname(audit.path)))
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        self.table.resizeColumnsToContents()
+        self.table.setSortingEnabled(True)
+        self.table.sortItems(2, Qt.SortOrder.DescendingOrder)
+        layout.addWidget(self.table)
+
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.apply_filter()
+
+    def apply_filter(self):
+        """Скрытие строк, не подходящих под текст и статус фильтра"""
+        text = self.search_edit.text().strip().lower()
+        status = self.status_combo.currentData()
+        visible = 0
+        for row in range(self.table.rowCount()):
+            status_item = self.table.item(row, 0)
+            haystack = " ".join(
+                (
+                    self.table.item(row, 1).text(),
+                    self.table.item(row, 3).data(Qt.ItemDataRole.UserRole) or "",
+                )
+            ).lower()
+            hidden = (
+                status is not None
+                and status_item.data(Qt.ItemDataRole.UserRole) != status
+            ) or bool(text and text not in haystack)
+            self.table.setRowHidden(row, hidden)
+            visible += not hidden
+        self.count_label.setText(
+            f"Показано файлов: {visible} из {self.table.rowCount()}"
+        )
+
+
 class ThemeManager:
     DARK_THEME = """
         QMainWindow, QDialog {
@@ -3005,7 +3731,7 @@ class ThemeManager:
         QPushButton:pressed {
             background-color: #1E2527;
         }
-        QTextEdit, QTableWidget, QTreeWidget, QListWidget {
+        QTextEdit, QTableWidget, QTreeWidget, QListView {
             border: 1px solid #303940;
             border-radius: 4px;
             background-color: #2A3033;
@@ -3026,7 +3752,7 @@ class ThemeManager:
             color: #409EFF;
             background: qlineargradient(x1:0, y1:0, x2:0, y2:1, stop:0 #3A4446, stop:1 #2A3033);
         }
-        QTreeWidget::item:selected, QListWidget::item:selected, QTableWidget::item:selected {
+        QTreeWidget::item:selected, QListView::item:selected, QTableWidget::item:selected {
             background-color: #3A4446;
             color: #409EFF;
         }
@@ -3195,7 +3921,7 @@ class ThemeManager:
         QPushButton:pressed {
             background-color: #D6EBFF;
         }
-        QTextEdit, QTableWidget, QTreeWidget, QListWidget {
+        QTextEdit, QTableWidget, QTreeWidget, QListView {
             border: 1px solid #DCDFE6;
             border-radius: 4px;
             background-color: #FFFFFF;
@@ -3216,7 +3942,7 @@ class ThemeManager:
             color: #409EFF;
             background: qlineargradient(x1:0, y1:0, x2:0, y2:1, stop:0 #ECF5FF, stop:1 #FFFFFF);
         }
-        QTreeWidget::item:selected, QListWidget::item:selected, QTableWidget::item:selected {
+        QTreeWidget::item:selected, QListView::item:selected, QTableWidget::item:selected {
             background-color: #E6F7FF;
             color: #409EFF;
         }
@@ -3333,14 +4059,49 @@ class ThemeManager:
             widget.setStyleSheet(ThemeManager.LIGHT_THEME)
 
 
+def create_backend(argv):
+    """Выбор бэкенда KOMPAS: --fake-kompas N запускает окно на модели из N чертежей"""
+    if "--fake-kompas" in argv:
+        from kompas_fake import FakeBackend, build_fake_project
+
+        logging.basicConfig(level=logging.INFO)
+        index = argv.index("--fake-kompas")
+        drawings = int(argv[index + 1]) if len(argv) > index + 1 else 300
+        # --fake-folder PATH - записать чертежи на диск (нужно для экспорта
+        # пулом процессов), --fake-latency S - задержка SaveAs в секундах
+        folder = None
+        latency = 0.0
+        if "--fake-folder" in argv:
+            folder = argv[argv.index("--fake-folder") + 1]
+        if "--fake-latency" in argv:
+            latency = float(argv[argv.index("--fake-latency") + 1])
+        return FakeBackend(build_fake_project(drawings, folder=folder, latency=latency))
+    from kompas_session import ComBackend
+
+    return ComBackend()
+
+
 if __name__ == "__main__":
-    pythoncom.CoInitialize()
+    # Параллельный экспорт PDF запускает дочерние процессы (в т.ч. из exe)
+    multiprocessing.freeze_support()
+    backend = create_backend(sys.argv)
+    backend.initialize()
+    window = None
+    exit_code = 1
     try:
         app = QApplication(sys.argv)
-        window = KompasApp()
+        window = KompasApp(backend)
+        # --profile-com - замер обращений к KOMPAS с запуска
+        if "--profile-com" in sys.argv:
+            window.set_com_profiling(True)
         window.show()
-        sys.exit(app.exec())
+        exit_code = app.exec()
     except Exception as e:
         QMessageBox.critical(None, "Ошибка", f"Критическая ошибка приложения: {str(e)}")
     finally:
-        pythoncom.CoUninitialize()
+        if window is not None:
+            logger = logging.getLogger("kompas")
+            logger.info("Поток окна: %s", window.session.counter.summary())
+            logger.info("Фоновый поток: %s", window.worker.session.counter.summary())
+        backend.uninitialize()
+    sys.exit(exit_code)
@@ -0,0 +1,69 @@
+"""Общие фикстуры тестов: Qt без экрана, папка приложения во временной папке"""
+
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Сколько ждать фоновые задания и таймеры окна, с
+WAIT_TIMEOUT = 5.0
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    yield app
+
+
+@pytest.fixture
+def wait_for(qapp):
+    """wait_for(condition) - обработка событий Qt, пока condition() не станет
+    истинным или не выйдет timeout; последнее значение условия"""
+
+    def wait(condition, timeout=WAIT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            qapp.processEvents()
+            time.sleep(0.005)
+        return condition()
+
+    return wait
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """Домашняя папка (в ней ~/KOMPAS-TR приложения) - временная"""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def window(qapp, home, monkeypatch):
+    """Окно приложения на модели KOMPAS из трех чертежей.
+
+    Модальные окна сообщений не показываются (без экрана они бы ждали ответа).
+    """
+    from PyQt6.QtWidgets import QMessageBox
+
+    from kompas_fake import FakeBackend, build_fake_project
+
+    import main
+
+    for name in ("critical", "warning", "information"):
+        monkeypatch.setattr(
+            QMessageBox, name, staticmethod(lambda *args, **kwargs: None)
+        )
+    monkeypatch.setattr(
+        QMessageBox,
+        "question",
+        staticmethod(lambda *args, **kwargs: QMessageBox.StandardButton.Yes),
+    )
+
+    window = main.KompasApp(FakeBackend(build_fake_project(3)))
+    yield window
+    window.close()
@@ -0,0 +1,218 @@
+"""Буферы ТТ открытых чертежей (user-021) и запись ТТ по хешу (user-022)"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from kompas_buffers import (
+    TT_CREATED,
+    TT_LOADED,
+    TT_MISSING,
+    DocumentTT,
+    TTBufferCache,
+    buffer_key,
+    document_stamp,
+    read_document_tt,
+    write_document_tt,
+)
+from kompas_fake import FakeBackend, build_fake_project
+from kompas_session import KompasSession
+from kompas_tt import editor_text_to_lines, tt_hash, write_tt_lines
+from kompas_worker import read_active_tt_job
+
+TT = [(f"Пункт {i + 1}.", 1) for i in range(40)]
+SWITCHES = 30
+
+
+@pytest.fixture
+def session():
+    session = KompasSession(FakeBackend(build_fake_project(3, lines=TT)))
+    session.connect()
+    return session
+
+
+def switch(session, cache, name):
+    """Переключение на чертеж: ТТ из буфера или чтение через KOMPAS"""
+    doc = session.find_document(name)
+    key = buffer_key(doc.Name, doc.PathName)
+    buffer = cache.lookup(key, document_stamp(doc))
+    if buffer is None:
+        buffer = cache.store(read_document_tt(session, doc))
+    return buffer
+
+
+def test_switching_between_buffers_does_not_read_tt(session):
+    names = [doc.Name for doc in session.documents()]
+    counter = session.counter
+    counter.reset()
+    for i in range(SWITCHES):
+        read_document_tt(session, session.find_document(names[i % len(names)]))
+    read_calls = counter.total
+
+    cache = TTBufferCache()
+    for doc in session.documents():
+        cache.store(read_document_tt(session, doc))
+    counter.reset()
+    for i in range(SWITCHES):
+        assert switch(session, cache, names[i % len(names)]).state == TT_LOADED
+    # Остается сверка отметки документа
+    assert counter.total < read_calls / 5
+
+
+def test_saved_document_is_read_again(tmp_path):
+    session = KompasSession(
+        FakeBackend(build_fake_project(1, folder=str(tmp_path), lines=TT))
+    )
+    session.connect()
+    cache = TTBufferCache()
+    name = next(session.documents()).Name
+    switch(session, cache, name)
+    doc = session.find_document(name)
+    session.technical_demand(doc).Text.TextLines[0].Str = "Правка в KOMPAS."
+    doc.Save()
+
+    assert switch(session, cache, name).text.startswith("1. Правка в KOMPAS.")
+
+
+def test_edits_survive_stale_buffer():
+    cache = TTBufferCache()
+    stamp = (False, 1)
+    cache.store(DocumentTT("А.cdw", "а", stamp, TT_LOADED, "1. Сталь 45."))
+    cache.remember_edit("а", "1. Сталь 40.", 5)
+
+    buffer = cache.lookup("а", (False, 2))
+    # Правки важнее устаревших ТТ, которые перечитываются в буфер
+    assert buffer.stamp is None
+    assert buffer.display_text == "1. Сталь 40."
+    assert "а" not in cache.stamps()
+    cache.store(DocumentTT("А.cdw", "а", (False, 2), TT_LOADED, "1. Сталь 20."))
+    assert cache.lookup("а", (False, 2)).display_text == "1. Сталь 40."
+    assert cache.retain(set()) == 1
+
+
+def test_unchanged_tt_are_not_written():
+    # Строки продолжения: текст редактора отличается от строк чертежа
+    # буквально, но не по содержанию
+    lines = []
+    for i, line in enumerate(TT):
+        lines.append(line)
+        if i % 4 == 0:
+            lines.append(("по ГОСТ 2.316-2008.", 0))
+    calls = {}
+    for mode in ("written", "hashed"):
+        session = KompasSession(FakeBackend(build_fake_project(20, lines=lines)))
+        session.connect()
+        docs = list(session.documents())
+        loaded = [read_document_tt(session, doc) for doc in docs]
+        session.counter.reset()
+        for doc, document_tt in zip(docs, loaded):
+            new_lines = editor_text_to_lines(document_tt.text, False)
+            if mode == "written":
+                tech_demand = session.drawing_document(doc).TechnicalDemand
+                write_tt_lines(tech_demand.Text, new_lines)
+                read_document_tt(session, doc)
+            else:
+                result = write_document_tt(session, doc, new_lines, tt_hash(new_lines))
+                assert result == (0, False)
+                assert doc.tt_snapshot() == lines
+        calls[mode] = session.counter.total
+    assert calls["hashed"] < calls["written"] * 2 / 3
+
+
+def test_tt_edited_in_kompas_are_not_replaced(session):
+    doc = next(session.documents())
+    loaded = editor_text_to_lines(read_document_tt(session, doc).text, False)
+    session.technical_demand(doc).Text.TextLines[0].Str = "Правка в KOMPAS."
+    new_lines = [("Правка редактора.", 1)] + loaded[1:]
+
+    assert write_document_tt(session, doc, new_lines, tt_hash(loaded)) == (0, True)
+    assert doc.tt_snapshot()[0] == ("Правка в KOMPAS.", 1)
+    result = write_document_tt(session, doc, new_lines, tt_hash(loaded), force=True)
+    assert result == (1, False)
+    assert doc.tt_snapshot() == new_lines
+
+
+def test_pending_edits_keep_hash_of_their_tt(session):
+    cache = TTBufferCache()
+    doc = next(session.documents())
+    key = switch(session, cache, doc.Name).key
+    edited = "1. Правка редактора.\n" + cache.lookup(key, document_stamp(doc)).text
+    cache.remember_edit(key, edited, 0)
+    session.technical_demand(doc).Text.TextLines[0].Str = "Правка в KOMPAS."
+    doc.Changed = True
+
+    # Устаревший буфер перечитан, правки редактора остались
+    assert cache.lookup(key, document_stamp(doc)).stamp is None
+    buffer = cache.store(read_document_tt(session, doc))
+    assert buffer.dirty
+    new_lines = editor_text_to_lines(buffer.edited_text, False)
+    result = write_document_tt(session, doc, new_lines, buffer.tt_hash)
+    assert result.conflict
+    assert doc.tt_snapshot()[0] == ("Правка в KOMPAS.", 1)
+
+    # Правки отменены: сверка идет с перечитанными ТТ
+    buffer = cache.remember_edit(key, buffer.text, 0)
+    lines = editor_text_to_lines(buffer.text, False)
+    assert buffer.tt_hash == tt_hash(lines)
+
+
+def test_refresh_does_not_create_tt(session):
+    doc = session.backend.app.add_document("/fake-project/Деталь-0004.cdw")
+    doc.Active = True
+    ctx = SimpleNamespace(session=session)
+
+    assert read_active_tt_job(ctx, create=False).state == TT_MISSING
+    assert not session.technical_demand(doc).IsCreated
+    assert read_active_tt_job(ctx).state == TT_CREATED
+
+
+def test_stamp_of_changed_document_is_not_trusted():
+    cache = TTBufferCache()
+    cache.store(DocumentTT("А.cdw", "а", (True, 1), TT_LOADED, "1. Сталь 45."))
+    # Правка ТТ в KOMPAS не меняет отметку документа с Changed=True
+    assert cache.lookup("а", (True, 1)) is None
+    cache.store(DocumentTT("А.cdw", "а", (False, 1), TT_LOADED, "1. Сталь 45."))
+    assert cache.lookup("а", (False, 1)) is not None
+
+
+def test_window_keeps_unapplied_edits_per_drawing(wait_for, window):
+    editor = window.current_reqs_text
+    # Дерево документов и буферы заполняются заданиями в фоне
+    assert wait_for(lambda: len(window.tt_buffers) == 3)
+    assert wait_for(lambda: window.doc_tree.topLevelItemCount() == 3)
+    items = [window.doc_tree.topLevelItem(i) for i in range(3)]
+
+    window.on_document_double_click(items[0], 1)
+    assert wait_for(lambda: window.tt_buffer_key is not None)
+    text = editor.toPlainText()
+    editor.setPlainText(text + "\n6. Несохраненная правка.")
+    window.on_document_double_click(items[1], 1)
+    assert wait_for(lambda: "Несохраненная" not in editor.toPlainText())
+    window.on_document_double_click(items[0], 1)
+
+    assert wait_for(lambda: editor.toPlainText().endswith("правка."))
+    app = window.session.backend.app
+    # В чертеж ничего не записано
+    assert "Несохраненная" not in str(app.ActiveDocument.tt_snapshot())
+
+
+def test_window_shows_tt_edited_after_apply(wait_for, window):
+    editor = window.current_reqs_text
+    assert wait_for(lambda: len(window.tt_buffers) == 3)
+    assert wait_for(lambda: window.doc_tree.topLevelItemCount() == 3)
+    items = [window.doc_tree.topLevelItem(i) for i in range(3)]
+    window.on_document_double_click(items[0], 1)
+    assert wait_for(lambda: window.tt_buffer_key is not None)
+
+    app = window.session.backend.app
+    doc = app.ActiveDocument
+    # Чертеж изменен в KOMPAS и не сохранен
+    doc.Changed = True
+    editor.setPlainText(editor.toPlainText() + "\n6. Новый пункт.")
+    window.apply_technical_requirements()
+    window.on_document_double_click(items[1], 1)
+    assert wait_for(lambda: "Новый пункт" not in editor.toPlainText())
+    doc.drawing.TechnicalDemand.Text.TextLines[1].Str = "Правка в KOMPAS."
+    window.on_document_double_click(items[0], 1)
+
+    assert wait_for(lambda: "2. Правка в KOMPAS." in editor.toPlainText())
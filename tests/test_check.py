@@ -0,0 +1,65 @@
+"""Проверка ТТ всех чертежей фоновым заданием (user-024)"""
+
+from kompas_documents import STATUS_OK, STATUS_UNCHECKED
+from kompas_worker import JobCancelled, check_drawings_tt_job
+
+
+class Context:
+    """Контекст задания, отменяемого после cancel_after прочитанных чертежей"""
+
+    def __init__(self, session, cancel_after=None):
+        self.session = session
+        self.cancel_after = cancel_after
+        self.checkpoints = 0
+        self.reports = []
+
+    def progress(self, done, total, message=""):
+        pass
+
+    def report(self, name, status, detail=""):
+        self.reports.append((name, status))
+
+    def checkpoint(self):
+        if self.cancel_after is not None and self.checkpoints >= self.cancel_after:
+            raise JobCancelled("check_all_drawings_tt")
+        self.checkpoints += 1
+
+
+def tree_statuses(window):
+    items = [
+        window.doc_tree.topLevelItem(i)
+        for i in range(window.doc_tree.topLevelItemCount())
+    ]
+    return {item.text(1): item.text(0) for item in items}
+
+
+def check(window, cancel_after=None):
+    ctx = Context(window.session, cancel_after)
+    result = check_drawings_tt_job(ctx, window.tt_classifier, processes=1)
+    window.on_drawings_tt_loaded(result)
+    return result
+
+
+def test_cancelled_check_leaves_unchecked_drawings(wait_for, window):
+    assert wait_for(lambda: len(tree_statuses(window)) == 3)
+
+    result = check(window, cancel_after=1)
+
+    assert result.cancelled
+    assert list(result.issues) == ["Деталь-0001.cdw"]
+    assert tree_statuses(window) == {
+        "Деталь-0001.cdw": STATUS_OK,
+        "Деталь-0002.cdw": STATUS_UNCHECKED,
+        "Деталь-0003.cdw": STATUS_UNCHECKED,
+    }
+
+
+def test_cancelled_check_keeps_earlier_statuses(wait_for, window):
+    assert wait_for(lambda: len(tree_statuses(window)) == 3)
+    check(window)
+
+    result = check(window, cancel_after=0)
+
+    # Прерванная до чтения проверка не меняет статусы прошлой проверки
+    assert not result.issues
+    assert set(tree_statuses(window).values()) == {STATUS_OK}
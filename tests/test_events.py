@@ -0,0 +1,136 @@
+"""Отслеживание документов KOMPAS по событиям COM (user-003)"""
+
+import pytest
+
+from kompas_documents import DocumentRegistry
+from kompas_events import (
+    EVENT_ACTIVATED,
+    EVENT_CLOSED,
+    EVENT_OPENED,
+    EVENT_SAVED,
+    AdaptivePollInterval,
+    DocumentChangeTracker,
+)
+from kompas_fake import FakeBackend, build_fake_project
+from kompas_session import KompasSession
+
+
+@pytest.fixture
+def session():
+    session = KompasSession(FakeBackend(build_fake_project(3)))
+    session.connect()
+    return session
+
+
+@pytest.fixture
+def events():
+    """Уведомления трекера: [(событие, имя документа)]"""
+    return []
+
+
+@pytest.fixture
+def registry():
+    return DocumentRegistry()
+
+
+@pytest.fixture
+def tracker(session, events, registry):
+    tracker = DocumentChangeTracker(
+        session, lambda event, doc_name: events.append((event, doc_name))
+    )
+    assert tracker.start()
+    tracker.sync_documents(registry.refresh(session))
+    yield tracker
+    tracker.stop()
+
+
+def test_document_events_are_collected(session, tracker, events, registry):
+    app = session.backend.app
+    doc = app.add_document("/fake-project/Деталь-0004.cdw")
+    tracker.sync_documents(registry.refresh(session))
+    doc.Active = True
+    doc.Save()
+    assert tracker.take_pending() == {EVENT_OPENED, EVENT_ACTIVATED, EVENT_SAVED}
+    assert tracker.take_pending() == set()
+
+    doc.Close()
+    assert (EVENT_CLOSED, "Деталь-0004.cdw") in events
+    tracker.sync_documents(registry.refresh(session))
+    # От событий закрытого документа трекер отписан
+    events.clear()
+    doc.fire_event(EVENT_SAVED)
+    assert not events
+
+
+def test_stop_unsubscribes(session, tracker, events):
+    tracker.stop()
+    session.backend.app.add_document("/fake-project/Деталь-0005.cdw")
+    next(session.documents()).Save()
+    assert not events
+    assert not tracker.pending
+
+
+def test_without_events_polling_stays(session, monkeypatch):
+    def subscribe(obj, handler, doc_name=None):
+        raise TypeError("События не поддерживаются")
+
+    monkeypatch.setattr(session.backend, "subscribe", subscribe)
+    tracker = DocumentChangeTracker(session, lambda event, doc_name: None)
+    assert not tracker.start()
+    interval = AdaptivePollInterval()
+    interval.events_active = tracker.events_active
+    assert interval.reset() == interval.base
+
+
+def test_poll_interval_grows_while_idle():
+    interval = AdaptivePollInterval(base=1000, maximum=8000, full_refresh_every=3)
+    assert [interval.next(False) for _ in range(4)] == [2000, 4000, 8000, 8000]
+    assert interval.next(True) == 1000
+    assert interval.next(False, minimized=True) == interval.minimized
+
+    # Без событий реестр изредка перечитывается целиком
+    due = []
+    for _ in range(6):
+        interval.next(False)
+        due.append(interval.full_refresh_due())
+    assert due == [False, True, False, False, True, False]
+
+    interval.events_active = True
+    assert interval.reset() == 5000
+    assert [interval.next(False) for _ in range(4)] == [10000, 20000, 40000, 40000]
+    assert not interval.full_refresh_due()
+
+
+def tree_names(window):
+    return {
+        window.doc_tree.topLevelItem(i).text(1)
+        for i in range(window.doc_tree.topLevelItemCount())
+    }
+
+
+def test_window_follows_events_between_polls(wait_for, window):
+    assert wait_for(lambda: len(tree_names(window)) == 3)
+    # Резервный опрос не должен успеть: изменения приходят событиями
+    window.timer.stop()
+    app = window.session.backend.app
+    doc = app.add_document("/fake-project/Деталь-0004.cdw")
+    assert wait_for(lambda: "Деталь-0004.cdw" in tree_names(window))
+
+    doc.Close()
+    assert wait_for(lambda: "Деталь-0004.cdw" not in tree_names(window))
+
+
+def test_idle_poll_reads_only_count_and_active(wait_for, window):
+    assert wait_for(lambda: len(tree_names(window)) == 3)
+    window.timer.stop()
+    window.periodic_update()
+    counter = window.session.counter
+    counter.reset()
+    window.periodic_update()
+    # Реестр не перечитывается: ни одного обращения к документам по списку
+    assert {member for _, member in counter.members} == {
+        "Documents",
+        "Count",
+        "ActiveDocument",
+        "Name",
+    }
@@ -0,0 +1,141 @@
+"""Параллельный экспорт в PDF пулом экземпляров KOMPAS (user-008).
+
+Дочерние процессы получают свой фейковый KOMPAS (FakeBackend.for_process),
+который открывает "чертежи" фейка с диска.
+"""
+
+import os
+import time
+
+from kompas_batch import BATCH_FAILED, BATCH_OK, BATCH_SKIPPED
+from kompas_export import (
+    ExportItem,
+    export_drawings_pdf_job,
+    export_drawings_pdf_pool_job,
+    shard_items,
+)
+from kompas_fake import FakeBackend, build_fake_project
+from kompas_session import KompasSession
+from kompas_worker import JobCancelled
+
+# Время сохранения листа в KOMPAS, с
+LATENCY = 0.1
+DRAWINGS = 24
+
+
+class Context:
+    """Контекст задания без потока ComWorker: результаты копятся в списках"""
+
+    def __init__(self, session):
+        self.session = session
+        self.cancelled = False
+        self.reports = []
+        self.messages = []
+
+    def progress(self, done, total, message=""):
+        self.messages.append(message)
+
+    def report(self, name, status, detail=""):
+        self.reports.append((name, status))
+
+    def checkpoint(self):
+        if self.cancelled:
+            raise JobCancelled("export")
+
+
+def project(folder, drawings, latency=0.0):
+    app = build_fake_project(drawings, folder=str(folder), latency=latency)
+    session = KompasSession(FakeBackend(app))
+    session.connect()
+    return Context(session)
+
+
+def statuses(ctx):
+    return sorted(status for _, status in ctx.reports)
+
+
+def test_pool_exports_every_drawing(tmp_path):
+    ctx = project(tmp_path / "project", 6)
+    docs = list(ctx.session.documents())
+    # Несохраненные изменения есть только в KOMPAS пользователя
+    docs[0].Changed = True
+    ctx.session.backend.app.add_document("", 1)
+    manifest = str(tmp_path / "manifest.json")
+
+    result = export_drawings_pdf_pool_job(ctx, manifest, processes=2)
+
+    assert (result.total, result.exported, result.processes) == (7, 6, 2)
+    assert [name for name, _ in result.failed] == ["Без имени"]
+    assert not result.cancelled
+    assert statuses(ctx) == [BATCH_FAILED] + [BATCH_OK] * 6
+    pdf_folder = tmp_path / "project" / "Чертежи в pdf"
+    assert len(os.listdir(pdf_folder)) == 6
+
+    # Повторный запуск: актуальны все, кроме измененного в KOMPAS
+    ctx = Context(ctx.session)
+    result = export_drawings_pdf_pool_job(ctx, manifest, processes=2)
+    assert (result.exported, result.skipped) == (1, 5)
+    assert statuses(ctx).count(BATCH_SKIPPED) == 5
+
+
+def test_pool_reports_each_drawing_when_exported(tmp_path):
+    ctx = project(tmp_path / "project", 6, LATENCY)
+    pdf_folder = tmp_path / "project" / "Чертежи в pdf"
+    manifest = tmp_path / "manifest.json"
+    written = []
+    saved = []
+
+    def report(name, status, detail=""):
+        written.append(len(os.listdir(pdf_folder)))
+        saved.append(manifest.exists())
+
+    ctx.report = report
+    result = export_drawings_pdf_pool_job(ctx, str(manifest), processes=1, save_every=2)
+
+    assert result.exported == 6
+    # Чертежи учитываются до того, как процесс закончит свою часть
+    assert written[0] < 6
+    assert written == sorted(written)
+    # Журнал сохраняется по ходу экспорта
+    assert saved == [False, False, True, True, True, True]
+
+
+def test_cancelled_pool_exports_nothing(tmp_path):
+    ctx = project(tmp_path, 4)
+    next(ctx.session.documents()).Changed = True
+    ctx.cancelled = True
+    result = export_drawings_pdf_pool_job(ctx, str(tmp_path / "manifest.json"))
+    assert result.cancelled
+    assert result.exported == 0
+
+
+def test_shards_are_balanced_by_size(tmp_path):
+    items = []
+    for i, size in enumerate([90, 10, 40, 30, 30, 20]):
+        path = tmp_path / f"{i}.cdw"
+        path.write_bytes(b"x" * size)
+        items.append(ExportItem(path.name, str(path), "", False, None))
+    shards = shard_items(items, 3)
+    loads = sorted(sum(os.path.getsize(item.source) for item in s) for s in shards)
+    # Самый большой файл - отдельно, остальные делятся поровну
+    assert loads == [60, 70, 90]
+    assert sorted(item.name for s in shards for item in s) == sorted(
+        item.name for item in items
+    )
+    assert len(shard_items(items[:2], 4)) == 2
+
+
+def test_pool_is_faster_than_serial_export(tmp_path):
+    ctx = project(tmp_path / "serial", DRAWINGS, LATENCY)
+    start = time.perf_counter()
+    result = export_drawings_pdf_job(ctx, str(tmp_path / "serial.json"))
+    serial = time.perf_counter() - start
+    assert result.exported == DRAWINGS
+
+    ctx = project(tmp_path / "pool", DRAWINGS, LATENCY)
+    start = time.perf_counter()
+    result = export_drawings_pdf_pool_job(ctx, str(tmp_path / "pool.json"), 4)
+    pool = time.perf_counter() - start
+    assert result.exported == DRAWINGS
+    # С учетом запуска процессов
+    assert pool < serial
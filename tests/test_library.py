@@ -0,0 +1,141 @@
+"""Общая библиотека шаблонов в медленной и недоступной папке (user-019).
+
+Медленная сетевая папка имитируется локальной: каждое обращение
+SharedLibrary к папке библиотеки ждет LATENCY секунд.
+"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from kompas_fake import build_fake_templates
+from kompas_library import (
+    SYNC_FRESH,
+    SYNC_UNAVAILABLE,
+    SYNC_UPDATED,
+    SharedLibrary,
+    sync_in_background,
+)
+
+LATENCY = 0.75
+# Время возврата без обращений к папке (фоновый поток, локальная копия)
+NO_WAIT = LATENCY / 4
+
+
+class SlowSharedLibrary(SharedLibrary):
+    """SharedLibrary, у которой каждое обращение к папке ждет latency секунд"""
+
+    latency = LATENCY
+
+    def stat_source(self):
+        time.sleep(self.latency)
+        return super().stat_source()
+
+    def copy_source(self, target):
+        time.sleep(self.latency)
+        super().copy_source(target)
+
+
+def write_library(folder, templates):
+    with open(os.path.join(folder, "templates.json"), "w", encoding="utf-8") as f:
+        json.dump(templates, f, ensure_ascii=False, indent=4)
+
+
+def count_templates(templates):
+    return sum(len(rows) for rows in templates.values())
+
+
+@pytest.fixture
+def share(tmp_path):
+    folder = tmp_path / "share"
+    folder.mkdir()
+    write_library(folder, build_fake_templates(2000))
+    return str(folder)
+
+
+@pytest.fixture
+def library(share, tmp_path):
+    return SlowSharedLibrary(share, str(tmp_path / "cache"))
+
+
+def sync_and_wait(library):
+    results = []
+    done = threading.Event()
+
+    def callback(result):
+        results.append(result)
+        done.set()
+
+    start = time.perf_counter()
+    sync_in_background(library, callback)
+    returned = time.perf_counter() - start
+    assert done.wait(10 * LATENCY)
+    return results[0], returned
+
+
+def test_load_templates_uses_cached_copy(wait_for, window, library, share, monkeypatch):
+    import main
+
+    assert library.sync().status == SYNC_UPDATED
+    monkeypatch.setattr(main, "SharedLibrary", SlowSharedLibrary)
+    window.shared_templates_cache = library.cache_folder
+    window.set_shared_library(share)
+
+    start = time.perf_counter()
+    window.load_templates()
+    seconds = time.perf_counter() - start
+
+    # Построение списков занимает время, но ни одного обращения к папке нет
+    assert seconds < LATENCY
+    assert count_templates(window.shared_templates) == 2000
+    assert count_templates(window.templates) >= 2000
+    # Сверка с папкой идет в фоне и заканчивается без участия окна
+    assert wait_for(lambda: not window.shared_library_syncing, 10 * LATENCY)
+
+
+def test_sync_in_background_reports_updated_after_change(library, share):
+    result, returned = sync_and_wait(library)
+    assert result.status == SYNC_UPDATED
+    # Вызывающий поток не ждет папку
+    assert returned < NO_WAIT
+    assert sync_and_wait(library)[0].status == SYNC_FRESH
+
+    templates = build_fake_templates(2000)
+    templates["Общие"].append({"text": "Новый общий шаблон", "variants": []})
+    write_library(share, templates)
+    result = sync_and_wait(library)[0]
+
+    assert result.status == SYNC_UPDATED
+    assert count_templates(library.cached_templates()) == 2001
+
+
+def test_touched_library_is_fresh(library, share):
+    assert sync_and_wait(library)[0].status == SYNC_UPDATED
+    stat = os.stat(os.path.join(share, "templates.json"))
+    os.utime(
+        os.path.join(share, "templates.json"),
+        ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9),
+    )
+    assert sync_and_wait(library)[0].status == SYNC_FRESH
+
+
+def test_unreachable_folder_is_unavailable(library, share):
+    assert sync_and_wait(library)[0].status == SYNC_UPDATED
+    os.rename(share, share + "-offline")
+
+    result, returned = sync_and_wait(library)
+
+    assert result.status == SYNC_UNAVAILABLE
+    assert returned < NO_WAIT
+    # Работа продолжается на локальной копии
+    assert count_templates(library.cached_templates()) == 2000
+
+
+def test_first_start_without_copy(library):
+    start = time.perf_counter()
+    templates = library.cached_templates()
+    assert time.perf_counter() - start < NO_WAIT
+    assert templates == {}
@@ -0,0 +1,124 @@
+"""Профилирование обращений к COM (user-025)"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from kompas_fake import FakeBackend, build_fake_project
+from kompas_profiler import NO_ACTION, ComProfiler, percentile
+from kompas_session import KompasSession, unwrap
+
+DRAWINGS = 50
+ROUNDS = 5
+
+
+@pytest.fixture
+def session():
+    session = KompasSession(FakeBackend(build_fake_project(DRAWINGS)))
+    session.connect()
+    return session
+
+
+def read_all(documents, technical_demand, rounds=ROUNDS):
+    for _ in range(rounds):
+        for doc in documents:
+            text = technical_demand(doc).Text
+            for i in range(text.Count):
+                text.TextLines[i].Str
+
+
+def test_every_access_is_profiled_by_action(session):
+    docs = list(session.documents())
+    counter = session.counter
+    counter.profiler = profiler = ComProfiler()
+    counter.reset()
+    with counter.action("read_tt"):
+        read_all(docs, session.technical_demand)
+    read_all(docs[:1], session.technical_demand, 1)
+
+    rows = profiler.rows()
+    assert sum(row.count for row in rows) == counter.total
+    assert {row.action for row in rows} == {"read_tt", NO_ACTION}
+    members = {row.member for row in profiler.rows(by_action=False)}
+    assert "FakeTextLine.Str" in members
+    assert all(row.p95 <= row.max for row in rows)
+    assert [row.total for row in rows] == sorted(
+        (row.total for row in rows), reverse=True
+    )
+
+
+def test_errors_are_counted(session):
+    session.counter.profiler = profiler = ComProfiler()
+    doc = next(session.documents())
+    with pytest.raises(AttributeError):
+        session.technical_demand(doc).Text.Missing
+    assert sum(row.errors for row in profiler.rows()) == 1
+
+
+def test_actions_do_not_mix_between_threads():
+    profiler = ComProfiler()
+    started = threading.Event()
+    finished = threading.Event()
+
+    def worker():
+        profiler.begin_action("prefetch_tt_buffers")
+        started.set()
+        finished.wait(1)
+        profiler.add("get", "Text.Count", 0.0, 0.001)
+        profiler.end_action("prefetch_tt_buffers", 0.0)
+
+    thread = threading.Thread(target=worker, name="ComWorker")
+    thread.start()
+    started.wait(1)
+    profiler.add("get", "Documents.Count", 0.0, 0.001)
+    finished.set()
+    thread.join()
+
+    actions = {row.member: row.action for row in profiler.rows()}
+    assert actions == {
+        "Documents.Count": NO_ACTION,
+        "Text.Count": "prefetch_tt_buffers",
+    }
+    trace = profiler.chrome_trace()["traceEvents"]
+    names = {event["args"]["name"] for event in trace if event["ph"] == "M"}
+    assert "ComWorker" in names
+    assert all(event["dur"] >= 0 for event in trace if event["ph"] == "X")
+    json.dumps(profiler.to_dict())
+
+
+def test_percentile():
+    values = sorted(range(1, 101))
+    assert percentile(values, 0.95) == 95
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.95) == 0.0
+
+
+def best_seconds(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def test_profiling_cost(session):
+    docs = list(session.documents())
+    raw_docs = [unwrap(doc) for doc in docs]
+    raw_demands = {
+        id(raw): unwrap(session.technical_demand(doc))
+        for raw, doc in zip(raw_docs, docs)
+    }
+    counter = session.counter
+
+    raw = best_seconds(lambda: read_all(raw_docs, lambda doc: raw_demands[id(doc)]))
+    disabled = best_seconds(lambda: read_all(docs, session.technical_demand))
+    counter.profiler = ComProfiler()
+    enabled = best_seconds(lambda: read_all(docs, session.technical_demand))
+
+    assert raw < disabled
+    # С профилировщиком обращение дороже не более чем в несколько раз
+    assert enabled < 5 * disabled
@@ -0,0 +1,108 @@
+"""Операции KOMPAS по готовности вместо фиксированных пауз (user-023)"""
+
+import os
+import time
+
+import pytest
+
+from kompas_export import collect_drawings, save_pdf
+from kompas_fake import FakeBackend, build_fake_project
+from kompas_ready import (
+    RPC_E_CALL_REJECTED,
+    NotReady,
+    ReadinessScheduler,
+    call_when_ready,
+    wait_until,
+)
+from kompas_session import KompasSession
+
+DRAWINGS = 20
+# SaveAs фейка возвращается раньше, чем PDF появляется на диске
+WRITE_DELAY = 0.02
+# Прежняя пауза после активации чертежа перед SaveAs
+ACTIVATION_DELAY = 0.1
+
+
+class ComError(Exception):
+    """Как pywintypes.com_error: (hresult, текст, сведения, аргумент)"""
+
+
+def test_save_pdf_waits_for_written_file(tmp_path):
+    app = build_fake_project(DRAWINGS, folder=str(tmp_path))
+    app.write_delay = WRITE_DELAY
+    session = KompasSession(FakeBackend(app))
+    session.connect()
+    items = collect_drawings(session)[0]
+
+    start = time.perf_counter()
+    for item in items:
+        save_pdf(session, item.document, item.pdf)
+        assert os.path.getsize(item.pdf) > 0
+    # Быстрее фиксированных пауз, но не раньше записи каждого PDF
+    assert time.perf_counter() - start < DRAWINGS * ACTIVATION_DELAY
+
+
+def test_busy_call_is_repeated():
+    calls = []
+
+    def save():
+        calls.append(time.monotonic())
+        if len(calls) < 4:
+            raise ComError(RPC_E_CALL_REJECTED, "Вызов отклонен", None, None)
+        return True
+
+    assert call_when_ready(save, timeout=1.0)
+    intervals = [b - a for a, b in zip(calls, calls[1:])]
+    assert intervals == sorted(intervals)
+
+
+def test_other_errors_are_not_repeated():
+    calls = []
+
+    def save():
+        calls.append(True)
+        raise ComError(-2147352567, "Ошибка", None, None)
+
+    with pytest.raises(ComError):
+        call_when_ready(save, timeout=1.0)
+    assert len(calls) == 1
+
+
+def test_wait_until_times_out():
+    start = time.monotonic()
+    with pytest.raises(NotReady, match="Деталь.pdf"):
+        wait_until(lambda: False, 0.1, "Деталь.pdf")
+    assert time.monotonic() - start < 0.5
+
+
+def test_scheduler_runs_action_when_ready(wait_for):
+    scheduler = ReadinessScheduler()
+    ready_at = time.monotonic() + 0.05
+    done = []
+    scheduler.when(lambda: time.monotonic() >= ready_at, lambda: done.append("a"))
+    assert not done
+    assert wait_for(lambda: done == ["a"])
+    assert not scheduler.pending
+
+
+def test_scheduler_replaces_operation_with_same_name(wait_for):
+    scheduler = ReadinessScheduler()
+    flags = {"first": False, "second": False}
+    done = []
+    timeouts = []
+    for name in ("first", "second"):
+        scheduler.when(
+            lambda name=name: flags[name],
+            lambda name=name: done.append(name),
+            timeout=0.2,
+            on_timeout=lambda: timeouts.append(True),
+            name="load_tt",
+        )
+    flags["first"] = flags["second"] = True
+    assert wait_for(lambda: done)
+    assert done == ["second"]
+
+    scheduler.when(
+        lambda: False, done.append, timeout=0.05, on_timeout=lambda: timeouts.append(1)
+    )
+    assert wait_for(lambda: timeouts == [1])
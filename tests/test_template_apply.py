@@ -0,0 +1,97 @@
+"""Применение правок templates.json по отличиям (user-020)"""
+
+import json
+import os
+import time
+
+import pytest
+from PyQt6.QtCore import QPersistentModelIndex
+
+from kompas_fake import build_fake_templates
+from kompas_templates import TemplateListModel, templates_from_json
+
+TEMPLATES = 20000
+
+
+def edit_library(data):
+    """Измененный вариант одного шаблона и один новый шаблон"""
+    data["Общие"][0]["variants"] = [{"text": " новый вариант", "custom_input": False}]
+    data["Сварка"].insert(0, {"text": "Новый шаблон", "variants": []})
+    return data
+
+
+def texts(model):
+    return [
+        (template.text, [variant.text for variant in template.variants])
+        for template in model.rows
+    ]
+
+
+def test_apply_changes_only_different_rows(qapp):
+    data = build_fake_templates(TEMPLATES)
+    model = TemplateListModel()
+    model.set_templates(templates_from_json(data))
+    changed = templates_from_json(edit_library(data))
+    resets = []
+    model.modelReset.connect(lambda: resets.append(True))
+
+    start = time.perf_counter()
+    reloaded = TemplateListModel()
+    reloaded.set_templates(changed)
+    reload_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    assert model.apply_templates(changed) == (1, 0, 1)
+    apply_seconds = time.perf_counter() - start
+
+    assert not resets
+    assert apply_seconds < reload_seconds / 2
+    assert texts(model) == texts(reloaded)
+    assert model.rows[model.search("новый шаблон")[0]].text == "Новый шаблон"
+    assert model.rows[model.search("новый вариант")[0]] is changed["Общие"][0]
+
+
+def replace_file(path, data):
+    """Запись другой программой: временный файл и переименование"""
+    with open(path + ".new", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + ".new", path)
+
+
+@pytest.fixture
+def library(window):
+    data = build_fake_templates(2000)
+    replace_file(window.templates_file, data)
+    window.load_templates()
+    return data
+
+
+def test_external_edit_keeps_selection(wait_for, window, library):
+    model = window.template_model
+    selected = window.templates["Сварка"][3]
+    # Выделение в списках держится на постоянных индексах модели
+    current = QPersistentModelIndex(model.index(model.rows.index(selected)))
+    resets = []
+    model.modelReset.connect(lambda: resets.append(True))
+
+    library["Общие"].insert(0, {"text": "Внешний шаблон", "variants": []})
+    del library["Покрытия"][5]
+    replace_file(window.templates_file, library)
+
+    assert wait_for(lambda: model.rows[0].text == "Внешний шаблон")
+    assert not resets
+    assert current.isValid()
+    assert model.rows[current.row()].text == selected.text
+    # Файл, замененный переименованием, снова под наблюдением
+    assert window.templates_watcher.files() == [window.templates_file]
+
+    library["Общие"][0]["text"] = "Внешний шаблон изменен"
+    replace_file(window.templates_file, library)
+    assert wait_for(lambda: model.rows[0].text == "Внешний шаблон изменен")
+
+
+def test_broken_file_leaves_templates(wait_for, window, library):
+    rows = list(window.template_model.rows)
+    with open(window.templates_file, "w", encoding="utf-8") as f:
+        f.write("{broken")
+    assert wait_for(lambda: "не прочитан" in window.status_bar.currentMessage())
+    assert window.template_model.rows == rows
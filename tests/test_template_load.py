@@ -0,0 +1,80 @@
+"""Загрузка библиотеки шаблонов по частям (user-017)"""
+
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from kompas_fake import build_fake_templates
+from kompas_templates import (
+    load_templates_file,
+    read_templates,
+    templates_from_json,
+    templates_to_json,
+)
+
+TEMPLATES = 10000
+
+
+@pytest.fixture(scope="module")
+def library_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("library") / "templates.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(build_fake_templates(TEMPLATES), f, ensure_ascii=False, indent=4)
+    return str(path)
+
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return templates_from_json(json.load(f))
+
+
+def peak_memory(load, path):
+    """Пик выделений Python при загрузке по tracemalloc"""
+    tracemalloc.start()
+    try:
+        library = load(path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del library
+    return peak
+
+
+def test_read_templates_matches_json_load(library_path):
+    assert templates_to_json(load_templates_file(library_path)) == templates_to_json(
+        load_json(library_path)
+    )
+
+
+def test_read_templates_peak_memory_is_lower(library_path):
+    # Разобранный целиком JSON больше не лежит в памяти рядом с шаблонами
+    assert peak_memory(load_templates_file, library_path) < 0.75 * peak_memory(
+        load_json, library_path
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_records_split_between_chunks(chunk_size):
+    data = {
+        "Общие": [
+            "Сталь 45 ГОСТ 1050-2013.",
+            {"text": "HRC 40...45.", "variants": [" ({} мм)", {"text": " ТВЧ"}]},
+            {"text": "Допуск 0.0125 мм.", "variants": []},
+        ],
+        "Пустая": [],
+        "Сварка": [{"text": 'Швы по ГОСТ 5264-80 \\"é".', "variants": []}],
+    }
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    templates = read_templates(io.StringIO(text), chunk_size)
+    assert templates_to_json(templates) == templates_to_json(templates_from_json(data))
+    assert templates["Общие"][1].variants[0].fill("5") == " (5 мм)"
+
+
+@pytest.mark.parametrize(
+    "text", ['{"Общие": ["Сталь" "45"]}', '{"Общие": [', '["Общие"]', "{1: []}"]
+)
+def test_broken_file_is_value_error(text):
+    with pytest.raises(ValueError, match="Неверный формат файла шаблонов"):
+        read_templates(io.StringIO(text), 4)
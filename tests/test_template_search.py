@@ -0,0 +1,115 @@
+"""Нечеткий поиск шаблонов по индексу триграмм (user-016)"""
+
+import time
+
+import pytest
+
+from kompas_fake import build_fake_templates
+from kompas_search import normalize_tt_text
+from kompas_templates import (
+    TEMPLATE_SEARCH_LIMIT,
+    Template,
+    TemplateListModel,
+    copy_templates,
+    templates_from_json,
+)
+
+# Бюджет запроса на библиотеке из 20 тыс. шаблонов
+QUERY_BUDGET_MS = 5.0
+QUERIES = [
+    "поверхности шероховатость",
+    "шероховатость поверхностей",
+    "шераховатость",
+    "гост 9.306",
+    "покритие",
+    "hrc",
+    "ц",
+    "о",
+    "ер",
+    "9.",
+    "отклонения размеров отверстий валов",
+]
+
+
+@pytest.fixture(scope="module")
+def library():
+    return templates_from_json(build_fake_templates(20000))
+
+
+@pytest.fixture(scope="module")
+def model(library):
+    model = TemplateListModel()
+    model.set_templates(library)
+    return model
+
+
+def best_ms(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_query_fits_budget(model, query):
+    assert model.search(query)
+    assert best_ms(lambda: model.search(query)) < QUERY_BUDGET_MS
+
+
+@pytest.mark.parametrize("query", ["ц", "ер", "9."])
+def test_first_short_query_fits_budget(library, query):
+    # Маски пар букв строятся при первом запросе
+    model = TemplateListModel()
+    model.set_templates(library)
+    start = time.perf_counter()
+    model.search(query)
+    assert (time.perf_counter() - start) * 1000 < QUERY_BUDGET_MS
+
+
+def test_results_are_limited(model):
+    assert len(model.search("сталь")) == TEMPLATE_SEARCH_LIMIT
+
+
+def test_word_order_and_typos():
+    model = TemplateListModel()
+    model.set_templates(
+        templates_from_json(
+            {
+                "Общие": [
+                    "Неуказанная шероховатость поверхностей Ra 6,3.",
+                    "Покрытие: Хим. Окс. прм.",
+                    "Сталь 45 ГОСТ 1050-2013.",
+                ]
+            }
+        )
+    )
+    for query, expected in (
+        ("поверхности шероховатость", "Неуказанная"),
+        ("шераховатость", "Неуказанная"),
+        ("покритие", "Покрытие"),
+    ):
+        assert model.rows[model.search(query)[0]].text.startswith(expected)
+
+
+@pytest.mark.parametrize("query", ["ц", "ер", "9.", "30", "ю"])
+def test_short_query_finds_every_substring(query):
+    templates = copy_templates(templates_from_json(build_fake_templates(3000)))
+    model = TemplateListModel()
+    model.set_templates(templates)
+    # Маски коротких запросов ведутся и при правке модели по отличиям
+    model.search(query)
+    templates["Общие"].insert(3, Template("Общие", "Цинкование 30-ер, юстировка."))
+    del templates["Сварка"][:5]
+    model.apply_templates(templates)
+
+    found = set(model.search(query, limit=len(model.rows)))
+    normalized = normalize_tt_text(query)
+    expected = {
+        row
+        for row, template in enumerate(model.rows)
+        if normalized in template.search_key
+    }
+    assert expected <= found
@@ -0,0 +1,144 @@
+"""База шаблонов SQLite: построчное сохранение и поиск (user-018).
+
+Два пользователя - два TemplateStore над одним файлом: каждый правит свой
+снимок, открытый в редакторе, и сохраняет его через save_changes.
+"""
+
+import json
+import time
+
+import pytest
+
+from kompas_fake import build_fake_templates
+from kompas_template_store import CHANGE_ADD, CHANGE_DELETE, TemplateStore
+from kompas_templates import (
+    Template,
+    TemplateListModel,
+    copy_templates,
+    templates_from_json,
+)
+
+
+def texts(templates):
+    return {
+        category: [template.text for template in items]
+        for category, items in templates.items()
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "templates.sqlite3")
+    store = TemplateStore(path)
+    store.import_templates(
+        templates_from_json(
+            {"Общие": ["Сталь 45.", "HRC 40.", "Размеры для справок."], "Сварка": []}
+        )
+    )
+    store.close()
+    return path
+
+
+@pytest.fixture
+def stores(path):
+    first, second = TemplateStore(path), TemplateStore(path)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_category_added_by_another_user_is_kept(stores):
+    first, second = stores
+    first_snapshot = first.load()
+    second_snapshot = second.load()
+
+    edited = copy_templates(second_snapshot)
+    edited["Покрытия"] = [Template("Покрытия", "Хим. Окс. прм.")]
+    second.save_changes(second_snapshot, edited)
+
+    edited = copy_templates(first_snapshot)
+    del edited["Сварка"]
+    edited["Маркировка"] = []
+    first.save_changes(first_snapshot, edited)
+
+    assert list(first.load()) == ["Общие", "Покрытия", "Маркировка"]
+
+
+def test_edit_of_template_deleted_by_another_user_is_reinserted(stores):
+    first, second = stores
+    first_snapshot = first.load()
+    second_snapshot = second.load()
+
+    edited = copy_templates(second_snapshot)
+    del edited["Общие"][1]
+    second.save_changes(second_snapshot, edited)
+
+    edited = copy_templates(first_snapshot)
+    edited["Общие"][1] = Template("Общие", "HRC 45.", id=edited["Общие"][1].id)
+    assert first.save_changes(first_snapshot, edited) == (1, 0, 0)
+
+    # Порядок после одновременных правок не определен, важен состав
+    assert sorted(texts(first.load())["Общие"]) == [
+        "HRC 45.",
+        "Размеры для справок.",
+        "Сталь 45.",
+    ]
+    assert first.changes()[0].action == CHANGE_ADD
+
+
+def test_moved_template_deleted_by_another_user_stays_deleted(stores):
+    first, second = stores
+    first_snapshot = first.load()
+    second_snapshot = second.load()
+
+    edited = copy_templates(second_snapshot)
+    del edited["Общие"][2]
+    second.save_changes(second_snapshot, edited)
+
+    # Удаление первого шаблона сдвигает остальные без правки
+    edited = copy_templates(first_snapshot)
+    del edited["Общие"][0]
+    assert first.save_changes(first_snapshot, edited) == (0, 0, 1)
+
+    assert texts(first.load())["Общие"] == ["HRC 40."]
+
+
+def test_template_deleted_twice_is_logged_once(stores):
+    first, second = stores
+    first_snapshot = first.load()
+    second_snapshot = second.load()
+    for store, snapshot in ((second, second_snapshot), (first, first_snapshot)):
+        edited = copy_templates(snapshot)
+        del edited["Общие"][0]
+        store.save_changes(snapshot, edited)
+
+    deletes = [change for change in first.changes() if change.action == CHANGE_DELETE]
+    assert len(deletes) == 1
+
+
+def test_store_opens_and_searches_faster_than_json(tmp_path):
+    """Замер user-018 на 50 тыс. шаблонов: первый поиск по базе не требует
+    разбора всей библиотеки"""
+    query = "шероховатость поверхностей"
+    json_path = tmp_path / "templates.json"
+    json_path.write_text(
+        json.dumps(build_fake_templates(50000), ensure_ascii=False), encoding="utf-8"
+    )
+
+    start = time.perf_counter()
+    model = TemplateListModel()
+    model.set_templates(templates_from_json(json.loads(json_path.read_text("utf-8"))))
+    json_found = len(model.search(query))
+    json_seconds = time.perf_counter() - start
+
+    store = TemplateStore(str(tmp_path / "templates.sqlite3"))
+    store.import_json(str(json_path))
+    store.close()
+    start = time.perf_counter()
+    store = TemplateStore(str(tmp_path / "templates.sqlite3"))
+    store_found = len(store.search(query))
+    store_seconds = time.perf_counter() - start
+    store.close()
+
+    assert json_found and store_found
+    assert store_seconds < json_seconds / 10
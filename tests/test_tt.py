@@ -0,0 +1,88 @@
+"""Запись ТТ по разнице (user-005)"""
+
+import pytest
+
+from kompas_fake import FakeText
+from kompas_session import ComCallCounter, wrap
+from kompas_tt import rewrite_tt_lines, write_tt_lines
+
+BLOCK = [(f"Пункт {i}.", 1 if i % 3 else 0) for i in range(40)]
+
+
+class IndexedTextLine:
+    """Строка, привязанная к номеру, а не к себе (как ITextLine в части
+    версий KOMPAS): после удаления строки выше объект указывает на соседнюю"""
+
+    def __init__(self, text, index):
+        self._text = text
+        self._index = index
+
+    @property
+    def _line(self):
+        return self._text._lines[self._index]
+
+    @property
+    def Str(self):
+        return self._line.Str
+
+    @Str.setter
+    def Str(self, value):
+        self._line.Str = value
+
+    @property
+    def Numbering(self):
+        return self._line.Numbering
+
+    @Numbering.setter
+    def Numbering(self, value):
+        self._line.Numbering = value
+
+    def Delete(self):
+        del self._text._lines[self._index]
+        return True
+
+
+class IndexedText(FakeText):
+    @property
+    def TextLines(self):
+        return [IndexedTextLine(self, i) for i in range(self.Count)]
+
+
+def write(before, after, text_class=FakeText, writer=write_tt_lines):
+    """(текст после записи, обращений к COM)"""
+    text = text_class(before)
+    counter = ComCallCounter()
+    writer(wrap(text, counter), list(after))
+    return text.snapshot(), counter.total
+
+
+@pytest.mark.parametrize(
+    "after",
+    [
+        BLOCK,
+        BLOCK[:10] + [("Новый текст.", 1)] + BLOCK[11:],
+        BLOCK[:10] + [(BLOCK[10][0], 1 - BLOCK[10][1])] + BLOCK[11:],
+    ],
+    ids=["identical", "one_line", "numbering"],
+)
+def test_diff_write_costs_less_than_rewrite(after):
+    rewritten, rewrite_calls = write(BLOCK, after, writer=rewrite_tt_lines)
+    written, diff_calls = write(BLOCK, after)
+    assert rewritten == written == after
+    # Остается в основном чтение текущих строк
+    assert diff_calls < rewrite_calls / 2
+
+
+@pytest.mark.parametrize("text_class", [FakeText, IndexedText])
+@pytest.mark.parametrize(
+    "after",
+    [
+        BLOCK[:5] + BLOCK[6:20] + [("Правка.", 1)] + BLOCK[21:],
+        BLOCK[1:3] + [("Правка.", 0)] + BLOCK[4:30:2] + [("Конец.", 1)],
+        [("Единственная.", 1)],
+        [],
+    ],
+    ids=["delete_then_edit", "mixed", "shrink", "clear"],
+)
+def test_edits_after_delete_hit_the_right_line(text_class, after):
+    assert write(BLOCK, after, text_class)[0] == after
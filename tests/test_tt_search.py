@@ -0,0 +1,108 @@
+"""Поиск по ТТ всех проиндексированных чертежей (user-011)"""
+
+import re
+import time
+
+import pytest
+
+from kompas_fake import build_fake_tt_corpus
+from kompas_search import (
+    SEARCH_PREFIX,
+    SEARCH_REGEX,
+    SEARCH_SUBSTRING,
+    TTSearchIndex,
+    normalize_tt_text,
+)
+
+DRAWINGS = 10000
+# Построение индекса по проекту и запрос с выборочным результатом
+BUILD_BUDGET = 3.0
+SELECTIVE_BUDGET_MS = 10.0
+QUERIES = [
+    (SEARCH_SUBSTRING, "HRC 40...45"),
+    (SEARCH_SUBSTRING, "гост 2.304"),
+    (SEARCH_SUBSTRING, "мм"),
+    (SEARCH_PREFIX, "сварн гост"),
+    (SEARCH_PREFIX, "ту-12"),
+    (SEARCH_REGEX, r"hrc (4\d)\.\.\.\1"),
+]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return build_fake_tt_corpus(DRAWINGS)
+
+
+@pytest.fixture(scope="module")
+def index(corpus):
+    index = TTSearchIndex()
+    for path, lines in corpus.items():
+        index.update_document(path, lines)
+    return index
+
+
+def matches(mode, query, text):
+    """Совпадение строки перебором, без индекса"""
+    normalized = normalize_tt_text(text)
+    if mode == SEARCH_REGEX:
+        return re.search(query, normalized, re.IGNORECASE) is not None
+    if mode == SEARCH_PREFIX:
+        words = re.findall(r"\w+", normalized)
+        return all(
+            any(word.startswith(prefix) for word in words)
+            for prefix in re.findall(r"\w+", normalize_tt_text(query))
+        )
+    return normalize_tt_text(query) in normalized
+
+
+def test_build_fits_budget(corpus):
+    start = time.perf_counter()
+    index = TTSearchIndex()
+    for path, lines in corpus.items():
+        index.update_document(path, lines)
+    assert time.perf_counter() - start < BUILD_BUDGET
+    assert len(index) == DRAWINGS
+
+
+@pytest.mark.parametrize("mode, query", QUERIES)
+def test_search_finds_every_line(index, corpus, mode, query):
+    expected = {
+        (path, line_no)
+        for path, lines in corpus.items()
+        for line_no, (text, _) in enumerate(lines, 1)
+        if matches(mode, query, text)
+    }
+    hits = index.search(query, mode, limit=DRAWINGS * 20)
+    assert expected
+    assert {(hit.path, hit.line) for hit in hits} == expected
+
+
+@pytest.mark.parametrize(
+    "mode, query",
+    [(SEARCH_SUBSTRING, "деталь 1234 изгот"), (SEARCH_PREFIX, "ту-12")],
+)
+def test_selective_query_fits_budget(index, mode, query):
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        assert index.search(query, mode)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    assert best < SELECTIVE_BUDGET_MS
+
+
+def test_refreshes_of_changed_drawing_reuse_slots():
+    index = TTSearchIndex()
+    index.update_document("Деталь-1.cdw", [("Сталь 45.", 1)])
+    slots = len(index._lines)
+    for i in range(1000):
+        index.update_document(
+            "Деталь-2.cdw", [(f"Правка {i}.", 1), (f"HRC {i}...{i + 5}.", 1)]
+        )
+    # Строки прошлых правок освобождены, их номера заняли новые
+    assert len(index._lines) <= slots + 4
+    assert index.line_count == 3
+    assert [hit.line for hit in index.search("правка 999")] == [1]
+    assert not index.search("правка 998")
+    assert not index.search("hrc 998", SEARCH_PREFIX)
+    assert index.search("сталь")[0].path == "Деталь-1.cdw"